@@ -1,13 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import StreamingResponse
 from typing import Optional
+from sqlalchemy import select
 import json
+import logging
 import os
 
-from app.utils.ollama import ollama_stream, OllamaError
+from app.db.database import AsyncSessionLocal
+from app.utils.admission import chat_scheduler, AdmissionRejected
+from app.utils.ollama import is_known_model, ollama_stream, OllamaError
+from app.utils.write_behind import write_behind
 from app.schemas.chat import ChatBody
-from app.utils.auth import get_current_active_user
-from app.models.models import User
+from app.utils.auth import get_current_active_user, user_from_token
+from app.models.models import User, ChatSession, Message
+
+# Configure logging
+logger = logging.getLogger(__name__)
 
 # Default values
 DEFAULT_SYSTEM_PROMPT = "You are an AI assistant that follows instructions. Help the user with their tasks."
@@ -16,11 +24,93 @@ DEFAULT_TEMPERATURE = 1.0
 # Create router
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
+def _persist_on_complete(session_id: int, prompt: str):
+    """Queue the user prompt and the (possibly partial) assistant reply once the stream ends"""
+    def on_complete(reply: str, aborted: bool):
+        write_behind.submit(Message, {
+            "session_id": session_id,
+            "sender": "user",
+            "content": prompt,
+            "message_type": "text",
+            "sources": None
+        })
+        if reply:
+            write_behind.submit(Message, {
+                "session_id": session_id,
+                "sender": "assistant",
+                "content": reply,
+                "message_type": "partial" if aborted else "text",
+                "sources": None
+            })
+    return on_complete
+
+def _session_history(session_id: int):
+    """Loader for the turns saved so far in a session, used when no model context can be reused"""
+    async def load_history():
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Message.sender, Message.content)
+                .where(Message.session_id == session_id)
+                .order_by(Message.created_at, Message.id)
+            )
+            return [
+                {"role": "assistant" if sender == "assistant" else "user", "content": content}
+                for sender, content in result.all()
+            ]
+    return load_history
+
+async def _client_key(request: Request) -> str:
+    """
+    Who a request is queued as: the user of a valid bearer token, else the
+    client address. Unverified tokens are not trusted, or a client could get
+    a fresh lane per request by sending made-up ones.
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        async with AsyncSessionLocal() as db:
+            user = await user_from_token(db, authorization[7:].strip())
+        if user is not None:
+            return f"user:{user.id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def _ollama_error(e: OllamaError):
+    suggestion = "Try removing the OLLAMA_HOST environment variable or setting it to http://127.0.0.1:11434" if "OLLAMA_HOST" in str(e) else "Check if Ollama is running and accessible"
+    return {
+        "error": "Ollama Error",
+        "message": str(e),
+        "suggestion": suggestion
+    }
+
 @router.post("")
-async def chat(body: ChatBody):
+async def chat(body: ChatBody, request: Request):
     """
     Handle chat requests and stream responses from Ollama
     """
+    if body.keep_context and body.session_id is None:
+        raise HTTPException(status_code=400, detail="keep_context requires a session_id")
+    
+    on_complete = None
+    if body.session_id is not None:
+        async with AsyncSessionLocal() as db:
+            if await db.get(ChatSession, body.session_id) is None:
+                raise HTTPException(status_code=404, detail="Chat session not found")
+        on_complete = _persist_on_complete(body.session_id, body.prompt)
+    
+    # The model name becomes a scheduler lane and a metrics label, so only models that exist get that far
+    try:
+        known = await is_known_model(body.model)
+    except OllamaError as e:
+        return _ollama_error(e)
+    if not known:
+        raise HTTPException(status_code=404, detail=f"Model {body.model} not found")
+    
+    ticket = None
+    if chat_scheduler.enabled:
+        try:
+            ticket = await chat_scheduler.acquire(body.model, await _client_key(request))
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.message, headers={"Retry-After": str(e.retry_after)})
+    
     try:
         # Set default system prompt if not provided
         prompt_to_send = body.system if body.system else DEFAULT_SYSTEM_PROMPT
@@ -29,18 +119,29 @@ async def chat(body: ChatBody):
         temperature_to_use = body.options.temperature if body.options and body.options.temperature is not None else DEFAULT_TEMPERATURE
         
         # Get stream response from Ollama
-        stream = await ollama_stream(body.model, prompt_to_send, temperature_to_use, body.prompt)
+        stream = await ollama_stream(
+            body.model,
+            prompt_to_send,
+            temperature_to_use,
+            body.prompt,
+            on_complete=on_complete,
+            session_id=body.session_id if body.keep_context else None,
+            load_history=_session_history(body.session_id) if body.keep_context else None,
+            release=ticket.release if ticket else None,
+            sse="text/event-stream" in request.headers.get("accept", "")
+        )
+        if ticket is not None:
+            stream.headers["X-Queue-Position"] = str(ticket.position)
+            stream.headers["X-Queue-Wait-Ms"] = str(round(ticket.waited * 1000))
         
         return stream
     except OllamaError as e:
-        # Handle Ollama errors
-        suggestion = "Try removing the OLLAMA_HOST environment variable or setting it to http://127.0.0.1:11434" if "OLLAMA_HOST" in str(e) else "Check if Ollama is running and accessible"
-        return {
-            "error": "Ollama Error",
-            "message": str(e),
-            "suggestion": suggestion
-        }
+        if ticket is not None:
+            ticket.release()
+        return _ollama_error(e)
     except Exception as e:
+        if ticket is not None:
+            ticket.release()
         # Handle other errors
         return {
             "error": "Internal Server Error",
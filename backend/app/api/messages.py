@@ -1,45 +1,96 @@
 from fastapi import APIRouter, HTTPException, Depends, Path, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import any_, func, insert, literal_column, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
 from datetime import datetime
+import base64
+import html
 
-from app.db.database import get_db
-from app.models.models import Message, ChatSession
-from app.schemas.message import MessageCreate, Message as MessageSchema, MessageResponse, SessionMessagesResponse
+import orjson
+
+from app.db.database import get_async_db, AsyncSessionLocal
+from app.models.models import Message, ChatSession, User, MESSAGE_SEARCH_CONFIG
+from app.schemas.message import MessageCreate, Message as MessageSchema, MessageResponse, SessionMessagesResponse, MessageBatchCreate, MessageBatchResponse, MessageSearchResponse
 from app.schemas.feedback import FeedbackCreate, FeedbackResponse
 from app.models.models import Feedback
+from app.utils.auth import get_current_active_user
+from app.utils.write_behind import write_behind
+
+# Pagination settings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+# Search settings
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_QUERY_LENGTH = 256
+# ts_headline options; the markers are replaced by <mark> tags after the excerpt is escaped
+_HIGHLIGHT_START, _HIGHLIGHT_STOP = "\x02", "\x03"
+SEARCH_HEADLINE_OPTIONS = f"StartSel={_HIGHLIGHT_START}, StopSel={_HIGHLIGHT_STOP}, MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=\" … \""
+
+# Columns of MessageResponse; read histories select these instead of loading Message entities
+MESSAGE_COLUMNS = (Message.id, Message.content, Message.sender, Message.created_at, Message.message_type, Message.sources)
 
 # Create router
 router = APIRouter(prefix="/api/messages", tags=["messages"])
 
+def _encode_cursor(created_at: datetime, message_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _encode_search_cursor(rank: float, message_id: int) -> str:
+    raw = f"{rank!r}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, message_id = raw.rsplit("|", 1)
+        return float(rank), int(message_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _highlight(headline: str) -> str:
+    escaped = html.escape(headline, quote=False)
+    return escaped.replace(_HIGHLIGHT_START, "<mark>").replace(_HIGHLIGHT_STOP, "</mark>")
+
 @router.post("/save", response_model=MessageResponse)
-async def save_message(message: MessageCreate, db: Session = Depends(get_db)):
+async def save_message(message: MessageCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Save a message to the database
     """
     # Check if the chat session exists
-    session = db.query(ChatSession).filter(ChatSession.id == message.session_id).first()
+    session = await db.get(ChatSession, message.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found")
     
-    # Create new message
-    db_message = Message(
-        session_id=message.session_id,
-        sender=message.sender,
-        content=message.content,
-        message_type=message.message_type,
-        sources=message.sources
-    )
+    # Hand the connection back before waiting, the flush needs one from the same pool
+    await db.close()
     
-    # Add to database
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    # Queue the insert; it is coalesced with concurrent writes and acknowledged once committed
+    values = {
+        "session_id": message.session_id,
+        "sender": message.sender,
+        "content": message.content,
+        "message_type": message.message_type,
+        "sources": message.sources
+    }
+    saved = await write_behind.enqueue(Message, values, durable=True)
     
-    return db_message
+    return {**values, **saved}
 
 @router.post("/save-response", response_model=MessageResponse)
-async def save_response(message: MessageCreate, db: Session = Depends(get_db)):
+async def save_response(message: MessageCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Save an assistant response to the database
     """
@@ -48,79 +99,266 @@ async def save_response(message: MessageCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Invalid sender, must be 'assistant'")
     
     # Check if the chat session exists
-    session = db.query(ChatSession).filter(ChatSession.id == message.session_id).first()
+    session = await db.get(ChatSession, message.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found")
     
-    # Create new message
-    db_message = Message(
-        session_id=message.session_id,
-        sender=message.sender,
-        content=message.content,
-        message_type=message.message_type,
-        sources=message.sources
-    )
+    # Hand the connection back before waiting, the flush needs one from the same pool
+    await db.close()
     
-    # Add to database
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    # Queue the insert; it is coalesced with concurrent writes and acknowledged once committed
+    values = {
+        "session_id": message.session_id,
+        "sender": message.sender,
+        "content": message.content,
+        "message_type": message.message_type,
+        "sources": message.sources
+    }
+    saved = await write_behind.enqueue(Message, values, durable=True)
     
-    return db_message
+    return {**values, **saved}
 
-@router.get("/get-session/{session_id}", response_model=SessionMessagesResponse)
+@router.post("/save-batch", response_model=MessageBatchResponse)
+async def save_message_batch(batch: MessageBatchCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Save many messages, possibly across sessions, in a single transaction
+    """
+    # Check all referenced chat sessions with one query
+    session_ids = {message.session_id for message in batch.messages}
+    result = await db.execute(select(ChatSession.id).where(ChatSession.id.in_(session_ids)))
+    missing = session_ids - set(result.scalars().all())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Chat session not found: {', '.join(map(str, sorted(missing)))}")
+    
+    # Multi-row INSERT ... RETURNING, rows come back in input order
+    result = await db.execute(
+        insert(Message).returning(Message.id, Message.session_id, Message.created_at, sort_by_parameter_order=True),
+        [
+            {
+                "session_id": message.session_id,
+                "sender": message.sender,
+                "content": message.content,
+                "message_type": message.message_type,
+                "sources": message.sources
+            }
+            for message in batch.messages
+        ]
+    )
+    saved = result.all()
+    await db.commit()
+    
+    return {
+        "saved": len(saved),
+        "messages": [{"id": row.id, "session_id": row.session_id, "created_at": row.created_at} for row in saved]
+    }
+
+async def _session_exists(db: AsyncSession, session_id: int) -> bool:
+    result = await db.execute(select(ChatSession.id).where(ChatSession.id == session_id))
+    return result.scalar() is not None
+
+@router.get("/get-session/{session_id}", response_model=SessionMessagesResponse, response_class=ORJSONResponse)
 async def get_session_messages(
     session_id: int = Path(...),
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = Query(None, description="Cursor: return messages older than this one"),
+    after: Optional[str] = Query(None, description="Cursor: return messages newer than this one"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all messages for a session
+    Get the messages of a session in chronological order.
+    
+    Without `limit` or a cursor every message is returned. Otherwise a page of
+    at most `limit` messages is returned, paginated on (created_at, id).
+    
+    Rows are selected as plain columns and serialized with orjson, skipping
+    ORM hydration and per-message validation through MessageResponse.
     """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    
     # Check if the chat session exists
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-    if not session:
+    if not await _session_exists(db, session_id):
         raise HTTPException(status_code=404, detail="Chat session not found")
     
-    # Get all messages for the session
-    messages = db.query(Message).filter(Message.session_id == session_id).order_by(Message.created_at).all()
+    query = select(*MESSAGE_COLUMNS).where(Message.session_id == session_id)
+    key = tuple_(Message.created_at, Message.id)
+    
+    if limit is None and not before and not after:
+        # Get all messages for the session
+        result = await db.execute(query.order_by(Message.created_at, Message.id))
+        return ORJSONResponse({
+            "session_id": session_id,
+            "messages": [row._asdict() for row in result],
+            "next_cursor": None,
+            "prev_cursor": None
+        })
+    
+    limit = limit or DEFAULT_PAGE_SIZE
+    if before:
+        # Walk backwards from the cursor, then restore chronological order
+        query = query.where(key < tuple_(*_decode_cursor(before)))
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        if after:
+            query = query.where(key > tuple_(*_decode_cursor(after)))
+        query = query.order_by(Message.created_at, Message.id)
+    
+    # Fetch one extra row to know whether another page exists
+    result = await db.execute(query.limit(limit + 1))
+    messages = result.all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if before:
+        messages.reverse()
     
-    return {"session_id": session_id, "messages": messages}
+    next_cursor = prev_cursor = None
+    if messages:
+        first, last = messages[0], messages[-1]
+        if (has_more and not before) or before:
+            next_cursor = _encode_cursor(last.created_at, last.id)
+        if (has_more and before) or after:
+            prev_cursor = _encode_cursor(first.created_at, first.id)
+    
+    return ORJSONResponse({
+        "session_id": session_id,
+        "messages": [row._asdict() for row in messages],
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    })
+
+@router.get("/get-session/{session_id}/stream")
+async def stream_session_messages(
+    session_id: int = Path(...)
+):
+    """
+    Stream the full history of a session as NDJSON, one message per line.
+    
+    Rows are read through a server-side cursor in batches, so memory stays
+    constant regardless of the session length.
+    """
+    # No get_async_db: its session is only closed after the whole body is sent,
+    # so it would hold a second connection for as long as the stream runs
+    stream_db = AsyncSessionLocal()
+    try:
+        # Check if the chat session exists
+        exists = await _session_exists(stream_db, session_id)
+    finally:
+        # Hand the connection back until the body is read; nothing is held if it never is
+        await stream_db.close()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    
+    query = (
+        select(*MESSAGE_COLUMNS)
+        .where(Message.session_id == session_id)
+        .order_by(Message.created_at, Message.id)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    
+    async def generate():
+        async with stream_db:
+            result = await stream_db.stream(query)
+            async for rows in result.partitions():
+                yield b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@router.get("/search", response_model=MessageSearchResponse, response_class=ORJSONResponse)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=SEARCH_MAX_QUERY_LENGTH, description="Web search syntax: words, \"a phrase\", or, -word"),
+    session_id: Optional[int] = Query(None, description="Only search this session"),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Cursor: return the hits ranked after this one"),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Full-text search over the messages of the current user's sessions.
+    
+    Hits are ordered by ts_rank_cd, best first, and paginated on (rank, id).
+    Only the returned page gets a highlighted excerpt.
+    """
+    config = literal_column(f"'{MESSAGE_SEARCH_CONFIG}'::regconfig")
+    tsquery = func.websearch_to_tsquery(config, q)
+    rank = func.ts_rank_cd(Message.content_tsv, tsquery).label("rank")
+    
+    # The caller's session ids as one array: a join would repeat the GIN index scan for every session
+    owned = func.array(select(ChatSession.id).where(ChatSession.user_id == current_user.id).scalar_subquery())
+    query = (
+        select(Message.id, Message.session_id, Message.sender, Message.created_at, Message.message_type, rank)
+        .where(Message.session_id == any_(owned), Message.content_tsv.op("@@")(tsquery))
+    )
+    if session_id is not None:
+        query = query.where(Message.session_id == session_id)
+    if cursor:
+        query = query.where(tuple_(rank, Message.id) < tuple_(*_decode_search_cursor(cursor)))
+    
+    # A generic plan of the prepared statement cannot tell a rare word from one in most messages,
+    # plan for the actual search terms instead
+    await db.execute(text("SET LOCAL plan_cache_mode = force_custom_plan"))
+    
+    # Fetch one extra row to know whether another page exists
+    page = query.order_by(rank.desc(), Message.id.desc()).limit(limit + 1).subquery()
+    result = await db.execute(
+        select(page, func.ts_headline(config, Message.content, tsquery, SEARCH_HEADLINE_OPTIONS).label("headline"))
+        .join(Message, Message.id == page.c.id)
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    )
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    hits = [
+        {
+            "id": row.id,
+            "session_id": row.session_id,
+            "sender": row.sender,
+            "created_at": row.created_at,
+            "message_type": row.message_type,
+            "rank": row.rank,
+            "highlight": _highlight(row.headline)
+        }
+        for row in rows
+    ]
+    next_cursor = _encode_search_cursor(rows[-1].rank, rows[-1].id) if has_more else None
+    
+    return ORJSONResponse({"query": q, "hits": hits, "next_cursor": next_cursor})
 
 @router.post("/save-feedback", response_model=FeedbackResponse)
-async def save_feedback(feedback: FeedbackCreate, db: Session = Depends(get_db)):
+async def save_feedback(feedback: FeedbackCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Save feedback for a message
     """
     # Check if the message exists
-    message = db.query(Message).filter(Message.id == feedback.message_id).first()
+    message = await db.get(Message, feedback.message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    # Create new feedback
-    db_feedback = Feedback(
-        message_id=feedback.message_id,
-        user_id=feedback.user_id,
-        rating=feedback.rating,
-        comment=feedback.comment
-    )
+    # Hand the connection back before waiting, the flush needs one from the same pool
+    await db.close()
     
-    # Add to database
-    db.add(db_feedback)
-    db.commit()
-    db.refresh(db_feedback)
+    # Queue the insert; it is coalesced with concurrent writes and acknowledged once committed
+    values = {
+        "message_id": feedback.message_id,
+        "user_id": feedback.user_id,
+        "rating": feedback.rating,
+        "comment": feedback.comment
+    }
+    saved = await write_behind.enqueue(Feedback, values, durable=True)
     
-    return db_feedback
+    return {**values, **saved}
 
 @router.get("/get-feedback/{message_id}", response_model=FeedbackResponse)
 async def get_feedback(
     message_id: int = Path(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get feedback for a message
     """
     # Get feedback for the message
-    feedback = db.query(Feedback).filter(Feedback.message_id == message_id).first()
+    result = await db.execute(select(Feedback).where(Feedback.message_id == message_id))
+    feedback = result.scalars().first()
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback not found")
     
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+
+from app.utils.metrics import render_metrics
+
+# Create router
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus scrape endpoint
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from app.db.database import get_async_db
+from app.models.models import RetrievalLog
+from app.schemas.retrieval import RetrieveRequest, RetrieveResponse
+from app.utils.ollama import get_embeddings, OllamaError
+from app.utils.retrieval import search_sections
+from app.utils.write_behind import write_behind
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Create router
+router = APIRouter(prefix="/api/retrieve", tags=["retrieval"])
+
+@router.post("", response_model=RetrieveResponse)
+async def retrieve(body: RetrieveRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Return the document sections closest to the query
+    """
+    try:
+        embedding = (await get_embeddings([body.query]))[0]
+    except OllamaError as e:
+        logger.error(f"Embedding the query failed: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Could not embed the query: {str(e)}")
+    
+    results = await search_sections(db, embedding, body.top_k, status=body.status, tags=body.tags)
+    
+    # Logged through the write-behind queue, off the response path
+    write_behind.submit(RetrievalLog, {
+        "session_id": body.session_id,
+        "user_question": body.query,
+        "retrieved_section_ids": [section["id"] for section in results]
+    })
+    
+    return {"query": body.query, "results": results}
@@ -0,0 +1,98 @@
+from fastapi import APIRouter
+from typing import Dict, Any
+
+from app.utils.admission import chat_scheduler
+from app.utils.embedding_cache import embedding_cache
+from app.utils.http_client import upstream_clients
+from app.utils.auth import password_hash_pool, principal_cache
+from app.utils.ollama import backend_pool, model_cache, session_contexts, upstream_flights
+from app.utils.response_cache import response_cache
+from app.utils.vector_index import vector_index
+from app.utils.write_behind import write_behind
+
+# Create router
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+@router.get("/upstream", response_model=Dict[str, Any])
+async def get_upstream_stats():
+    """
+    Get connection pool statistics for the Ollama / LMStudio clients
+    """
+    return upstream_clients.snapshot()
+
+@router.get("/password-hashing", response_model=Dict[str, Any])
+async def get_password_hashing_stats():
+    """
+    Get queue statistics for the bcrypt worker pool
+    """
+    return password_hash_pool.stats()
+
+@router.get("/auth-cache", response_model=Dict[str, Any])
+async def get_auth_cache_stats():
+    """
+    Get hit-rate counters for the authenticated-principal cache
+    """
+    return principal_cache.stats()
+
+@router.get("/backends", response_model=Dict[str, Any])
+async def get_backend_stats():
+    """
+    Get load, loaded models and health of every Ollama backend
+    """
+    return backend_pool.stats()
+
+@router.get("/chat-scheduler", response_model=Dict[str, Any])
+async def get_chat_scheduler_stats():
+    """
+    Get slot usage, queue depth and wait times of the /api/chat scheduler
+    """
+    return chat_scheduler.stats()
+
+@router.get("/embedding-cache", response_model=Dict[str, Any])
+async def get_embedding_cache_stats():
+    """
+    Get hit ratio and upstream calls saved by the embedding cache
+    """
+    return embedding_cache.stats()
+
+@router.get("/model-cache", response_model=Dict[str, Any])
+async def get_model_cache_stats():
+    """
+    Get counters for the model list / model details cache
+    """
+    return model_cache.stats()
+
+@router.get("/session-context", response_model=Dict[str, Any])
+async def get_session_context_stats():
+    """
+    Get hit rate and size of the per-session Ollama context store
+    """
+    return session_contexts.stats()
+
+@router.get("/response-cache", response_model=Dict[str, Any])
+async def get_response_cache_stats():
+    """
+    Get hit, miss and byte counters of the response cache
+    """
+    return response_cache.stats()
+
+@router.get("/single-flight", response_model=Dict[str, Any])
+async def get_single_flight_stats():
+    """
+    Get calls and deduplicated calls of the coalesced upstream requests
+    """
+    return {name: flight.stats() for name, flight in upstream_flights.items()}
+
+@router.get("/vector-index", response_model=Dict[str, Any])
+async def get_vector_index_stats():
+    """
+    Get size and query latency of the in-process vector index
+    """
+    return vector_index.stats()
+
+@router.get("/write-behind", response_model=Dict[str, Any])
+async def get_write_behind_stats():
+    """
+    Get queue depth and flush latency of the write-behind queue
+    """
+    return write_behind.stats()
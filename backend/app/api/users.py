@@ -1,13 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends, Path, Body
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import timedelta
 
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.models.models import User, ChatSession
 from app.schemas.user import UserCreate, User as UserSchema, UserLogin, Token, UserUpdate
-from app.utils.auth import authenticate_user, create_access_token, get_password_hash, get_current_active_user
+from app.utils.auth import authenticate_user, create_access_token, get_password_hash_async, get_current_active_user, principal_cache
 
 # Constants
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
@@ -16,23 +18,25 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 @router.post("/register", response_model=UserSchema)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Register a new user
     """
     # Check if username already exists
-    db_user = db.query(User).filter(User.username == user.username).first()
+    result = await db.execute(select(User).where(User.username == user.username))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Check if email already exists if provided
     if user.email:
-        db_email = db.query(User).filter(User.email == user.email).first()
+        result = await db.execute(select(User).where(User.email == user.email))
+        db_email = result.scalars().first()
         if db_email:
             raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -42,19 +46,19 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     
     # Add to database
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     # Remove password from response
     user_response = UserSchema.from_orm(db_user)
     return user_response
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Get access token for user login
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -81,46 +85,56 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 async def update_user(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update current user information
     """
+    # The authenticated user may be a cached snapshot, load it into this session
+    current_user = await db.get(User, current_user.id)
+    if current_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
     # Update user fields
     if user_update.username is not None:
         # Check if username already exists
-        db_user = db.query(User).filter(User.username == user_update.username).first()
+        result = await db.execute(select(User).where(User.username == user_update.username))
+        db_user = result.scalars().first()
         if db_user and db_user.id != current_user.id:
             raise HTTPException(status_code=400, detail="Username already registered")
         current_user.username = user_update.username
     
     if user_update.email is not None:
         # Check if email already exists
-        db_user = db.query(User).filter(User.email == user_update.email).first()
+        result = await db.execute(select(User).where(User.email == user_update.email))
+        db_user = result.scalars().first()
         if db_user and db_user.id != current_user.id:
             raise HTTPException(status_code=400, detail="Email already registered")
         current_user.email = user_update.email
     
     if user_update.password is not None:
-        current_user.password_hash = get_password_hash(user_update.password)
+        current_user.password_hash = await get_password_hash_async(user_update.password)
     
     # Only admin can change role
     if user_update.role is not None and current_user.role == "admin":
         current_user.role = user_update.role
     
     # Update in database
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    
+    # Cached principals for this user carry the old name, password hash and role
+    principal_cache.invalidate_user(current_user.id)
     
     return current_user
 
-@router.get("/sessions", response_model=List[int])
+@router.get("/sessions", response_model=List[int], response_class=ORJSONResponse)
 async def get_user_sessions(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all session IDs for the current user
     """
-    sessions = db.query(ChatSession.id).filter(ChatSession.user_id == current_user.id).all()
-    return [session.id for session in sessions] 
\ No newline at end of file
+    result = await db.execute(select(ChatSession.id).where(ChatSession.user_id == current_user.id))
+    return ORJSONResponse(result.scalars().all()) 
\ No newline at end of file
@@ -1 +1 @@
-from app.db.database import Base, engine, get_db, validate_db_config 
\ No newline at end of file
+from app.db.database import Base, engine, async_engine, get_db, get_async_db, AsyncSessionLocal, validate_db_config
\ No newline at end of file
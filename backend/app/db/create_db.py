@@ -5,12 +5,18 @@ import os
 import logging
 
 from app.db.database import Base, engine, validate_db_config
-from app.models.models import User, ChatSession, Message, Feedback, BusinessDocument, DocumentSection, RetrievalLog
+from app.models.models import User, ChatSession, Message, Feedback, BusinessDocument, DocumentSection, RetrievalLog, MESSAGE_SEARCH_CONFIG
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ANN index over document_sections.embedding
+VECTOR_INDEX_NAME = "ix_document_sections_embedding_ann"
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))  # Only used when HNSW is not available
+
 # Special handling for PostgreSQL vector extension
 @compiles(CreateTable, "postgresql")
 def compile_create_table(create, compiler, **kw):
@@ -21,6 +27,29 @@ def compile_create_table(create, compiler, **kw):
         sql = sql.replace("embedding VECTOR(768)", "embedding TEXT")
     return sql
 
+def create_vector_index(conn):
+    """
+    Build the ANN index used by /api/retrieve for cosine search over section
+    embeddings. HNSW needs pgvector 0.5+, older versions get IVFFlat instead.
+    """
+    try:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {VECTOR_INDEX_NAME} ON document_sections "
+            f"USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});"
+        ))
+        conn.commit()
+        logger.info("HNSW index on document_sections.embedding is in place")
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"HNSW index not available ({e}), falling back to IVFFlat")
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {VECTOR_INDEX_NAME} ON document_sections "
+            f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {IVFFLAT_LISTS});"
+        ))
+        conn.commit()
+        logger.info("IVFFlat index on document_sections.embedding is in place")
+
 def create_tables():
     """Create all database tables if they don't exist"""
     # Validate database configuration
@@ -49,7 +78,7 @@ def create_tables():
                 logger.info("Attempted to create vector extension")
     except Exception as e:
         logger.error(f"Error creating vector extension: {e}")
-        logger.warning("Continuing without vector extension. Vector search functionality will not work.")
+        logger.warning("Continuing without vector extension. Retrieval falls back to the in-process vector index.")
     
     # Create all tables
     try:
@@ -57,6 +86,21 @@ def create_tables():
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully")
         
+        # create_all does not add columns to existing tables
+        with engine.connect() as conn:
+            conn.execute(text("ALTER TABLE document_sections ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);"))
+            # Rewrites the messages table once to fill the column for existing rows
+            conn.execute(text(
+                "ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector GENERATED ALWAYS AS "
+                f"(to_tsvector('{MESSAGE_SEARCH_CONFIG}'::regconfig, content)) STORED;"
+            ))
+            conn.commit()
+        
+        # create_all skips indexes of tables that already exist, add any new ones
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        
         # Try to alter the document_sections table to use vector type if needed
         try:
             with engine.connect() as conn:
@@ -70,11 +114,17 @@ def create_tables():
                 if column_type and column_type.upper() == 'TEXT':
                     logger.info("Converting embedding column from TEXT to VECTOR type")
                     # Alter the column to use vector type
-                    conn.execute(text("ALTER TABLE document_sections ALTER COLUMN embedding TYPE vector(768);"))
+                    conn.execute(text(
+                        "ALTER TABLE document_sections ALTER COLUMN embedding "
+                        "TYPE vector(768) USING embedding::vector(768);"
+                    ))
                     conn.commit()
                     logger.info("Column type altered successfully")
                 else:
                     logger.info("Embedding column already has correct type or doesn't exist")
+                
+                if column_type:
+                    create_vector_index(conn)
         except Exception as e:
             logger.error(f"Error altering embedding column type: {e}")
             logger.warning("Vector operations may not work correctly")
@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -13,15 +14,27 @@ DB_PASSWORD = os.getenv("PG_PASSWORD", "lap20040106")
 DB_HOST = os.getenv("PG_HOST", "localhost")
 DB_PORT = os.getenv("PG_PORT", "5432")
 DB_NAME = os.getenv("PG_DATABASE", "chatbot_ollama")
+DB_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "20"))
 
-# Create SQLAlchemy database URL
+# Create SQLAlchemy database URLs
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# Create SQLAlchemy engine
+# Create SQLAlchemy engine (used by scripts such as create_db)
 engine = create_engine(DATABASE_URL)
 
-# Create SessionLocal class
+# Create async engine used by the API routes so queries don't block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True
+)
+
+# Create SessionLocal classes
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Create Base class for models
 Base = declarative_base()
@@ -34,6 +47,11 @@ def get_db():
     finally:
         db.close()
 
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Function to validate DB config
 def validate_db_config():
     """Validates the database configuration and warns about missing env variables"""
@@ -1,16 +1,45 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+from app.db.database import engine, async_engine
+from app.utils.http_client import upstream_clients
+from app.utils.auth import password_hash_pool
+from app.utils.ollama import model_cache, backend_pool
+from app.utils.write_behind import write_behind
+from app.utils.vector_index import vector_index
+from app.utils.retrieval import in_process_index_used
+from app.utils.metrics import instrument_engine
+
+# Statement latency for /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Upstream clients are created lazily on first use and shared by all requests
+    backend_pool.start()
+    vector_index.start(in_process_index_used)
+    yield
+    await backend_pool.aclose()
+    await vector_index.aclose()
+    await write_behind.aclose()
+    await model_cache.aclose()
+    await upstream_clients.aclose()
+    await async_engine.dispose()
+    password_hash_pool.shutdown()
+
 # Create FastAPI app
 app = FastAPI(
     title="Chatbot-Ollama API",
     description="FastAPI backend for Chatbot-Ollama",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -27,11 +56,17 @@ from app.api.chat import router as chat_router
 from app.api.messages import router as messages_router
 from app.api.models import router as models_router
 from app.api.users import router as users_router
+from app.api.stats import router as stats_router
+from app.api.retrieve import router as retrieve_router
+from app.api.metrics import router as metrics_router
 
 app.include_router(chat_router)
 app.include_router(messages_router)
 app.include_router(models_router)
 app.include_router(users_router)
+app.include_router(stats_router)
+app.include_router(retrieve_router)
+app.include_router(metrics_router)
 
 @app.get("/")
 async def root():
@@ -1 +1 @@
-from app.models.models import User, ChatSession, Message, Feedback, BusinessDocument, DocumentSection, RetrievalLog 
\ No newline at end of file
+from app.models.models import User, ChatSession, Message, Feedback, BusinessDocument, DocumentSection, RetrievalLog, EmbeddingCacheEntry 
\ No newline at end of file
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, ARRAY, func, CheckConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, ARRAY, LargeBinary, func, CheckConstraint, Index, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.ext.declarative import declared_attr
 import pgvector.sqlalchemy
 
 from app.db.database import Base
 
+# Text search configuration of messages.content_tsv; search queries must be parsed with the same one
+MESSAGE_SEARCH_CONFIG = "english"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -23,7 +27,7 @@ class ChatSession(Base):
     __tablename__ = "chat_sessions"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
     session_title = Column(String(255))
     started_at = Column(DateTime, default=func.now())
     ended_at = Column(DateTime, nullable=True)
@@ -44,6 +48,15 @@ class Message(Base):
     created_at = Column(DateTime, default=func.now())
     message_type = Column(String(50), default="text")
     sources = Column(JSON, nullable=True)
+    # Maintained by PostgreSQL on every insert and update, never loaded with the entity
+    content_tsv = deferred(Column(TSVECTOR, Computed(f"to_tsvector('{MESSAGE_SEARCH_CONFIG}'::regconfig, content)", persisted=True)))
+    
+    # Keyset pagination of a session's history walks (created_at, id)
+    __table_args__ = (
+        Index("ix_messages_session_created_id", "session_id", "created_at", "id"),
+        # Full-text search of /api/messages/search
+        Index("ix_messages_content_tsv", "content_tsv", postgresql_using="gin"),
+    )
     
     # Relationships
     session = relationship("ChatSession", back_populates="messages")
@@ -89,11 +102,27 @@ class DocumentSection(Base):
     section_title = Column(String(255), nullable=True)
     content = Column(Text, nullable=False)
     embedding = Column(pgvector.sqlalchemy.Vector(768), nullable=True)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of title and content, set by app.utils.ingestion
     created_at = Column(DateTime, default=func.now())
     
+    # Ingestion upserts on (document_id, content_hash) so unchanged sections keep their embedding
+    __table_args__ = (
+        Index("ux_document_sections_document_hash", "document_id", "content_hash", unique=True),
+    )
+    
     # Relationships
     document = relationship("BusinessDocument", back_populates="sections")
 
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+    
+    # Keyed by embedding model and SHA-256 of the normalized text, see app.utils.embedding_cache
+    model = Column(String(255), primary_key=True)
+    text_hash = Column(String(64), primary_key=True)
+    dtype = Column(String(10), nullable=False)  # float32 / float16
+    vector = Column(LargeBinary, nullable=False)  # packed little-endian values
+    created_at = Column(DateTime, default=func.now())
+
 class RetrievalLog(Base):
     __tablename__ = "retrieval_logs"
     
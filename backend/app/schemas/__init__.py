@@ -1,4 +1,5 @@
 from app.schemas.user import *
 from app.schemas.chat import *
 from app.schemas.message import *
-from app.schemas.feedback import * 
\ No newline at end of file
+from app.schemas.feedback import * 
+from app.schemas.retrieval import *
\ No newline at end of file
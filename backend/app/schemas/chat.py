@@ -10,6 +10,8 @@ class ChatBody(BaseModel):
     system: Optional[str] = None
     options: Optional[ChatOptions] = None
     prompt: str
+    session_id: Optional[int] = None  # When set, the prompt and reply are saved to this chat session
+    keep_context: bool = False  # With session_id: prompt is only the new turn, earlier turns come from the session
 
 class ChatSessionBase(BaseModel):
     session_title: Optional[str] = None
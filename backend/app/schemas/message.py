@@ -12,6 +12,14 @@ class MessageBase(BaseModel):
 class MessageCreate(MessageBase):
     pass
 
+class MessageBatchCreate(BaseModel):
+    messages: List[MessageCreate] = Field(..., min_length=1, max_length=10000)
+
+class SavedMessage(BaseModel):
+    id: int
+    session_id: int
+    created_at: datetime
+
 class Message(MessageBase):
     id: int
     created_at: datetime
@@ -32,4 +40,24 @@ class MessageResponse(BaseModel):
 
 class SessionMessagesResponse(BaseModel):
     session_id: int
-    messages: List[MessageResponse] 
\ No newline at end of file
+    messages: List[MessageResponse]
+    next_cursor: Optional[str] = None  # Pass as `after` to get the following page
+    prev_cursor: Optional[str] = None  # Pass as `before` to get the preceding page 
+
+class MessageBatchResponse(BaseModel):
+    saved: int
+    messages: List[SavedMessage]
+
+class MessageSearchHit(BaseModel):
+    id: int
+    session_id: int
+    sender: str
+    created_at: datetime
+    message_type: Optional[str] = None
+    rank: float
+    highlight: str  # HTML-escaped excerpt, matched terms wrapped in <mark>
+
+class MessageSearchResponse(BaseModel):
+    query: str
+    hits: List[MessageSearchHit]
+    next_cursor: Optional[str] = None  # Pass as `cursor` to get the following page
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+class RetrieveRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    top_k: int = Field(5, ge=1, le=100)
+    status: Optional[str] = "active"  # BusinessDocument.status, None searches every document
+    tags: Optional[List[str]] = None  # Sections of documents having any of these tags
+    session_id: Optional[int] = None  # Chat session the retrieval is logged against
+
+class RetrievedSection(BaseModel):
+    id: int
+    document_id: int
+    document_title: str
+    section_title: Optional[str] = None
+    content: str
+    score: float  # Cosine similarity, 1.0 is identical
+
+class RetrieveResponse(BaseModel):
+    query: str
+    results: List[RetrievedSection]
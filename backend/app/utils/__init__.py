@@ -1,6 +1,8 @@
 from app.utils.auth import (
     get_password_hash,
     verify_password,
+    get_password_hash_async,
+    verify_password_async,
     create_access_token,
     get_current_user,
     get_current_active_user,
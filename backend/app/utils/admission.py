@@ -0,0 +1,217 @@
+import asyncio
+import math
+import os
+import time
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Admission control for /api/chat, in front of ollama_stream
+CHAT_SCHEDULER_ENABLED = os.getenv("CHAT_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Generations per model at once; CHAT_MODEL_CONCURRENCY overrides it per model, e.g. "llama2=1,mistral=2"
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "4"))
+CHAT_MODEL_CONCURRENCY = os.getenv("CHAT_MODEL_CONCURRENCY", "")
+# Requests allowed to wait per model, further ones are rejected with 429
+CHAT_QUEUE_MAX = int(os.getenv("CHAT_QUEUE_MAX", "32"))
+# Seconds a request may wait for a slot before it is rejected with 503
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "120"))
+# Waits kept for the percentiles in the stats
+_WAIT_SAMPLES = 1000
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, message: str, retry_after: int):
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().rpartition("=")
+        if name and value.strip().isdigit():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class Ticket:
+    """A granted slot; release() is idempotent so error paths can call it freely"""
+
+    def __init__(self, lane: "_ModelLane", client: str, position: int, waited: float):
+        self._lane = lane
+        self.client = client
+        self.position = position
+        self.waited = waited
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._lane.release(time.monotonic() - self._started)
+
+
+class _ModelLane:
+    """Slots and waiting requests of one model"""
+
+    def __init__(self, model: str, slots: int):
+        self.model = model
+        self.slots = slots
+        self.active = 0
+        # Waiting futures per client; clients are served round-robin in this order
+        self.queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self.service_seconds = 0.0  # moving average of how long a slot is held
+
+    def position(self, client: str) -> int:
+        """1-based place a new request of ``client`` gets under round-robin order"""
+        mine = len(self.queues.get(client, ()))
+        others = sum(min(len(waiters), mine + 1) for other, waiters in self.queues.items() if other != client)
+        return others + mine + 1
+
+    def retry_after(self) -> int:
+        service = self.service_seconds or 1.0
+        return max(1, math.ceil(service * (self.waiting + 1) / max(self.slots, 1)))
+
+    def enqueue(self, client: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(client, deque()).append(future)
+        self.waiting += 1
+        return future
+
+    def discard(self, client: str, future: asyncio.Future):
+        waiters = self.queues.get(client)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.waiting -= 1
+            if not waiters:
+                del self.queues[client]
+
+    def release(self, held: Optional[float] = None):
+        if held is not None:
+            self.service_seconds = held if not self.service_seconds else 0.8 * self.service_seconds + 0.2 * held
+        while self.queues:
+            # Hand the slot straight to the next client in turn, which then goes to the back
+            client, waiters = next(iter(self.queues.items()))
+            future = waiters.popleft()
+            self.waiting -= 1
+            if waiters:
+                self.queues.move_to_end(client)
+            else:
+                del self.queues[client]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class ChatScheduler:
+    """
+    Per-model admission control with fair queueing.
+
+    Every model has a fixed number of slots. A request that finds them all
+    busy waits in a per-client queue, and freed slots go to clients in
+    round-robin order, so a client with many requests in flight cannot starve
+    the others. When CHAT_QUEUE_MAX requests are already waiting the request
+    is rejected right away with a Retry-After estimate instead of piling up
+    behind Ollama's own queue.
+    """
+
+    def __init__(self, enabled: bool, default_slots: int, model_slots: Dict[str, int], max_queue: int, queue_timeout: float):
+        self.enabled = enabled
+        self.default_slots = default_slots
+        self.model_slots = model_slots
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lanes: Dict[str, _ModelLane] = {}
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = _ModelLane(model, self.model_slots.get(model, self.default_slots))
+        return lane
+
+    async def acquire(self, model: str, client: str) -> Ticket:
+        """Wait for a slot of ``model``; raises AdmissionRejected when the queue is full or the wait too long"""
+        lane = self._lane(model)
+        if lane.active < lane.slots and not lane.queues:
+            lane.active += 1
+            lane.admitted += 1
+            lane.waits.append(0.0)
+            return Ticket(lane, client, 0, 0.0)
+
+        if lane.waiting >= self.max_queue:
+            lane.rejected += 1
+            raise AdmissionRejected(429, f"Too many requests waiting for {model}", lane.retry_after())
+
+        position = lane.position(client)
+        future = lane.enqueue(client)
+        lane.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                lane.discard(client, future)
+                lane.timed_out += 1
+                raise AdmissionRejected(503, f"Timed out waiting for a free {model} slot", lane.retry_after())
+            # The slot was handed over just as the timeout fired, take it
+        except asyncio.CancelledError:
+            # The client went away while waiting; pass on a slot that was already handed over
+            lane.discard(client, future)
+            lane.cancelled += 1
+            if future.done():
+                lane.release()
+            raise
+
+        waited = time.monotonic() - start
+        lane.admitted += 1
+        lane.waits.append(waited)
+        return Ticket(lane, client, position, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for model, lane in self._lanes.items():
+            waits = sorted(lane.waits)
+            models[model] = {
+                "slots": lane.slots,
+                "active": lane.active,
+                "waiting": lane.waiting,
+                "waiting_by_client": {client: len(waiters) for client, waiters in lane.queues.items()},
+                "admitted": lane.admitted,
+                "queued": lane.queued,
+                "rejected": lane.rejected,
+                "timed_out": lane.timed_out,
+                "cancelled": lane.cancelled,
+                "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                "wait_ms_p95": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))] * 1000, 1) if waits else 0.0,
+                "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+                "avg_service_seconds": round(lane.service_seconds, 3),
+            }
+        return {
+            "enabled": self.enabled,
+            "default_slots": self.default_slots,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "models": models,
+        }
+
+
+chat_scheduler = ChatScheduler(
+    CHAT_SCHEDULER_ENABLED,
+    CHAT_MAX_CONCURRENCY,
+    parse_model_limits(CHAT_MODEL_CONCURRENCY),
+    CHAT_QUEUE_MAX,
+    CHAT_QUEUE_TIMEOUT,
+)
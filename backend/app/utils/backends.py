@@ -0,0 +1,169 @@
+import asyncio
+import os
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+import httpx
+
+from app.utils.http_client import upstream_clients
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds between /api/ps probes of every backend (0 disables probing)
+BACKEND_PROBE_INTERVAL = float(os.getenv("BACKEND_PROBE_INTERVAL", "10"))
+BACKEND_PROBE_TIMEOUT = httpx.Timeout(float(os.getenv("BACKEND_PROBE_TIMEOUT", "2")))
+# Consecutive failures (requests or probes) before a backend is taken out of rotation
+BACKEND_MAX_FAILURES = int(os.getenv("BACKEND_MAX_FAILURES", "2"))
+# Seconds an ejected backend stays out unless a probe finds it healthy again
+BACKEND_EJECT_SECONDS = float(os.getenv("BACKEND_EJECT_SECONDS", "30"))
+# A backend with the model loaded is preferred unless it has this many more requests in flight than the least busy one
+BACKEND_AFFINITY_SLACK = int(os.getenv("BACKEND_AFFINITY_SLACK", "2"))
+
+
+class Backend:
+    """One Ollama server and what the pool knows about it"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.loaded_models: Set[str] = set()
+        self.last_pick = 0
+        self.last_probe: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    @property
+    def available(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+    def has_model(self, model: str) -> bool:
+        return model in self.loaded_models or f"{model}:latest" in self.loaded_models
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.failures,
+            "loaded_models": sorted(self.loaded_models),
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "seconds_since_probe": round(time.monotonic() - self.last_probe, 1) if self.last_probe is not None else None,
+        }
+
+
+class BackendPool:
+    """
+    Routes requests over several Ollama servers.
+
+    A request goes to the available backend with the fewest requests in
+    flight, preferring one that already has the model loaded (from its
+    /api/ps) so a chat does not pay for a cold load elsewhere. Backends that
+    fail BACKEND_MAX_FAILURES times in a row are ejected until a probe finds
+    them healthy again or BACKEND_EJECT_SECONDS pass. When every backend is
+    ejected the least busy one is tried anyway rather than failing outright.
+    """
+
+    def __init__(self, urls: Sequence[str]):
+        self.backends = [Backend(url) for url in urls]
+        self._picks = 0
+        self._probe_task: Optional[asyncio.Task] = None
+        self.retries = 0
+
+    def pick(self, model: Optional[str] = None, exclude: Iterable[Backend] = ()) -> Optional[Backend]:
+        """Backend for the next request, None once every backend is excluded"""
+        excluded = set(id(backend) for backend in exclude)
+        candidates = [backend for backend in self.backends if id(backend) not in excluded]
+        if not candidates:
+            return None
+        candidates = [backend for backend in candidates if backend.available] or candidates
+
+        def load(backend: Backend):
+            # Ties go to the backend picked longest ago
+            return (backend.outstanding, backend.last_pick)
+
+        chosen = min(candidates, key=load)
+        if model:
+            warm = [backend for backend in candidates if backend.has_model(model)]
+            if warm:
+                best_warm = min(warm, key=load)
+                if best_warm.outstanding <= chosen.outstanding + BACKEND_AFFINITY_SLACK:
+                    chosen = best_warm
+        self._picks += 1
+        chosen.last_pick = self._picks
+        return chosen
+
+    def begin(self, backend: Backend):
+        backend.outstanding += 1
+        backend.requests += 1
+
+    def end(self, backend: Backend):
+        backend.outstanding -= 1
+
+    def succeeded(self, backend: Backend, model: Optional[str] = None):
+        backend.failures = 0
+        if model:
+            # It has the model in memory now, until the next probe says otherwise
+            backend.loaded_models.add(model)
+
+    def failed(self, backend: Backend, error: Exception):
+        backend.errors += 1
+        backend.failures += 1
+        if backend.failures >= BACKEND_MAX_FAILURES and backend.available:
+            backend.ejected_until = time.monotonic() + BACKEND_EJECT_SECONDS
+            backend.ejections += 1
+            logger.warning(f"Ejecting Ollama backend {backend.url} after {backend.failures} failures: {str(error)}")
+
+    async def probe(self, backend: Backend):
+        url = f"{backend.url}/api/ps"
+        try:
+            response = await upstream_clients.get(url).get(url, timeout=BACKEND_PROBE_TIMEOUT)
+            response.raise_for_status()
+            backend.loaded_models = {model.get("name") or model.get("model") for model in response.json().get("models", [])}
+        except Exception as e:
+            self.failed(backend, e)
+        else:
+            if not backend.available:
+                logger.info(f"Ollama backend {backend.url} is healthy again")
+            backend.failures = 0
+            backend.ejected_until = 0.0
+        finally:
+            backend.last_probe = time.monotonic()
+
+    async def probe_all(self):
+        await asyncio.gather(*(self.probe(backend) for backend in self.backends))
+
+    async def _run_probes(self):
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(BACKEND_PROBE_INTERVAL)
+
+    def start(self):
+        """Start the periodic probes; only worth it with more than one backend"""
+        if len(self.backends) > 1 and BACKEND_PROBE_INTERVAL > 0 and self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._run_probes())
+
+    async def aclose(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "probe_interval_seconds": BACKEND_PROBE_INTERVAL if len(self.backends) > 1 else 0,
+            "backends": {backend.url: backend.stats() for backend in self.backends},
+        }
+
+
+def parse_hosts(value: str) -> List[str]:
+    return [host.strip().rstrip("/") for host in value.split(",") if host.strip()]
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import re
+import unicodedata
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.database import AsyncSessionLocal
+from app.models.models import EmbeddingCacheEntry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Persistent cache of embeddings in the embedding_cache table
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Stored precision: float32 is exact, float16 halves the size
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32").lower()
+# Embeddings kept in process memory, most recently used first
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
+# Keys per SELECT / rows per INSERT against the table
+EMBEDDING_CACHE_DB_BATCH = 500
+
+_WHITESPACE = re.compile(r"\s+")
+_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+
+
+def normalize_text(text: str) -> str:
+    """Texts that only differ in Unicode form or whitespace share an embedding"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with two tiers.
+
+    Embeddings are keyed by (model, SHA-256 of the normalized text). A bounded
+    LRU in process memory sits in front of the embedding_cache table; both hold
+    the packed bytes (float32 or float16), so a 768-dimensional entry takes 3 KB
+    or 1.5 KB. Lookups and stores work on whole batches so a caller only has to
+    send the misses upstream.
+    """
+
+    def __init__(self, enabled: bool, dtype: str = "float32", memory_entries: int = 10000, session_factory=AsyncSessionLocal):
+        if dtype not in _DTYPES:
+            raise ValueError(f"EMBEDDING_CACHE_DTYPE must be one of {', '.join(_DTYPES)}, got {dtype!r}")
+        self.enabled = enabled
+        self.dtype = dtype
+        self.memory_entries = memory_entries
+        self.session_factory = session_factory
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[str, bytes]]" = OrderedDict()
+        self.lookups = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+        self.upstream_calls = 0
+        self.upstream_calls_saved = 0
+
+    @staticmethod
+    def pack(embedding: Sequence[float], dtype: str) -> bytes:
+        return np.asarray(embedding, dtype=_DTYPES[dtype]).tobytes()
+
+    @staticmethod
+    def unpack(data: bytes, dtype: str) -> List[float]:
+        return np.frombuffer(data, dtype=_DTYPES[dtype]).astype(np.float32).tolist()
+
+    def _remember(self, key: Tuple[str, str], dtype: str, data: bytes):
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (dtype, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """Embeddings of the given text hashes that are cached, by hash"""
+        if not self.enabled or not hashes:
+            return {}
+        unique = list(dict.fromkeys(hashes))
+        self.lookups += len(unique)
+        found: Dict[str, List[float]] = {}
+        missing = []
+        for digest in unique:
+            entry = self._memory.get((model, digest))
+            if entry is None:
+                missing.append(digest)
+            else:
+                self._memory.move_to_end((model, digest))
+                found[digest] = self.unpack(entry[1], entry[0])
+        self.memory_hits += len(found)
+
+        if missing:
+            try:
+                async with self.session_factory() as db:
+                    for i in range(0, len(missing), EMBEDDING_CACHE_DB_BATCH):
+                        keys = [(model, digest) for digest in missing[i:i + EMBEDDING_CACHE_DB_BATCH]]
+                        result = await db.execute(
+                            select(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.dtype, EmbeddingCacheEntry.vector)
+                            .where(tuple_(EmbeddingCacheEntry.model, EmbeddingCacheEntry.text_hash).in_(keys))
+                        )
+                        for row in result.all():
+                            found[row.text_hash] = self.unpack(row.vector, row.dtype)
+                            self._remember((model, row.text_hash), row.dtype, row.vector)
+                            self.db_hits += 1
+            except Exception as e:
+                # The cache only saves upstream calls, a failing table must not fail embedding
+                self.errors += 1
+                logger.warning(f"Embedding cache lookup failed: {str(e)}")
+        self.misses += len(unique) - len(found)
+        return found
+
+    async def put_many(self, model: str, embeddings: Mapping[str, Sequence[float]]):
+        """Store embeddings by text hash; existing entries are kept"""
+        if not self.enabled or not embeddings:
+            return
+        rows = []
+        for digest, embedding in embeddings.items():
+            data = self.pack(embedding, self.dtype)
+            self._remember((model, digest), self.dtype, data)
+            rows.append({"model": model, "text_hash": digest, "dtype": self.dtype, "vector": data})
+        try:
+            async with self.session_factory() as db:
+                for i in range(0, len(rows), EMBEDDING_CACHE_DB_BATCH):
+                    await db.execute(insert(EmbeddingCacheEntry).values(rows[i:i + EMBEDDING_CACHE_DB_BATCH]).on_conflict_do_nothing())
+                await db.commit()
+            self.stores += len(rows)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Embedding cache store failed: {str(e)}")
+
+    def clear_memory(self):
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.db_hits
+        return {
+            "enabled": self.enabled,
+            "dtype": self.dtype,
+            "memory_entries": len(self._memory),
+            "memory_max_entries": self.memory_entries,
+            "lookups": self.lookups,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / self.lookups, 4) if self.lookups else 0.0,
+            "stores": self.stores,
+            "errors": self.errors,
+            "upstream_calls": self.upstream_calls,
+            "upstream_calls_saved": self.upstream_calls_saved,
+        }
+
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DTYPE, EMBEDDING_CACHE_MEMORY_ENTRIES)
@@ -0,0 +1,163 @@
+import httpx
+import os
+import time
+import logging
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+from app.utils.metrics import record_upstream_error, record_upstream_response
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Connection pool settings (per upstream host)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+# Timeouts in seconds. Read is the gap allowed between two chunks of a stream,
+# so it follows API_TIMEOUT_DURATION (milliseconds) like the frontend does.
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", str(int(os.getenv("API_TIMEOUT_DURATION", "60000")) / 1000)))
+UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "10"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+
+
+class PoolStats:
+    """Counters for a single upstream client"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.created_at = time.time()
+        self.requests = 0
+        self.in_flight = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "connections_opened": self.connections_opened,
+            "reused_requests": max(self.requests - self.connections_opened, 0),
+            "errors": self.errors,
+            "uptime_seconds": round(time.time() - self.created_at, 1),
+        }
+
+
+class UpstreamClientRegistry:
+    """
+    Keeps one pooled httpx.AsyncClient per upstream origin so that chat streams,
+    model listings and detail lookups reuse keep-alive connections instead of
+    opening a new TCP connection per call.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, PoolStats] = {}
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _build_client(self, origin: str) -> httpx.AsyncClient:
+        stats = self._stats.setdefault(origin, PoolStats(origin))
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            # httpcore reports every new TCP connection through the trace extension
+            if event_name == "connection.connect_tcp.complete":
+                stats.connections_opened += 1
+
+        async def on_request(request: httpx.Request):
+            request.extensions["trace"] = trace
+            stats.requests += 1
+
+        async def on_response(response: httpx.Response):
+            record_upstream_response(origin, response.request.url.path, response.status_code)
+            if response.status_code >= 500:
+                stats.errors += 1
+
+        logger.info(f"Creating pooled upstream client for {origin}")
+        return httpx.AsyncClient(
+            base_url=origin,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=UPSTREAM_CONNECT_TIMEOUT,
+                read=UPSTREAM_READ_TIMEOUT,
+                write=UPSTREAM_WRITE_TIMEOUT,
+                pool=UPSTREAM_POOL_TIMEOUT,
+            ),
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        """Return the shared client for the origin of ``url``, creating it on first use"""
+        origin = self._origin(url)
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = self._build_client(origin)
+            self._clients[origin] = client
+        return client
+
+    def stats(self, url: str) -> Optional[PoolStats]:
+        return self._stats.get(self._origin(url))
+
+    def track(self, url: str) -> "_InFlight":
+        """Context manager that counts a request as in flight for the pool statistics"""
+        return _InFlight(self._stats.get(self._origin(url)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Pool statistics for every upstream origin"""
+        result = {}
+        for origin, stats in self._stats.items():
+            data = stats.as_dict()
+            client = self._clients.get(origin)
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = getattr(pool, "connections", None)
+            if connections is not None:
+                data["open_connections"] = len(connections)
+                data["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+            data["limits"] = {
+                "max_connections": UPSTREAM_MAX_CONNECTIONS,
+                "max_keepalive_connections": UPSTREAM_MAX_KEEPALIVE,
+                "keepalive_expiry": UPSTREAM_KEEPALIVE_EXPIRY,
+            }
+            result[origin] = data
+        return result
+
+    async def aclose(self):
+        """Close every pooled client; called from the app lifespan on shutdown"""
+        for origin, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Error closing upstream client for {origin}: {str(e)}")
+        self._clients.clear()
+
+
+class _InFlight:
+    def __init__(self, stats: Optional[PoolStats]):
+        self._stats = stats
+
+    def __enter__(self):
+        if self._stats is not None:
+            self._stats.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._stats is not None:
+            self._stats.in_flight -= 1
+            if exc_type is not None and issubclass(exc_type, httpx.HTTPError):
+                self._stats.errors += 1
+                record_upstream_error(self._stats.base_url, exc)
+        return False
+
+
+# Process-wide registry, opened and closed by the app lifespan in app.main
+upstream_clients = UpstreamClientRegistry()
@@ -0,0 +1,279 @@
+"""
+Turns BusinessDocument.content into embedded DocumentSection rows.
+
+Documents are split into sections and every section is identified by the
+SHA-256 of its title and content. On each run only sections whose hash is not
+stored yet are embedded; sections that disappeared from a document are deleted
+and unchanged ones are left alone, embedding included.
+
+Usage (from the backend directory):
+    python -m app.utils.ingestion                  # every document
+    python -m app.utils.ingestion --document-id 3  # only some documents
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.database import AsyncSessionLocal
+from app.models.models import BusinessDocument, DocumentSection
+from app.utils.embedding_cache import embedding_cache, text_hash
+from app.utils.ollama import EMBEDDING_MODEL, get_embeddings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Sections are built from whole paragraphs up to this many characters
+SECTION_MAX_CHARS = int(os.getenv("SECTION_MAX_CHARS", "1500"))
+# Texts per embedding request and embedding requests in flight at once
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+# Documents planned, embedded and written per transaction
+INGEST_DOCUMENT_BATCH = int(os.getenv("INGEST_DOCUMENT_BATCH", "50"))
+# Rows per INSERT or DELETE statement, keeps the bind parameters below the driver limit
+UPSERT_CHUNK_SIZE = 1000
+
+_HEADING = re.compile(r"^#{1,6}\s+(.+)$")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+class IngestStats:
+    """Counters of one ingestion run, handed to the progress callback"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.documents_total = 0
+        self.documents_done = 0
+        self.sections_embedded = 0
+        self.sections_cached = 0
+        self.sections_unchanged = 0
+        self.sections_deleted = 0
+        self.embedding_requests = 0
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "documents_total": self.documents_total,
+            "documents_done": self.documents_done,
+            "sections_embedded": self.sections_embedded,
+            "sections_cached": self.sections_cached,
+            "sections_unchanged": self.sections_unchanged,
+            "sections_deleted": self.sections_deleted,
+            "embedding_requests": self.embedding_requests,
+            "elapsed_seconds": round(self.elapsed, 2),
+            "sections_per_second": round(self.sections_embedded / self.elapsed, 1) if self.elapsed else 0.0,
+        }
+
+
+def _split_long(block: str, max_chars: int) -> List[str]:
+    """Cut a paragraph longer than max_chars at whitespace"""
+    parts = []
+    while len(block) > max_chars:
+        cut = block.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(block[:cut].strip())
+        block = block[cut:].strip()
+    if block:
+        parts.append(block)
+    return parts
+
+
+def split_sections(content: str, max_chars: int = SECTION_MAX_CHARS) -> List[Tuple[Optional[str], str]]:
+    """
+    Split a document into ``(title, text)`` sections. Markdown headings start a
+    new section and become its title; paragraphs are packed into sections of
+    at most ``max_chars`` characters.
+    """
+    sections = []
+    title = None
+    paragraphs: List[str] = []
+    size = 0
+
+    def flush():
+        nonlocal size
+        if paragraphs:
+            sections.append((title, "\n\n".join(paragraphs)))
+            paragraphs.clear()
+            size = 0
+
+    for block in _PARAGRAPH_BREAK.split(content or ""):
+        block = block.strip()
+        if not block:
+            continue
+        first_line, _, rest = block.partition("\n")
+        heading = _HEADING.match(first_line)
+        if heading:
+            flush()
+            title = heading.group(1).strip()[:255]
+            block = rest.strip()
+            if not block:
+                continue
+        for part in _split_long(block, max_chars):
+            if paragraphs and size + len(part) > max_chars:
+                flush()
+            paragraphs.append(part)
+            size += len(part) + 2
+    flush()
+    return sections
+
+
+def section_hash(title: Optional[str], text: str) -> str:
+    return hashlib.sha256(f"{title or ''}\n\n{text}".encode("utf-8")).hexdigest()
+
+
+def _embedding_input(title: Optional[str], text: str) -> str:
+    return f"{title}\n\n{text}" if title else text
+
+
+async def embed_texts(texts: Sequence[str], stats: Optional[IngestStats] = None) -> List[List[float]]:
+    """
+    Embed texts, taking what the embedding cache has and sending only the
+    distinct misses upstream, in batches of EMBEDDING_BATCH_SIZE with at most
+    EMBEDDING_CONCURRENCY requests at a time.
+    """
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    hashes = [text_hash(text) for text in texts]
+    found = await embedding_cache.get_many(EMBEDDING_MODEL, hashes)
+    missing: Dict[str, str] = {}
+    for digest, text in zip(hashes, texts):
+        if digest not in found:
+            missing.setdefault(digest, text)
+
+    async def embed_batch(batch: Sequence[str]) -> List[List[float]]:
+        async with semaphore:
+            if stats is not None:
+                stats.embedding_requests += 1
+            return await get_embeddings(list(batch), lookup=False)
+
+    misses = list(missing.values())
+    batches = [misses[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(misses), EMBEDDING_BATCH_SIZE)]
+    embedding_cache.upstream_calls_saved += -(-len(texts) // EMBEDDING_BATCH_SIZE) - len(batches)
+    results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    found.update(zip(missing, (embedding for batch in results for embedding in batch)))
+    if stats is not None:
+        stats.sections_cached += len(texts) - len(misses)
+    return [found[digest] for digest in hashes]
+
+
+async def _ingest_batch(document_ids: Sequence[int], stats: IngestStats, session_factory):
+    async with session_factory() as db:
+        documents = (await db.execute(
+            select(BusinessDocument.id, BusinessDocument.content).where(BusinessDocument.id.in_(document_ids))
+        )).all()
+        existing = (await db.execute(
+            select(
+                DocumentSection.id,
+                DocumentSection.document_id,
+                DocumentSection.content_hash,
+                DocumentSection.embedding.is_(None).label("missing_embedding"),
+            ).where(DocumentSection.document_id.in_(document_ids))
+        )).all()
+
+    stored: Dict[int, Dict[str, int]] = {}
+    stale_ids = []
+    for row in existing:
+        hashes = stored.setdefault(row.document_id, {})
+        # Rows from before hashing, duplicates and rows without an embedding are rebuilt
+        if row.content_hash is None or row.missing_embedding or row.content_hash in hashes:
+            stale_ids.append(row.id)
+        else:
+            hashes[row.content_hash] = row.id
+
+    pending = []
+    for document in documents:
+        hashes = stored.get(document.id, {})
+        wanted = {}
+        for title, text in split_sections(document.content):
+            wanted.setdefault(section_hash(title, text), (title, text))
+        for content_hash, row_id in hashes.items():
+            if content_hash not in wanted:
+                stale_ids.append(row_id)
+        for content_hash, (title, text) in wanted.items():
+            if content_hash in hashes:
+                stats.sections_unchanged += 1
+            else:
+                pending.append({
+                    "document_id": document.id,
+                    "section_title": title,
+                    "content": text,
+                    "content_hash": content_hash,
+                })
+
+    embeddings = await embed_texts([_embedding_input(row["section_title"], row["content"]) for row in pending], stats)
+    for row, embedding in zip(pending, embeddings):
+        row["embedding"] = embedding
+
+    async with session_factory() as db:
+        for i in range(0, len(stale_ids), UPSERT_CHUNK_SIZE):
+            await db.execute(delete(DocumentSection).where(DocumentSection.id.in_(stale_ids[i:i + UPSERT_CHUNK_SIZE])))
+        for i in range(0, len(pending), UPSERT_CHUNK_SIZE):
+            statement = insert(DocumentSection).values(pending[i:i + UPSERT_CHUNK_SIZE])
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=[DocumentSection.document_id, DocumentSection.content_hash],
+                set_={
+                    "section_title": statement.excluded.section_title,
+                    "embedding": statement.excluded.embedding,
+                },
+            ))
+        await db.commit()
+
+    stats.sections_embedded += len(pending)
+    stats.sections_deleted += len(stale_ids)
+    stats.documents_done += len(documents)
+
+
+async def ingest_documents(
+    document_ids: Optional[Sequence[int]] = None,
+    progress: Optional[Callable[[IngestStats], None]] = None,
+    session_factory=AsyncSessionLocal
+) -> IngestStats:
+    """
+    Bring the sections of the given documents (all documents by default) up to
+    date with their content. ``progress(stats)`` is called after every batch of
+    INGEST_DOCUMENT_BATCH documents.
+    """
+    stats = IngestStats()
+    query = select(BusinessDocument.id).order_by(BusinessDocument.id)
+    if document_ids is not None:
+        query = query.where(BusinessDocument.id.in_(document_ids))
+    async with session_factory() as db:
+        ids = list((await db.execute(query)).scalars().all())
+    stats.documents_total = len(ids)
+
+    for i in range(0, len(ids), INGEST_DOCUMENT_BATCH):
+        await _ingest_batch(ids[i:i + INGEST_DOCUMENT_BATCH], stats, session_factory)
+        if progress is not None:
+            progress(stats)
+    stats.finished_at = time.perf_counter()
+    logger.info(f"Ingestion finished: {stats.as_dict()}")
+    return stats
+
+
+def _print_progress(stats: IngestStats):
+    print(
+        f"\r{stats.documents_done}/{stats.documents_total} documents, "
+        f"{stats.sections_embedded} embedded ({stats.sections_cached} from cache), {stats.sections_unchanged} unchanged, "
+        f"{stats.sections_deleted} deleted ({stats.sections_embedded / max(stats.elapsed, 1e-9):.0f} sections/s)",
+        end="",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--document-id", type=int, action="append", dest="document_ids")
+    args = parser.parse_args()
+    asyncio.run(ingest_documents(args.document_ids, progress=_print_progress))
+    print()
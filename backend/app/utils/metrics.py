@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics served at /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+CHAT_TTFT = Histogram(
+    "chat_time_to_first_token_seconds", "Time from the start of a chat stream to its first token",
+    ["model"], buckets=_LATENCY_BUCKETS,
+)
+CHAT_TOKENS_PER_SECOND = Histogram(
+    "chat_tokens_per_second", "Generation speed of a chat stream after its first token",
+    ["model"], buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500),
+)
+CHAT_STREAM_DURATION = Histogram(
+    "chat_stream_duration_seconds", "Total duration of a chat stream",
+    ["model", "outcome"], buckets=_LATENCY_BUCKETS + (120, 300),
+)
+CHAT_TOKENS = Counter("chat_tokens_total", "Tokens streamed to clients", ["model"])
+CHAT_STREAMS_IN_FLIGHT = Gauge("chat_streams_in_flight", "Chat streams currently open", ["model"])
+CHAT_STREAMS_ABORTED = Counter(
+    "chat_streams_aborted", "Chat streams whose upstream generation was stopped because the client went away", ["model"],
+)
+CHAT_TOKENS_SAVED = Counter(
+    "chat_tokens_saved", "Estimated tokens not generated thanks to aborted streams (typical reply length minus tokens sent)",
+    ["model"],
+)
+
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total", "Responses from Ollama / LMStudio by status code",
+    ["origin", "path", "status"],
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Upstream requests that failed without a response or mid-stream",
+    ["origin", "error"],
+)
+
+DB_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_seconds", "Time to check a connection out of the pool (queue wait, new connections and pre-ping)",
+    ["engine"], buckets=_DB_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Database statement latency by statement type",
+    ["engine", "statement"], buckets=_DB_BUCKETS,
+)
+
+
+class _ModelStreamMetrics:
+    """The label children of the chat metrics for one model, looked up once instead of per stream"""
+
+    __slots__ = ("in_flight", "tokens", "aborted", "saved", "ttft", "tokens_per_second", "duration")
+
+    def __init__(self, model: str):
+        self.in_flight = CHAT_STREAMS_IN_FLIGHT.labels(model)
+        self.tokens = CHAT_TOKENS.labels(model)
+        self.aborted = CHAT_STREAMS_ABORTED.labels(model)
+        self.saved = CHAT_TOKENS_SAVED.labels(model)
+        self.ttft = CHAT_TTFT.labels(model)
+        self.tokens_per_second = CHAT_TOKENS_PER_SECOND.labels(model)
+        # Per outcome, filled on first use
+        self.duration: Dict[str, Histogram] = {}
+
+
+_stream_metrics: Dict[str, _ModelStreamMetrics] = {}
+
+
+class StreamTimer:
+    """
+    Timing of one chat stream. The per-token path only compares one attribute
+    (``first_token_at``); everything is recorded once in ``finish``.
+
+    ``finish`` takes the outcome of the stream: ``completed``, ``disconnected``
+    (the client went away and the upstream was closed) or ``error``.
+    """
+
+    __slots__ = ("model", "metrics", "started_at", "first_token_at")
+
+    # Moving average of the length of completed replies per model, to estimate what an abort saved
+    typical_tokens: Dict[str, float] = {}
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.metrics = None
+        if METRICS_ENABLED:
+            self.metrics = _stream_metrics.get(model)
+            if self.metrics is None:
+                self.metrics = _stream_metrics[model] = _ModelStreamMetrics(model)
+            self.metrics.in_flight.inc()
+
+    def finish(self, tokens: int, outcome: str):
+        metrics = self.metrics
+        if metrics is None:
+            return
+        end = time.perf_counter()
+        metrics.in_flight.dec()
+        duration = metrics.duration.get(outcome)
+        if duration is None:
+            duration = metrics.duration[outcome] = CHAT_STREAM_DURATION.labels(self.model, outcome)
+        duration.observe(end - self.started_at)
+        if tokens:
+            metrics.tokens.inc(tokens)
+        typical = self.typical_tokens.get(self.model)
+        if outcome == "completed":
+            self.typical_tokens[self.model] = tokens if typical is None else 0.9 * typical + 0.1 * tokens
+        elif outcome == "disconnected":
+            metrics.aborted.inc()
+            if typical is not None and typical > tokens:
+                metrics.saved.inc(typical - tokens)
+        if self.first_token_at is not None:
+            metrics.ttft.observe(self.first_token_at - self.started_at)
+            generating = end - self.first_token_at
+            if outcome == "completed" and tokens > 1 and generating > 0:
+                metrics.tokens_per_second.observe((tokens - 1) / generating)
+
+
+def record_upstream_response(origin: str, path: str, status: int):
+    if METRICS_ENABLED:
+        UPSTREAM_RESPONSES.labels(origin, path, str(status)).inc()
+
+
+def record_upstream_error(origin: str, error: BaseException):
+    if METRICS_ENABLED:
+        UPSTREAM_ERRORS.labels(origin, type(error).__name__).inc()
+
+
+def _time_checkouts(pool, engine_name: str):
+    # The pool has no event before a checkout starts, so time the call sessions make when they first need a connection
+    connect = pool.connect
+    checkout_wait = DB_CHECKOUT_WAIT.labels(engine_name)
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            checkout_wait.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+
+
+def instrument_engine(engine, engine_name: str):
+    """Time every statement run on a (sync) SQLAlchemy engine, and every connection checkout from its pool"""
+    if not METRICS_ENABLED:
+        return
+
+    _time_checkouts(engine.pool, engine_name)
+
+    @event.listens_for(engine, "engine_disposed")
+    def engine_disposed(disposed_engine):
+        # dispose() replaces the pool
+        _time_checkouts(engine.pool, engine_name)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started_at"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        if kind not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            kind = "OTHER"
+        DB_QUERY_DURATION.labels(engine_name, kind).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # A failed statement never reaches after_cursor_execute
+        stack = context.connection.info.get("query_started_at") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+def render_metrics():
+    """Body and content type of the /metrics response"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,45 +1,528 @@
+import anyio
 import httpx
 import os
 import json
-import traceback
+import time
+import asyncio
+import hashlib
+from array import array
+from collections import OrderedDict
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
-from typing import Optional, Dict, Any, AsyncGenerator
+from typing import Optional, Dict, Any, AsyncGenerator, Awaitable, Callable, Hashable, List
 import logging
 
+from app.utils.backends import Backend, BackendPool, parse_hosts
+from app.utils.embedding_cache import embedding_cache, text_hash
+from app.utils.http_client import upstream_clients
+from app.utils.metrics import StreamTimer
+from app.utils.response_cache import response_cache
+from app.utils.singleflight import SingleFlight
+from app.utils.stream_coalescer import coalesce
+from app.utils.stream_parsers import NDJSONDecoder, SSEDecoder, SSEEvent
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Constants
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+# One or more Ollama servers, comma separated; chats and embeddings are balanced across them
+OLLAMA_HOSTS = parse_hosts(os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434"))
+OLLAMA_HOST = OLLAMA_HOSTS[0]
 LMSTUDIO_HOST = os.getenv("LMSTUDIO_HOST", "http://127.0.0.1:1234")
 API_TIMEOUT_DURATION = int(os.getenv("API_TIMEOUT_DURATION", "60000"))  # 60 seconds default
+METADATA_TIMEOUT = httpx.Timeout(10, connect=5)  # Model listing and details
+MODEL_CACHE_TTL = float(os.getenv("MODEL_CACHE_TTL", "30"))  # Seconds before a model list is refreshed
+MODEL_CACHE_MAX_ENTRIES = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "256"))
+# Seconds before a model name missing from the list may make it be fetched again
+MODEL_MISS_TTL = float(os.getenv("MODEL_MISS_TTL", "5"))
+# Ollama conversation contexts kept for session-aware chat (keep_context)
+SESSION_CONTEXT_MAX_ENTRIES = int(os.getenv("SESSION_CONTEXT_MAX_ENTRIES", "512"))
+SESSION_CONTEXT_TTL = float(os.getenv("SESSION_CONTEXT_TTL", "3600"))  # Seconds since the last turn
+# Embeddings for retrieval, must match the dimension of DocumentSection.embedding
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_DIMENSIONS = 768
+EMBEDDING_TIMEOUT = httpx.Timeout(float(os.getenv("EMBEDDING_TIMEOUT", "60")), connect=5)
+
+# Returned when Ollama reports no models at all
+DEFAULT_MODEL = {
+    "id": "llama2",
+    "name": "llama2",
+    "modified_at": "2023-01-01T00:00:00Z",
+    "size": 0
+}
 
 class OllamaError(Exception):
-    def __init__(self, message: str):
+    def __init__(self, message: str, status_code: Optional[int] = None):
         self.message = message
+        self.status_code = status_code  # HTTP status of the upstream, when it answered
         super().__init__(self.message)
 
 
+class ModelListParseError(OllamaError):
+    """An Ollama model list whose entries could not be read"""
+
+
+_DEFAULT_TTL = object()
+
+
+class StaleWhileRevalidateCache:
+    """
+    Small in-process cache for upstream metadata.
+
+    A fresh entry is returned as is. A stale entry is still returned right away
+    while a single background task refreshes it; only a missing entry makes the
+    caller wait for the upstream. Failed refreshes keep serving the stale value.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: Any = _DEFAULT_TTL) -> Any:
+        """Return the cached value for ``key``; ``ttl=None`` keeps it until evicted or invalidated"""
+        if ttl is _DEFAULT_TTL:
+            ttl = self.ttl
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            value = await fetch()
+            self._store(key, value, ttl)
+            return value
+
+        value, expires_at = entry
+        self._entries.move_to_end(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.stale_hits += 1
+            if key not in self._refreshing:
+                self._refreshing[key] = asyncio.create_task(self._refresh(key, fetch, ttl))
+        else:
+            self.hits += 1
+        return value
+
+    async def refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: Any = _DEFAULT_TTL) -> Any:
+        """Fetch ``key`` now, whatever the age of the cached value, and cache the result"""
+        if ttl is _DEFAULT_TTL:
+            ttl = self.ttl
+        value = await fetch()
+        self._store(key, value, ttl)
+        return value
+
+    async def _refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: Optional[float]):
+        try:
+            self._store(key, await fetch(), ttl)
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh of {key} failed, serving stale data: {str(e)}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshing),
+            "refresh_errors": self.refresh_errors,
+        }
+
+    async def aclose(self):
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        self._refreshing.clear()
+
+
+model_cache = StaleWhileRevalidateCache(MODEL_CACHE_TTL, MODEL_CACHE_MAX_ENTRIES)
+# Model names that were still missing after a fresh list, with when they may be looked up again
+_model_misses: "OrderedDict[str, float]" = OrderedDict()
+backend_pool = BackendPool(OLLAMA_HOSTS)
+# Identical upstream calls that overlap (cache misses, refreshes, embeddings) share one request
+upstream_flights = {name: SingleFlight(name) for name in ("models", "model_details", "embeddings")}
+
+
+class SessionContextStore:
+    """
+    LRU of the ``context`` token arrays returned at the end of an Ollama
+    generation, one per chat session.
+
+    An entry is only reused for the model and system prompt it was produced
+    with; a turn with a different model or system prompt drops it, so the
+    caller falls back to re-sending the conversation.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _system_hash(system_prompt: str) -> str:
+        return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+    def get(self, session_id: int, model: str, system_prompt: str) -> Optional[List[int]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry_model, system_hash, context, expires_at = entry
+        if entry_model != model or system_hash != self._system_hash(system_prompt):
+            del self._entries[session_id]
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        if expires_at <= time.monotonic():
+            del self._entries[session_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return context.tolist()
+
+    def put(self, session_id: int, model: str, system_prompt: str, context: List[int]):
+        if self.max_entries <= 0 or not context:
+            return
+        # array("i") keeps a long context at 4 bytes per token instead of a list of ints
+        self._entries[session_id] = (
+            model,
+            self._system_hash(system_prompt),
+            array("i", context),
+            time.monotonic() + self.ttl,
+        )
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, session_id: Optional[int] = None):
+        if session_id is None:
+            self._entries.clear()
+        elif self._entries.pop(session_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "context_tokens": sum(len(entry[2]) for entry in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+
+session_contexts = SessionContextStore(SESSION_CONTEXT_MAX_ENTRIES, SESSION_CONTEXT_TTL)
+
+
+def _lm_studio_delta(event: SSEEvent) -> Optional[str]:
+    """Extract the content delta from an OpenAI-style chat completion chunk"""
+    if event.data == "[DONE]":
+        return None
+    try:
+        data = json.loads(event.data)
+    except json.JSONDecodeError:
+        logger.error(f"JSON decode error for: {event.data}")
+        return None
+    choices = data.get("choices")
+    if choices and choices[0].get("delta"):
+        return choices[0]["delta"].get("content")
+    return None
+
+
+async def _upstream_tokens(
+    url: str,
+    body: Dict[str, Any],
+    is_lm_studio: bool,
+    final: Optional[Dict[str, Any]] = None
+) -> AsyncGenerator[str, None]:
+    """
+    Yield the text tokens of a streaming completion from the upstream. For
+    Ollama the closing ``done`` object (context, timings) is copied into ``final``.
+    """
+    client = upstream_clients.get(url)
+    with upstream_clients.track(url):
+        async with client.stream(
+            "POST",
+            url,
+            json=body,
+            headers={
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                "Cache-Control": "no-cache",
+                "Pragma": "no-cache",
+            },
+        ) as response:
+            if response.status_code != 200:
+                try:
+                    await response.aread()
+                    error_message = response.json().get("error", f"HTTP error {response.status_code}")
+                except Exception:
+                    error_message = f"HTTP error {response.status_code}"
+                raise OllamaError(error_message, response.status_code)
+            
+            if is_lm_studio:
+                # LMStudio uses OpenAI-style SSE format
+                decoder = SSEDecoder()
+                async for chunk in response.aiter_bytes():
+                    for event in decoder.feed(chunk):
+                        content = _lm_studio_delta(event)
+                        if content:
+                            yield content
+                for event in decoder.flush():
+                    content = _lm_studio_delta(event)
+                    if content:
+                        yield content
+            else:
+                # Ollama streams newline-delimited JSON, lines may span chunks
+                decoder = NDJSONDecoder()
+                async for chunk in response.aiter_bytes():
+                    for data in decoder.feed(chunk):
+                        if data.get("response"):
+                            yield data["response"]
+                        if data.get("done") and final is not None:
+                            final.update(data)
+                for data in decoder.flush():
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done") and final is not None:
+                        final.update(data)
+
+
+def _is_backend_failure(error: Exception) -> bool:
+    """Errors that say the node is unwell, as opposed to a bad request"""
+    if isinstance(error, OllamaError):
+        return error.status_code is not None and error.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+async def _routed_tokens(model: str, body: Dict[str, Any], final: Dict[str, Any]) -> AsyncGenerator[str, None]:
+    """
+    Ollama completion tokens from the node picked by backend_pool. A node that
+    fails before the first token (connection refused, 5xx, model missing
+    there) is skipped and the next one is tried; after that errors propagate.
+    """
+    tried: List[Backend] = []
+    while True:
+        backend = backend_pool.pick(model, exclude=tried)
+        tried.append(backend)
+        tokens = _upstream_tokens(f"{backend.url}/api/generate", body, False, final)
+        started = False
+        backend_pool.begin(backend)
+        try:
+            async for token in tokens:
+                started = True
+                yield token
+            backend_pool.succeeded(backend, model)
+            return
+        except (httpx.TransportError, OllamaError) as e:
+            if _is_backend_failure(e):
+                backend_pool.failed(backend, e)
+            retryable = _is_backend_failure(e) or getattr(e, "status_code", None) == 404
+            if started or not retryable or len(tried) >= len(backend_pool.backends):
+                raise
+            backend_pool.retries += 1
+            logger.warning(f"Ollama backend {backend.url} failed before the first token, retrying elsewhere: {str(e)}")
+        finally:
+            backend_pool.end(backend)
+            await tokens.aclose()
+
+
+async def _routed_request(model: Optional[str], send: Callable[[Backend], Awaitable[Any]]) -> Any:
+    """
+    ``send(backend)`` for a one-shot request, routed and retried on the next
+    node like a chat before its first token
+    """
+    tried: List[Backend] = []
+    while True:
+        backend = backend_pool.pick(model, exclude=tried)
+        tried.append(backend)
+        backend_pool.begin(backend)
+        try:
+            result = await send(backend)
+        except (httpx.TransportError, OllamaError) as e:
+            if _is_backend_failure(e):
+                backend_pool.failed(backend, e)
+            retryable = _is_backend_failure(e) or getattr(e, "status_code", None) == 404
+            if not retryable or len(tried) >= len(backend_pool.backends):
+                raise
+            backend_pool.retries += 1
+            logger.warning(f"Ollama backend {backend.url} failed, retrying elsewhere: {str(e)}")
+        else:
+            backend_pool.succeeded(backend)
+            return result
+        finally:
+            backend_pool.end(backend)
+
+
+class ChatStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that always closes its body generator when the response
+    ends, so the upstream stops generating as soon as the client is gone.
+
+    On a client disconnect Starlette cancels the loop that sends the body. When
+    that loop was blocked in ``send()`` the generator is left suspended at a
+    ``yield`` and, without this, would hold the upstream stream open until it
+    is garbage collected.
+
+    ``release()`` and ``on_complete("", True)`` are called when the response
+    ends, however it ends. Closing a generator that never started skips its
+    ``finally``, so the body cannot be relied on to do it. Both must be safe to
+    call again after the body did (see ``_once``).
+    """
+
+    def __init__(
+        self, *args, release: Optional[Callable[[], None]] = None,
+        on_complete: Optional[Callable[[str, bool], None]] = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.release = release
+        self.on_complete = on_complete
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                with anyio.CancelScope(shield=True):
+                    await self.body_iterator.aclose()
+            finally:
+                try:
+                    if self.release is not None:
+                        self.release()
+                finally:
+                    if self.on_complete is not None:
+                        self.on_complete("", True)
+
+
+def _once(on_complete: Callable[[str, bool], None]) -> Callable[[str, bool], None]:
+    """``on_complete`` that only runs the first time it is called and logs its errors"""
+    called = False
+
+    def complete(reply: str, aborted: bool):
+        nonlocal called
+        if called:
+            return
+        called = True
+        try:
+            on_complete(reply, aborted)
+        except Exception as e:
+            logger.error(f"Error in stream completion callback: {str(e)}")
+
+    return complete
+
+
+def _chat_response(
+    tokens: AsyncGenerator[bytes, None], sse: bool, release: Optional[Callable[[], None]] = None,
+    on_complete: Optional[Callable[[str, bool], None]] = None
+) -> ChatStreamingResponse:
+    if sse:
+        # Proxies such as nginx would otherwise buffer the events
+        return ChatStreamingResponse(
+            coalesce(tokens, sse=True), media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, release=release, on_complete=on_complete,
+        )
+    return ChatStreamingResponse(coalesce(tokens), media_type="text/plain", release=release, on_complete=on_complete)
+
+
+async def _replay_cached(chunks, on_complete: Optional[Callable[[str, bool], None]]) -> AsyncGenerator[bytes, None]:
+    """Stream a cached reply with the chunking of the original stream"""
+    sent = 0
+    try:
+        for chunk in chunks:
+            yield chunk
+            sent += 1
+    finally:
+        if on_complete is not None:
+            on_complete(b"".join(chunks[:sent]).decode("utf-8"), sent < len(chunks))
+
+
 async def ollama_stream(
     model: str,
     system_prompt: str,
     temperature: float,
-    prompt: str
+    prompt: str,
+    on_complete: Optional[Callable[[str, bool], None]] = None,
+    session_id: Optional[int] = None,
+    load_history: Optional[Callable[[], Awaitable[List[Dict[str, str]]]]] = None,
+    release: Optional[Callable[[], None]] = None,
+    sse: bool = False
 ) -> StreamingResponse:
+    """
+    Stream a completion from Ollama or LMStudio.
+    
+    ``on_complete(reply, aborted)`` is called once the stream ends, with the text
+    generated so far and whether the stream was cut short (client disconnect or
+    upstream error). It runs after the last token, never on the token path, and
+    with ``("", True)`` when the body was never streamed.
+    
+    With ``session_id`` the turn is session-aware: ``prompt`` is only the new
+    turn. Ollama continues from the context saved after the session's previous
+    turn, so only the new tokens are prefilled. Without a usable context the
+    earlier turns returned by ``load_history()`` (``{"role", "content"}`` dicts)
+    are sent along.
+    
+    ``release()`` is called as soon as the upstream is no longer generating for
+    this request: when the stream ends, or right away for a cached reply. The
+    response calls it again when it ends, so it must be idempotent; that also
+    covers a response whose body was never iterated.
+    
+    When the client disconnects or the response is cancelled the upstream
+    request is closed right away, which makes Ollama stop generating.
+    
+    Tokens are coalesced into fewer writes (see app.utils.stream_coalescer)
+    and sent as plain text, or as Server-Sent Events with ``sse``.
+    """
     # Determine if we should use LMStudio or Ollama
     is_lm_studio = OLLAMA_HOST == LMSTUDIO_HOST
     
     # Set the appropriate URL based on whether we're using LMStudio or Ollama
     url = f"{LMSTUDIO_HOST}/v1/chat/completions" if is_lm_studio else f"{OLLAMA_HOST}/api/generate"
     
+    context = history = None
+    if session_id is not None and not is_lm_studio:
+        context = session_contexts.get(session_id, model, system_prompt)
+    if context is None and load_history is not None:
+        history = await load_history()
+    
     # Create the appropriate request body based on the API
     body = (
         {
             "model": model,
             "messages": [
                 {"role": "system", "content": system_prompt},
+                *(history or []),
                 {"role": "user", "content": prompt}
             ],
             "temperature": temperature,
@@ -55,70 +538,72 @@ async def ollama_stream(
             },
         }
     )
+    if context is not None:
+        # The system prompt and earlier turns are already part of the context
+        body["context"] = context
+        del body["system"]
+    elif history and not is_lm_studio:
+        # Same flattening the frontend uses when it sends the whole conversation
+        body["prompt"] = " ".join([message["content"] for message in history] + [prompt])
+    
+    if on_complete is not None:
+        on_complete = _once(on_complete)
+
+    # Deterministic one-shot prompts can be answered from the response cache.
+    # Session-aware turns depend on the conversation, so they are never cached.
+    cache_key = None
+    if session_id is None and response_cache.cacheable(model, temperature):
+        digest = None
+        if not is_lm_studio:
+            try:
+                await get_ollama_models()
+            except OllamaError:
+                pass
+            digest = _model_digest(model)
+        cache_key = response_cache.key(model, digest, system_prompt, prompt, {"temperature": temperature}, url)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            if release is not None:
+                release()
+            return _chat_response(_replay_cached(cached, on_complete), sse, on_complete=on_complete)
     
     try:
         async def generate() -> AsyncGenerator[bytes, None]:
-            async with httpx.AsyncClient(timeout=API_TIMEOUT_DURATION / 1000) as client:
-                async with client.stream(
-                    "POST",
-                    url,
-                    json=body,
-                    headers={
-                        "Accept": "application/json",
-                        "Content-Type": "application/json",
-                        "Cache-Control": "no-cache",
-                        "Pragma": "no-cache",
-                    },
-                ) as response:
-                    if response.status_code != 200:
-                        try:
-                            error_data = await response.json()
-                            error_message = error_data.get("error", f"HTTP error {response.status_code}")
-                            raise OllamaError(error_message)
-                        except:
-                            raise OllamaError(f"HTTP error {response.status_code}")
-                    
-                    if is_lm_studio:
-                        # LMStudio uses OpenAI-style SSE format
-                        buffer = ""
-                        async for chunk in response.aiter_text():
-                            buffer += chunk
-                            while "data: " in buffer:
-                                parts = buffer.split("data: ", 1)
-                                if len(parts) != 2:
-                                    break
-                                
-                                pre, rest = parts
-                                buffer = rest
-                                
-                                newline_pos = buffer.find("\n")
-                                if newline_pos == -1:
-                                    break
-                                
-                                data_line = buffer[:newline_pos].strip()
-                                buffer = buffer[newline_pos + 1:]
-                                
-                                if data_line == "[DONE]":
-                                    continue
-                                
-                                try:
-                                    data = json.loads(data_line)
-                                    if data.get("choices") and data["choices"][0].get("delta") and data["choices"][0]["delta"].get("content"):
-                                        content = data["choices"][0]["delta"]["content"]
-                                        yield content.encode("utf-8")
-                                except json.JSONDecodeError:
-                                    logger.error(f"JSON decode error for: {data_line}")
-                    else:
-                        # Original Ollama streaming logic
-                        async for chunk in response.aiter_text():
-                            try:
-                                data = json.loads(chunk)
-                                if "response" in data:
-                                    yield data["response"].encode("utf-8")
-                            except json.JSONDecodeError:
-                                logger.error(f"JSON decode error for: {chunk}")
+            # Tee the tokens into a buffer so the reply can be handed to on_complete
+            reply = []
+            completed = False
+            outcome = "error"
+            final: Dict[str, Any] = {}
+            timer = StreamTimer(model)
+            tokens = _upstream_tokens(url, body, True, final) if is_lm_studio else _routed_tokens(model, body, final)
+            try:
+                async for token in tokens:
+                    if timer.first_token_at is None:
+                        timer.first_token_at = time.perf_counter()
+                    reply.append(token)
+                    yield token.encode("utf-8")
+                completed = True
+                outcome = "completed"
+            except (GeneratorExit, asyncio.CancelledError):
+                outcome = "disconnected"
+                logger.info(f"Client went away, stopping {model} after {len(reply)} tokens")
+                raise
+            finally:
+                # Closing the upstream request is what makes Ollama stop; the
+                # shield keeps a repeated cancellation from skipping it
+                with anyio.CancelScope(shield=True):
+                    await tokens.aclose()
+                timer.finish(len(reply), outcome)
+                if release is not None:
+                    release()
+                if session_id is not None and completed and final.get("context"):
+                    session_contexts.put(session_id, model, system_prompt, final["context"])
+                if cache_key is not None and completed:
+                    response_cache.put(cache_key, [token.encode("utf-8") for token in reply])
+                if on_complete is not None:
+                    on_complete("".join(reply), not completed)
                                 
-        return StreamingResponse(generate(), media_type="text/event-stream")
+        return _chat_response(generate(), sse, release, on_complete)
         
     except httpx.RequestError as e:
         host = LMSTUDIO_HOST if is_lm_studio else OLLAMA_HOST
@@ -127,103 +612,199 @@ async def ollama_stream(
         raise OllamaError(f"Error: {str(e)}")
 
 
-async def get_ollama_models():
-    # Determine if we should use LMStudio or Ollama
-    is_lm_studio = OLLAMA_HOST == LMSTUDIO_HOST
-    
-    # Set the appropriate URL based on whether we're using LMStudio or Ollama
-    url = f"{LMSTUDIO_HOST}/v1/models" if is_lm_studio else f"{OLLAMA_HOST}/api/tags"
-    
+def _fetch_models_once():
+    return upstream_flights["models"].do(OLLAMA_HOST, _fetch_ollama_models)
+
+
+async def get_ollama_models(refresh: bool = False):
+    """Model list served from the stale-while-revalidate cache; ``refresh`` fetches it first"""
+    try:
+        if refresh:
+            models = await model_cache.refresh("models", _fetch_models_once)
+        else:
+            models = await model_cache.get("models", _fetch_models_once)
+    except ModelListParseError:
+        if model_cache.peek("models") is not None:
+            raise
+        # Nothing cached to fall back on; the default is not cached so the next call asks again
+        logger.warning("Unreadable model list, providing default model")
+        return [dict(DEFAULT_MODEL)]
+    if not models and OLLAMA_HOST != LMSTUDIO_HOST:
+        logger.warning("No models found, providing default model")
+        return [dict(DEFAULT_MODEL)]
+    return models
+
+
+async def _fetch_ollama_models():
+    if OLLAMA_HOST == LMSTUDIO_HOST:
+        url = f"{LMSTUDIO_HOST}/v1/models"
+        try:
+            return await _fetch_model_list(url, True)
+        except OllamaError:
+            raise
+        except Exception as e:
+            logger.error(f"Request error: {str(e)}")
+            raise OllamaError(f"Error connecting to {url}: {str(e)}")
+
+    # Every node can have different models pulled, so the list is the union of theirs
+    backends = [backend for backend in backend_pool.backends if backend.available] or list(backend_pool.backends)
+    results = await asyncio.gather(*(_node_model_list(backend) for backend in backends), return_exceptions=True)
+    merged: Dict[str, Dict[str, Any]] = {}
+    errors = []
+    unreadable = 0
+    for backend, result in zip(backends, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            errors.append(f"{backend.url}: {str(result)}")
+            unreadable += isinstance(result, ModelListParseError)
+            continue
+        for model in result:
+            # Backends are in OLLAMA_HOST order, so a model whose copies differ always gets
+            # the same digest and the response cache key does not depend on who answered
+            merged.setdefault(model["name"], model)
+    if unreadable == len(backends):
+        raise ModelListParseError(f"Error reading the model list: {'; '.join(errors)}")
+    if len(errors) == len(backends):
+        raise OllamaError(f"Error connecting to Ollama: {'; '.join(errors)}")
+    if errors:
+        logger.warning(f"Model list without the backends that failed: {'; '.join(errors)}")
+    logger.info(f"Returning {len(merged)} models")
+    return list(merged.values())
+
+
+async def _node_model_list(backend: Backend) -> List[Dict[str, Any]]:
+    """/api/tags of one backend, counted like any other request to it"""
+    backend_pool.begin(backend)
+    try:
+        models = await _fetch_model_list(f"{backend.url}/api/tags", False)
+    except Exception as e:
+        if _is_backend_failure(e):
+            backend_pool.failed(backend, e)
+        raise
+    finally:
+        backend_pool.end(backend)
+    backend_pool.succeeded(backend)
+    return models
+
+
+async def _fetch_model_list(url: str, is_lm_studio: bool) -> List[Dict[str, Any]]:
+    """
+    Models listed by one upstream. Raises OllamaError with the status code for
+    an error response and lets transport errors through, so callers can tell
+    a node failure from a bad answer.
+    """
     logger.info(f"Fetching models from: {url}")
-    
+    client = upstream_clients.get(url)
+    with upstream_clients.track(url):
+        logger.info(f"Sending GET request to {url}")
+        response = await client.get(url, timeout=METADATA_TIMEOUT)
+        logger.info(f"Response status code: {response.status_code}")
+
+    if response.status_code != 200:
+        error_msg = f"API returned error {response.status_code}"
+        try:
+            error_data = response.json()
+            if "error" in error_data:
+                error_msg = f"{error_msg}: {error_data['error']}"
+        except Exception:
+            pass
+        logger.error(f"Error response from {url}: {error_msg}")
+        raise OllamaError(error_msg, response.status_code)
+
     try:
-        timeout_seconds = 10
-        logger.info(f"Creating httpx client with timeout of {timeout_seconds} seconds")
-        async with httpx.AsyncClient(timeout=timeout_seconds) as client:
-            try:
-                logger.info(f"Sending GET request to {url}")
-                response = await client.get(url)
-                logger.info(f"Response status code: {response.status_code}")
-                
-                if response.status_code != 200:
-                    error_msg = f"API returned error {response.status_code}"
-                    try:
-                        error_data = response.json()
-                        if "error" in error_data:
-                            error_msg = f"{error_msg}: {error_data['error']}"
-                    except:
-                        pass
-                    logger.error(f"Error response: {error_msg}")
-                    raise OllamaError(error_msg)
-                
-                try:
-                    data = response.json()
-                    logger.info(f"Received data: {str(data)[:200]}...")
-                except Exception as e:
-                    logger.error(f"Failed to parse JSON response: {str(e)}")
-                    raise OllamaError(f"Failed to parse response from {url}: {str(e)}")
-                
-                # Since we don't have access to actual Ollama
-                # Let's provide some mock data as a fallback
-                if is_lm_studio:
-                    # Handle LMStudio models format which follows OpenAI format
-                    models = [
-                        {
-                            "id": model["id"],
-                            "name": model["id"],
-                            "modified_at": "2023-01-01T00:00:00Z",  # LMStudio doesn't provide modified date
-                            "size": 0  # LMStudio doesn't provide model size
-                        }
-                        for model in data.get("data", [])
-                    ]
-                else:
-                    # Handle Ollama models format
-                    try:
-                        models = [
-                            {
-                                "id": model["name"],
-                                "name": model["name"],
-                                "modified_at": model.get("modified_at", "2023-01-01T00:00:00Z"),
-                                "size": model.get("size", 0)
-                            }
-                            for model in data.get("models", [])
-                        ]
-                        # If no models are found, provide a default model
-                        if not models:
-                            logger.warning("No models found, providing default model")
-                            models = [
-                                {
-                                    "id": "llama2",
-                                    "name": "llama2",
-                                    "modified_at": "2023-01-01T00:00:00Z",
-                                    "size": 0
-                                }
-                            ]
-                    except Exception as e:
-                        logger.error(f"Error parsing models: {str(e)}")
-                        # Provide a fallback model
-                        models = [
-                            {
-                                "id": "llama2",
-                                "name": "llama2",
-                                "modified_at": "2023-01-01T00:00:00Z", 
-                                "size": 0
-                            }
-                        ]
-                
-                logger.info(f"Returning {len(models)} models")
-                return models
-            except Exception as e:
-                logger.error(f"Request error: {str(e)}")
-                logger.error(traceback.format_exc())
-                raise OllamaError(f"Error connecting to {url}: {str(e)}")
+        data = response.json()
+        logger.debug(f"Received data: {str(data)[:200]}...")
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        logger.error(traceback.format_exc())
-        raise OllamaError(f"Unexpected error: {str(e)}")
+        logger.error(f"Failed to parse JSON response: {str(e)}")
+        raise OllamaError(f"Failed to parse response from {url}: {str(e)}")
+
+    if is_lm_studio:
+        # Handle LMStudio models format which follows OpenAI format
+        return [
+            {
+                "id": model["id"],
+                "name": model["id"],
+                "modified_at": "2023-01-01T00:00:00Z",  # LMStudio doesn't provide modified date
+                "size": 0  # LMStudio doesn't provide model size
+            }
+            for model in data.get("data", [])
+        ]
+    # Handle Ollama models format
+    try:
+        return [
+            {
+                "id": model["name"],
+                "name": model["name"],
+                "modified_at": model.get("modified_at", "2023-01-01T00:00:00Z"),
+                "size": model.get("size", 0),
+                "digest": model.get("digest")
+            }
+            for model in data.get("models", [])
+        ]
+    except Exception as e:
+        # Not cached; callers fall back only when there is no earlier list
+        logger.error(f"Error parsing models: {str(e)}")
+        raise ModelListParseError(f"Failed to parse models from {url}: {str(e)}")
+
+
+def _model_digest(model_name: str) -> Optional[str]:
+    """Digest of a model from the cached model list, if known"""
+    for model in model_cache.peek("models") or []:
+        if model.get("name") in (model_name, f"{model_name}:latest"):
+            return model.get("digest")
+    return None
+
+
+def _lists_model(models: List[Dict[str, Any]], name: str) -> bool:
+    return any((model.get("name") or "").removesuffix(":latest") == name for model in models)
+
+
+async def is_known_model(model_name: str) -> bool:
+    """
+    Whether ``model_name`` is in the model list (a missing tag means ``latest``);
+    raises OllamaError without a list. A name the cached list lacks may have been
+    pulled since, so the list is fetched again, at most once per MODEL_MISS_TTL
+    for that name.
+    """
+    name = model_name.removesuffix(":latest")
+    if _lists_model(await get_ollama_models(), name):
+        return True
+    now = time.monotonic()
+    if _model_misses.get(name, 0.0) > now:
+        return False
+    _model_misses[name] = now + MODEL_MISS_TTL
+    _model_misses.move_to_end(name)
+    while len(_model_misses) > MODEL_CACHE_MAX_ENTRIES:
+        _model_misses.popitem(last=False)
+    try:
+        models = await get_ollama_models(refresh=True)
+    except OllamaError as e:
+        # The cached list still answers
+        logger.warning(f"Could not refresh the model list for {model_name}: {str(e)}")
+        return False
+    if _lists_model(models, name):
+        _model_misses.pop(name, None)
+        return True
+    return False
 
 
 async def get_model_details(model_name: str):
+    """
+    Model details are cached per (name, digest), so they stay valid until the
+    model itself changes. Without a known digest the regular TTL applies.
+    """
+    if OLLAMA_HOST == LMSTUDIO_HOST:
+        return await _fetch_model_details(model_name)
+    digest = _model_digest(model_name)
+    return await model_cache.get(
+        ("details", model_name, digest),
+        lambda: upstream_flights["model_details"].do((OLLAMA_HOST, model_name), lambda: _fetch_model_details(model_name)),
+        ttl=None if digest else MODEL_CACHE_TTL
+    )
+
+
+async def _fetch_model_details(model_name: str):
     # Determine if we should use LMStudio or Ollama
     is_lm_studio = OLLAMA_HOST == LMSTUDIO_HOST
     
@@ -239,17 +820,104 @@ async def get_model_details(model_name: str):
         }
         
     # For Ollama, get the model details
-    url = f"{OLLAMA_HOST}/api/show"
+    async def show(backend: Backend):
+        url = f"{backend.url}/api/show"
+        client = upstream_clients.get(url)
+        with upstream_clients.track(url):
+            response = await client.post(url, json={"name": model_name}, timeout=METADATA_TIMEOUT)
+        if response.status_code != 200:
+            raise OllamaError(f"API returned error {response.status_code}", response.status_code)
+        return response.json()
+
+    try:
+        return await _routed_request(model_name, show)
+    except OllamaError:
+        raise
+    except httpx.RequestError as e:
+        raise OllamaError(f"Connection error: Could not connect to Ollama at {OLLAMA_HOST}. {str(e)}")
+    except Exception as e:
+        raise OllamaError(f"Error: {str(e)}") 
+
+async def get_embeddings(texts: List[str], model: Optional[str] = None, lookup: bool = True) -> List[List[float]]:
+    """
+    Embed ``texts``, serving what it can from the embedding cache and sending
+    the remaining distinct texts upstream in one call. ``lookup=False`` skips
+    the cache read for callers that already know the texts are misses; the
+    results are stored either way.
+    """
+    model = model or EMBEDDING_MODEL
+    if not texts:
+        return []
+    hashes = [text_hash(text) for text in texts]
+    found = await embedding_cache.get_many(model, hashes) if lookup else {}
+    missing: Dict[str, str] = {}
+    for digest, text in zip(hashes, texts):
+        if digest not in found:
+            missing.setdefault(digest, text)
+    if missing:
+        async def fetch() -> Dict[str, List[float]]:
+            embedded = dict(zip(missing, await _request_embeddings(list(missing.values()), model)))
+            await embedding_cache.put_many(model, embedded)
+            return embedded
+
+        found.update(await upstream_flights["embeddings"].do((model, tuple(missing)), fetch))
+    else:
+        embedding_cache.upstream_calls_saved += 1
+    return [found[digest] for digest in hashes]
+
+
+async def _request_embeddings(texts: List[str], model: str) -> List[List[float]]:
+    """
+    Embed ``texts`` in one upstream call. Uses Ollama's batched /api/embed and
+    falls back to one /api/embeddings call per text on Ollama versions without
+    it; LMStudio goes through its OpenAI-style /v1/embeddings.
+    """
+    embedding_cache.upstream_calls += 1
+    is_lm_studio = OLLAMA_HOST == LMSTUDIO_HOST
+    backend = None if is_lm_studio else backend_pool.pick(model)
+    host = LMSTUDIO_HOST if is_lm_studio else backend.url
+    url = f"{host}/v1/embeddings" if is_lm_studio else f"{host}/api/embed"
     
+    if backend is not None:
+        backend_pool.begin(backend)
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(url, json={"name": model_name})
-            
-            if response.status_code != 200:
-                raise OllamaError(f"API returned error {response.status_code}")
+        client = upstream_clients.get(url)
+        with upstream_clients.track(url):
+            response = await client.post(url, json={"model": model, "input": texts}, timeout=EMBEDDING_TIMEOUT)
             
-            return response.json()
+            if response.status_code == 404 and not is_lm_studio and "model" not in response.text:
+                # Ollama before 0.3 only has the single-prompt endpoint
+                embeddings = []
+                legacy_url = f"{host}/api/embeddings"
+                for text in texts:
+                    legacy = await client.post(legacy_url, json={"model": model, "prompt": text}, timeout=EMBEDDING_TIMEOUT)
+                    if legacy.status_code != 200:
+                        raise OllamaError(f"API returned error {legacy.status_code}: {legacy.text[:200]}")
+                    embeddings.append(legacy.json()["embedding"])
+            elif response.status_code != 200:
+                raise OllamaError(f"API returned error {response.status_code}: {response.text[:200]}")
+            elif is_lm_studio:
+                embeddings = [item["embedding"] for item in sorted(response.json()["data"], key=lambda item: item["index"])]
+            else:
+                embeddings = response.json()["embeddings"]
+    except OllamaError:
+        raise
     except httpx.RequestError as e:
-        raise OllamaError(f"Connection error: Could not connect to Ollama at {OLLAMA_HOST}. {str(e)}")
+        if backend is not None:
+            backend_pool.failed(backend, e)
+        raise OllamaError(f"Connection error: Could not connect to {'LMStudio' if is_lm_studio else 'Ollama'} at {host}. {str(e)}")
     except Exception as e:
-        raise OllamaError(f"Error: {str(e)}") 
\ No newline at end of file
+        raise OllamaError(f"Error: {str(e)}")
+    finally:
+        if backend is not None:
+            backend_pool.end(backend)
+    
+    if len(embeddings) != len(texts):
+        raise OllamaError(f"Expected {len(texts)} embeddings from {model}, got {len(embeddings)}")
+    for embedding in embeddings:
+        if len(embedding) != EMBEDDING_DIMENSIONS:
+            raise OllamaError(
+                f"Embedding model {model} returned {len(embedding)} dimensions, "
+                f"DocumentSection.embedding expects {EMBEDDING_DIMENSIONS}"
+            )
+    return embeddings
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import time
+import logging
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Any, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Opt-in cache of complete replies to deterministic (temperature 0) prompts
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Comma separated model name patterns (fnmatch) that are never cached, e.g. "llava*,*:latest"
+RESPONSE_CACHE_BYPASS_MODELS = os.getenv("RESPONSE_CACHE_BYPASS_MODELS", "")
+
+
+class ResponseCache:
+    """
+    Byte-budgeted TTL/LRU cache of streamed replies.
+
+    A reply is stored as the tuple of chunks it was streamed in, so a hit can be
+    replayed with the same framing as the original stream. The budget counts the
+    bytes of the chunks; the least recently used replies are evicted first.
+    """
+
+    def __init__(self, enabled: bool, max_bytes: int, ttl: float, bypass_models: str = ""):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bypass_patterns = [pattern.strip() for pattern in bypass_models.split(",") if pattern.strip()]
+        self._entries: "OrderedDict[str, Tuple[Tuple[bytes, ...], int, float]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_served = 0
+
+    @staticmethod
+    def key(model: str, digest: Optional[str], system: Optional[str], prompt: str, options: Dict[str, Any], upstream: str = "") -> str:
+        payload = json.dumps([upstream, model, digest, system, prompt, options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, model: str, temperature: float) -> bool:
+        """Only deterministic requests to models without a bypass rule are cached"""
+        if not self.enabled or self.max_bytes <= 0:
+            return False
+        if temperature != 0 or any(fnmatchcase(model, pattern) for pattern in self.bypass_patterns):
+            self.bypassed += 1
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[Tuple[bytes, ...]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        chunks, size, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_served += size
+        return chunks
+
+    def put(self, key: str, chunks: List[bytes]):
+        size = sum(len(chunk) for chunk in chunks)
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (tuple(chunks), size, time.monotonic() + self.ttl)
+        self.bytes += size
+        self.stores += 1
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "bypass_models": self.bypass_patterns,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes_served": self.bytes_served,
+        }
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_BYPASS_MODELS,
+)
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import String, cast, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import AsyncSessionLocal
+from app.models.models import BusinessDocument, DocumentSection
+from app.utils.vector_index import vector_index
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Candidate list size of the HNSW scan; raised to top_k when a larger k is asked for
+RETRIEVAL_EF_SEARCH = int(os.getenv("RETRIEVAL_EF_SEARCH", "40"))
+# Filters are applied after the index scan, so filtered searches look at more candidates
+RETRIEVAL_FILTER_EF_FACTOR = int(os.getenv("RETRIEVAL_FILTER_EF_FACTOR", "4"))
+# Lists probed when the index is IVFFlat (pgvector before 0.5)
+RETRIEVAL_IVFFLAT_PROBES = int(os.getenv("RETRIEVAL_IVFFLAT_PROBES", "10"))
+# Upper bound of hnsw.ef_search accepted by pgvector
+MAX_EF_SEARCH = 1000
+# "pgvector", "numpy" (in-process index) or "auto" to use pgvector whenever the column has its type
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto").lower()
+
+# Whether document_sections.embedding is a pgvector column, checked once
+_pgvector_column: Optional[bool] = None
+
+
+async def uses_pgvector(db: AsyncSession) -> bool:
+    global _pgvector_column
+    if VECTOR_BACKEND != "auto":
+        return VECTOR_BACKEND == "pgvector"
+    if _pgvector_column is None:
+        # Without the extension create_tables leaves the column as TEXT
+        result = await db.execute(text(
+            "SELECT udt_name FROM information_schema.columns "
+            "WHERE table_name = 'document_sections' AND column_name = 'embedding'"
+        ))
+        _pgvector_column = result.scalar() == "vector"
+        if not _pgvector_column:
+            logger.warning("document_sections.embedding is not a pgvector column, using the in-process vector index")
+    return _pgvector_column
+
+
+async def in_process_index_used() -> bool:
+    """Whether searches go to the in-process vector index, i.e. it has to be kept in sync"""
+    async with AsyncSessionLocal() as db:
+        return not await uses_pgvector(db)
+
+
+def _document_filter(query, status: Optional[str], tags: Optional[List[str]]):
+    if status:
+        query = query.where(BusinessDocument.status == status)
+    if tags:
+        # tags is a generic ARRAY column, which has no overlap() comparator
+        query = query.where(BusinessDocument.tags.op("&&")(cast(tags, ARRAY(String))))
+    return query
+
+
+def _ef_search(top_k: int, filtered: bool) -> int:
+    ef = max(RETRIEVAL_EF_SEARCH, top_k)
+    if filtered:
+        ef *= RETRIEVAL_FILTER_EF_FACTOR
+    return min(ef, MAX_EF_SEARCH)
+
+
+async def search_sections(
+    db: AsyncSession,
+    embedding: List[float],
+    top_k: int,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    exact: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Top-k cosine search over DocumentSection.embedding, nearest first.
+
+    Served by the ANN index built in create_tables; ``exact=True`` disables
+    index scans for the transaction to get the exact ranking (used to measure
+    recall). ``status`` and ``tags`` filter on the parent BusinessDocument, a
+    section matches when its document has any of ``tags``. Without pgvector
+    the search runs on the in-process index, which is always exact.
+    """
+    if not await uses_pgvector(db):
+        return await _search_in_process(db, embedding, top_k, status, tags)
+
+    filtered = bool(status or tags)
+    if exact:
+        await db.execute(text("SET LOCAL enable_indexscan = off"))
+    else:
+        # SET does not take bind parameters, both values are integers
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {_ef_search(top_k, filtered)}"))
+        await db.execute(text(f"SET LOCAL ivfflat.probes = {RETRIEVAL_IVFFLAT_PROBES}"))
+
+    distance = DocumentSection.embedding.cosine_distance(embedding)
+    query = (
+        select(
+            DocumentSection.id,
+            DocumentSection.document_id,
+            DocumentSection.section_title,
+            DocumentSection.content,
+            BusinessDocument.title.label("document_title"),
+            distance.label("distance"),
+        )
+        .join(BusinessDocument, BusinessDocument.id == DocumentSection.document_id)
+        .where(DocumentSection.embedding.is_not(None))
+    )
+    query = _document_filter(query, status, tags)
+
+    result = await db.execute(query.order_by(distance).limit(top_k))
+    return [
+        {
+            "id": row.id,
+            "document_id": row.document_id,
+            "document_title": row.document_title,
+            "section_title": row.section_title,
+            "content": row.content,
+            "score": 1.0 - float(row.distance),
+        }
+        for row in result.all()
+    ]
+
+
+async def _search_in_process(
+    db: AsyncSession,
+    embedding: List[float],
+    top_k: int,
+    status: Optional[str],
+    tags: Optional[List[str]]
+) -> List[Dict[str, Any]]:
+    # Kept in sync by the background task started in the lifespan (in_process_index_used)
+    documents = None
+    if status or tags:
+        documents = (await db.execute(_document_filter(select(BusinessDocument.id), status, tags))).scalars().all()
+    # numpy releases the GIL during the matrix product, keep the event loop free meanwhile
+    hits = await asyncio.to_thread(vector_index.search, embedding, top_k, documents)
+    if not hits:
+        return []
+
+    result = await db.execute(
+        select(
+            DocumentSection.id,
+            DocumentSection.document_id,
+            DocumentSection.section_title,
+            DocumentSection.content,
+            BusinessDocument.title.label("document_title"),
+        )
+        .join(BusinessDocument, BusinessDocument.id == DocumentSection.document_id)
+        .where(DocumentSection.id.in_([section_id for section_id, _ in hits]))
+    )
+    rows = {row.id: row for row in result.all()}
+    # Sections deleted since the last sync are skipped
+    return [
+        {
+            "id": section_id,
+            "document_id": rows[section_id].document_id,
+            "document_title": rows[section_id].document_title,
+            "section_title": rows[section_id].section_title,
+            "content": rows[section_id].content,
+            "score": score,
+        }
+        for section_id, score in hits
+        if section_id in rows
+    ]
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import logging
+from typing import AsyncIterator, List, Optional
+
+import anyio
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Chat tokens are held for up to this many milliseconds and sent together (0 sends every token on its own)
+STREAM_COALESCE_WINDOW_MS = float(os.getenv("STREAM_COALESCE_WINDOW_MS", "15"))
+# Buffered bytes that trigger a send before the window is over
+STREAM_COALESCE_MAX_BYTES = int(os.getenv("STREAM_COALESCE_MAX_BYTES", "4096"))
+
+
+def sse_message(data: bytes, event: Optional[str] = None) -> bytes:
+    """One Server-Sent Events message; line breaks in ``data`` become separate data lines"""
+    lines = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n").split(b"\n")
+    message = b"".join([b"data: " + line + b"\n" for line in lines]) + b"\n"
+    if event:
+        return b"event: " + event.encode("utf-8") + b"\n" + message
+    return message
+
+
+class StreamCoalescer:
+    """
+    Re-chunks a stream of small byte strings (one per token) into fewer,
+    larger ones, so a chat stream costs one ASGI send and one socket write per
+    window instead of per token.
+
+    A task pumps ``chunks`` into a buffer; the consumer sends the first chunk
+    right away (time to first token is not delayed) and after that whatever
+    accumulated within ``window`` seconds of the oldest buffered chunk, or as
+    soon as ``max_bytes`` are buffered. The pump stops reading while a full
+    buffer waits to be sent. The rest is always sent at the end of the stream.
+    Closing the consumer cancels the pump and closes ``chunks``.
+
+    With ``sse`` every batch is sent as a Server-Sent Events message and an
+    ``event: done`` message follows the last one.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], window: float, max_bytes: int, sse: bool = False):
+        self.chunks = chunks
+        self.window = window
+        self.max_bytes = max_bytes
+        self.sse = sse
+        self._buffer: List[bytes] = []
+        self._size = 0
+        self._batch_started = 0.0
+        self._done = False
+        self._holding = False
+        self._waiter: Optional[asyncio.Future] = None
+        self._room: Optional[asyncio.Future] = None
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _pump(self):
+        loop = asyncio.get_running_loop()
+        try:
+            async for chunk in self.chunks:
+                if not self._buffer:
+                    self._batch_started = loop.time()
+                self._buffer.append(chunk)
+                self._size += len(chunk)
+                if self._size >= self.max_bytes:
+                    self._wake()
+                    self._room = loop.create_future()
+                    await self._room
+                elif not self._holding:
+                    self._wake()
+        finally:
+            self._done = True
+            self._wake()
+            await self.chunks.aclose()
+
+    async def _wait(self, timeout: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        self._waiter = loop.create_future()
+        self._holding = timeout is not None
+        handle = loop.call_later(timeout, self._wake) if timeout is not None else None
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+            self._holding = False
+            if handle is not None:
+                handle.cancel()
+
+    def _take(self) -> bytes:
+        data = b"".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        if self._room is not None and not self._room.done():
+            self._room.set_result(None)
+        return sse_message(data) if self.sse else data
+
+    async def stream(self):
+        loop = asyncio.get_running_loop()
+        pump = asyncio.create_task(self._pump())
+        try:
+            first = True
+            while True:
+                if not self._buffer and not self._done:
+                    await self._wait()
+                if self._buffer and not first and not self._done and self._size < self.max_bytes:
+                    remaining = self._batch_started + self.window - loop.time()
+                    if remaining > 0:
+                        await self._wait(remaining)
+                if self._buffer:
+                    first = False
+                    yield self._take()
+                elif self._done:
+                    break
+            # Re-raise an upstream error only after everything before it was sent
+            await pump
+            if self.sse:
+                yield sse_message(b"", "done")
+        finally:
+            if not pump.done():
+                pump.cancel()
+            with anyio.CancelScope(shield=True):
+                try:
+                    await pump
+                except BaseException:
+                    pass
+
+
+async def _sse_only(chunks: AsyncIterator[bytes]):
+    try:
+        async for chunk in chunks:
+            yield sse_message(chunk)
+        yield sse_message(b"", "done")
+    finally:
+        await chunks.aclose()
+
+
+def coalesce(chunks: AsyncIterator[bytes], sse: bool = False, window_ms: Optional[float] = None, max_bytes: Optional[int] = None):
+    """Body iterator for a token stream, coalesced per STREAM_COALESCE_WINDOW_MS and optionally SSE framed"""
+    window_ms = STREAM_COALESCE_WINDOW_MS if window_ms is None else window_ms
+    if window_ms <= 0:
+        return _sse_only(chunks) if sse else chunks
+    coalescer = StreamCoalescer(chunks, window_ms / 1000, STREAM_COALESCE_MAX_BYTES if max_bytes is None else max_bytes, sse)
+    return coalescer.stream()
@@ -0,0 +1,161 @@
+import json
+import logging
+from typing import Any, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Upper bound for a single buffered line, protects against a peer that never sends a newline
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+
+class StreamFramingError(Exception):
+    pass
+
+
+class LineFramer:
+    """
+    Incremental line splitter over raw bytes.
+
+    Network chunks are split on b"\\n" in place; only the unterminated tail of a
+    chunk is kept in a bytearray until the next chunk completes it, so a long
+    stream is never re-joined or re-scanned.
+    """
+
+    __slots__ = ("_buffer", "max_line_bytes")
+
+    def __init__(self, max_line_bytes: int = MAX_LINE_BYTES):
+        self._buffer = bytearray()
+        self.max_line_bytes = max_line_bytes
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Return every line completed by ``chunk`` (without the line terminator)"""
+        if self._buffer:
+            self._buffer += chunk
+            data = self._buffer
+        else:
+            data = chunk
+
+        lines = []
+        start = 0
+        find = data.find
+        while True:
+            end = find(b"\n", start)
+            if end == -1:
+                break
+            stop = end - 1 if end > start and data[end - 1] == 13 else end  # strip \r
+            lines.append(data[start:stop])
+            start = end + 1
+
+        if data is self._buffer:
+            del self._buffer[:start]
+        elif start < len(data):
+            self._buffer += memoryview(data)[start:]
+
+        if len(self._buffer) > self.max_line_bytes:
+            self._buffer.clear()
+            raise StreamFramingError(f"Line exceeds {self.max_line_bytes} bytes without a terminator")
+        return lines
+
+    def flush(self) -> List[bytes]:
+        """Return the trailing line if the stream ended without a final newline"""
+        if not self._buffer:
+            return []
+        line = bytes(self._buffer).rstrip(b"\r")
+        self._buffer.clear()
+        return [line]
+
+
+class NDJSONDecoder:
+    """Incremental decoder for newline-delimited JSON, as streamed by Ollama"""
+
+    __slots__ = ("_framer", "errors")
+
+    def __init__(self, max_line_bytes: int = MAX_LINE_BYTES):
+        self._framer = LineFramer(max_line_bytes)
+        self.errors = 0
+
+    def _decode(self, lines: List[bytes]) -> List[Any]:
+        objects = []
+        for line in lines:
+            if not line or line.isspace():
+                continue
+            try:
+                objects.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                self.errors += 1
+                logger.error(f"JSON decode error for: {line[:200]!r}")
+        return objects
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        return self._decode(self._framer.feed(chunk))
+
+    def flush(self) -> List[Any]:
+        return self._decode(self._framer.flush())
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, data: str, event: str = "message", id: Optional[str] = None):
+        self.data = data
+        self.event = event
+        self.id = id
+
+    def __repr__(self):
+        return f"SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+
+class SSEDecoder:
+    """
+    Incremental Server-Sent Events decoder for OpenAI-style streams (LMStudio).
+
+    Follows the event-stream format: ``field: value`` lines, comments starting
+    with ``:``, multi-line ``data`` joined with newlines and an event dispatched
+    on every blank line.
+    """
+
+    __slots__ = ("_framer", "_data", "_event", "_id")
+
+    def __init__(self, max_line_bytes: int = MAX_LINE_BYTES):
+        self._framer = LineFramer(max_line_bytes)
+        self._data: List[bytes] = []
+        self._event: Optional[bytes] = None
+        self._id: Optional[str] = None
+
+    def _process(self, lines: List[bytes]) -> List[SSEEvent]:
+        events = []
+        for line in lines:
+            if not line:
+                if self._data:
+                    data = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+                    event = self._event.decode("utf-8") if self._event else "message"
+                    events.append(SSEEvent(data.decode("utf-8", "replace"), event, self._id))
+                self._data = []
+                self._event = None
+                continue
+            if line.startswith(b"data: "):
+                self._data.append(line[6:])
+                continue
+            if line[0] == 58:  # ":" comment / keep-alive
+                continue
+            colon = line.find(b":")
+            if colon == -1:
+                field, value = line, b""
+            else:
+                field = line[:colon]
+                value = line[colon + 2:] if line[colon + 1:colon + 2] == b" " else line[colon + 1:]
+            if field == b"data":
+                self._data.append(value)
+            elif field == b"event":
+                self._event = value
+            elif field == b"id":
+                self._id = value.decode("utf-8", "replace")
+        return events
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        return self._process(self._framer.feed(chunk))
+
+    def flush(self) -> List[SSEEvent]:
+        """Dispatch a final event that was not followed by a blank line"""
+        return self._process(self._framer.flush() + [b""])
@@ -0,0 +1,329 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import anyio
+import numpy as np
+from sqlalchemy import func, select
+
+from app.db.database import AsyncSessionLocal
+from app.models.models import DocumentSection
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Where the in-process index keeps its files when pgvector is not available
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join("data", "vector_index"))
+# Seconds between checks of document_sections for new or deleted sections (0: only at startup)
+VECTOR_INDEX_SYNC_INTERVAL = float(os.getenv("VECTOR_INDEX_SYNC_INTERVAL", "30"))
+# Rows fetched per round trip while syncing
+VECTOR_INDEX_SYNC_BATCH = int(os.getenv("VECTOR_INDEX_SYNC_BATCH", "5000"))
+# Rewrite the matrix once this share of its rows belongs to deleted sections
+VECTOR_INDEX_COMPACT_RATIO = float(os.getenv("VECTOR_INDEX_COMPACT_RATIO", "0.2"))
+
+_MATRIX_FILE = "embeddings.f32"
+_IDS_FILE = "ids.npy"
+_DOCUMENTS_FILE = "documents.npy"
+_META_FILE = "meta.json"
+
+
+class VectorIndex:
+    """
+    Brute-force cosine index over DocumentSection embeddings for databases
+    without the pgvector extension.
+
+    Embeddings are L2-normalised and kept in one contiguous float32 matrix that
+    is memory-mapped from disk, so the index survives restarts and its pages
+    are managed by the OS page cache rather than the Python heap. Section and
+    document ids live in small arrays next to it; a deleted section is marked
+    with id -1 until the matrix is compacted.
+
+    A background task started with ``start()`` keeps it in sync with
+    document_sections; the array work runs in worker threads, and searches
+    read a consistent snapshot of the arrays under ``_state_lock``.
+    """
+
+    def __init__(self, directory: str, dimensions: int = 768):
+        self.directory = directory
+        self.dimensions = dimensions
+        self._matrix: Optional[np.memmap] = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._documents = np.empty(0, dtype=np.int64)
+        self.count = 0
+        self.max_id = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # Held while the arrays change; searches only hold it to take their snapshot
+        self._state_lock = threading.RLock()
+        self._sync_task: Optional[asyncio.Task] = None
+        self.last_sync = 0.0
+        self.syncs = 0
+        self.queries = 0
+        self.last_query_ms = 0.0
+        self.total_query_ms = 0.0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._matrix is None else self._matrix.shape[0]
+
+    @property
+    def live(self) -> int:
+        return int(np.count_nonzero(self._ids[:self.count] >= 0))
+
+    def load(self):
+        """Open the files of an earlier run, or start empty"""
+        if self._loaded:
+            return
+        with self._state_lock:
+            if not self._loaded:
+                self._load()
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        meta = None
+        if os.path.exists(self._path(_META_FILE)):
+            with open(self._path(_META_FILE)) as f:
+                meta = json.load(f)
+        if meta and meta.get("dimensions") == self.dimensions and os.path.exists(self._path(_MATRIX_FILE)):
+            # meta.json is written last, its count is what is known to be on disk
+            self.count = meta["count"]
+            self.max_id = meta["max_id"]
+            self._ids = np.load(self._path(_IDS_FILE))[:self.count].copy()
+            self._documents = np.load(self._path(_DOCUMENTS_FILE))[:self.count].copy()
+            capacity = os.path.getsize(self._path(_MATRIX_FILE)) // (4 * self.dimensions)
+            self._matrix = np.memmap(self._path(_MATRIX_FILE), dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+            logger.info(f"Loaded vector index with {self.count} rows from {self.directory}")
+        else:
+            self._resize(1024)
+        self._loaded = True
+
+    def _resize(self, capacity: int):
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._path(_MATRIX_FILE), "ab") as f:
+            f.truncate(capacity * self.dimensions * 4)
+        self._matrix = np.memmap(self._path(_MATRIX_FILE), dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+
+    def add(self, ids: Sequence[int], documents: Sequence[int], vectors: np.ndarray):
+        """Append rows; ``vectors`` is an (n, dimensions) array"""
+        self.load()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        with self._state_lock:
+            self._append(ids, documents, vectors / norms)
+
+    def _append(self, ids: Sequence[int], documents: Sequence[int], vectors: np.ndarray):
+        needed = self.count + len(vectors)
+        if needed > self.capacity:
+            self._resize(max(needed, self.capacity * 2))
+        self._matrix[self.count:needed] = vectors
+        self._ids = np.concatenate([self._ids, np.asarray(ids, dtype=np.int64)])
+        self._documents = np.concatenate([self._documents, np.asarray(documents, dtype=np.int64)])
+        self.count = needed
+        self.max_id = max(self.max_id, int(max(ids)))
+
+    def remove(self, ids: Sequence[int]) -> int:
+        """Mark sections as deleted, returns how many rows were removed"""
+        with self._state_lock:
+            mask = np.isin(self._ids[:self.count], np.asarray(ids, dtype=np.int64))
+            self._ids = np.where(mask, -1, self._ids[:self.count])
+        return int(np.count_nonzero(mask))
+
+    def compact(self):
+        """Rewrite the matrix without the rows of deleted sections"""
+        with self._state_lock:
+            self._compact()
+
+    def _compact(self):
+        keep = np.flatnonzero(self._ids[:self.count] >= 0)
+        tmp_path = self._path(_MATRIX_FILE + ".tmp")
+        capacity = max(1024, len(keep))
+        compacted = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, self.dimensions))
+        for start in range(0, len(keep), VECTOR_INDEX_SYNC_BATCH):
+            rows = keep[start:start + VECTOR_INDEX_SYNC_BATCH]
+            compacted[start:start + len(rows)] = self._matrix[rows]
+        compacted.flush()
+        del compacted
+        self._matrix = None
+        os.replace(tmp_path, self._path(_MATRIX_FILE))
+        self._ids = self._ids[keep]
+        self._documents = self._documents[keep]
+        self.count = len(keep)
+        self._matrix = np.memmap(self._path(_MATRIX_FILE), dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+
+    def save(self):
+        """Persist the id arrays and row count; the matrix pages are flushed first"""
+        if self._matrix is not None:
+            self._matrix.flush()
+        for name, array in ((_IDS_FILE, self._ids), (_DOCUMENTS_FILE, self._documents)):
+            tmp_path = self._path(name + ".tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, self._path(name))
+        tmp_path = self._path(_META_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"dimensions": self.dimensions, "count": self.count, "max_id": self.max_id}, f)
+        os.replace(tmp_path, self._path(_META_FILE))
+
+    def search(self, query: Sequence[float], top_k: int, documents: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Exact cosine top-k as ``(section id, similarity)`` pairs, best first.
+        ``documents`` restricts the search to sections of those documents.
+        """
+        self.load()
+        start = time.perf_counter()
+        # A sync that appends or compacts replaces these references instead of
+        # changing what they point to, so the snapshot stays valid without the lock
+        with self._state_lock:
+            matrix, ids, section_documents, count = self._matrix, self._ids, self._documents, self.count
+        if count == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        valid = ids[:count] >= 0
+        if documents is not None:
+            valid &= np.isin(section_documents[:count], np.asarray(documents, dtype=np.int64))
+        rows = np.flatnonzero(valid)
+        k = min(top_k, len(rows))
+        if k == 0:
+            return []
+        if len(rows) < count // 2:
+            # Selective filters only read the matching rows of the matrix
+            scores = np.asarray(matrix[rows] @ query)
+        else:
+            scores = np.asarray(matrix[:count] @ query)
+            scores[~valid] = -np.inf
+            rows = np.arange(count)
+
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.queries += 1
+        self.last_query_ms = elapsed_ms
+        self.total_query_ms += elapsed_ms
+        return [(int(ids[rows[i]]), float(scores[i])) for i in top]
+
+    async def _fetch(self, db, condition) -> int:
+        result = await db.stream(
+            select(DocumentSection.id, DocumentSection.document_id, DocumentSection.embedding)
+            .where(DocumentSection.embedding.is_not(None), condition)
+            .order_by(DocumentSection.id)
+            .execution_options(yield_per=VECTOR_INDEX_SYNC_BATCH)
+        )
+        added = 0
+        async for rows in result.partitions():
+            rows = [row for row in rows if len(row.embedding) == self.dimensions]
+            if rows:
+                await anyio.to_thread.run_sync(self._add_rows, rows)
+                added += len(rows)
+        return added
+
+    def _add_rows(self, rows):
+        self.add(
+            [row.id for row in rows],
+            [row.document_id or 0 for row in rows],
+            np.stack([row.embedding for row in rows]),
+        )
+
+    def _reconcile(self, current: np.ndarray) -> Tuple[int, np.ndarray]:
+        """Drop the sections missing from ``current``; returns the number removed and the ids not indexed yet"""
+        indexed = self._ids[:self.count]
+        removed = self.remove(indexed[(indexed >= 0) & ~np.isin(indexed, current)])
+        # Sections committed after a sync that already saw a higher id
+        return removed, current[~np.isin(current, indexed)]
+
+    async def sync(self, session_factory=AsyncSessionLocal, force: bool = False):
+        """
+        Bring the index up to date with document_sections: sections with an id
+        above the highest indexed one are appended, and when the row counts
+        disagree the ids are compared to drop deleted sections.
+        """
+        if not force and time.monotonic() - self.last_sync < VECTOR_INDEX_SYNC_INTERVAL:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self.last_sync < VECTOR_INDEX_SYNC_INTERVAL:
+                return
+            await anyio.to_thread.run_sync(self.load)
+            added = removed = 0
+            has_embedding = DocumentSection.embedding.is_not(None)
+            async with session_factory() as db:
+                added += await self._fetch(db, DocumentSection.id > self.max_id)
+
+                total = (await db.execute(select(func.count()).select_from(DocumentSection).where(has_embedding))).scalar()
+                if total != self.live:
+                    current = np.asarray((await db.execute(select(DocumentSection.id).where(has_embedding))).scalars().all(), dtype=np.int64)
+                    removed, missing = await anyio.to_thread.run_sync(self._reconcile, current)
+                    for start in range(0, len(missing), VECTOR_INDEX_SYNC_BATCH):
+                        batch = missing[start:start + VECTOR_INDEX_SYNC_BATCH].tolist()
+                        added += await self._fetch(db, DocumentSection.id.in_(batch))
+
+            if removed and self.count - self.live > VECTOR_INDEX_COMPACT_RATIO * self.count:
+                await anyio.to_thread.run_sync(self.compact)
+            if added or removed:
+                await anyio.to_thread.run_sync(self.save)
+                logger.info(f"Vector index synced: {added} added, {removed} removed, {self.live} sections")
+            self.syncs += 1
+            self.last_sync = time.monotonic()
+
+    async def _run_syncs(self, needed: Callable[[], Awaitable[bool]]):
+        while True:
+            try:
+                if not await needed():
+                    return
+                await self.sync(force=True)
+            except Exception as e:
+                logger.error(f"Vector index sync failed: {str(e)}")
+            if VECTOR_INDEX_SYNC_INTERVAL <= 0:
+                return
+            await asyncio.sleep(VECTOR_INDEX_SYNC_INTERVAL)
+
+    def start(self, needed: Callable[[], Awaitable[bool]]):
+        """Sync now and every VECTOR_INDEX_SYNC_INTERVAL seconds; stops once ``needed()`` is False"""
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._run_syncs(needed))
+
+    async def aclose(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        self.close()
+
+    def close(self):
+        if self._matrix is not None:
+            self.save()
+            self._matrix = None
+        self._loaded = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "sections": self.live if self._loaded else 0,
+            "rows": self.count,
+            "capacity": self.capacity,
+            "matrix_bytes": self.capacity * self.dimensions * 4,
+            "syncs": self.syncs,
+            "queries": self.queries,
+            "last_query_ms": round(self.last_query_ms, 2),
+            "avg_query_ms": round(self.total_query_ms / self.queries, 2) if self.queries else 0.0,
+        }
+
+
+vector_index = VectorIndex(VECTOR_INDEX_DIR)
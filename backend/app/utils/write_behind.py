@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.db.database import AsyncSessionLocal
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Flush when this many rows are queued or when the oldest queued row is this old
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.02"))
+# Producers wait (back-pressure) once this many rows are queued
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+
+_STOP = object()
+
+
+class _PendingWrite:
+    __slots__ = ("model", "values", "future")
+
+    def __init__(self, model, values: Dict[str, Any], future: Optional[asyncio.Future]):
+        self.model = model
+        self.values = values
+        self.future = future
+
+
+class WriteBehindQueue:
+    """
+    In-process write-behind buffer for small, high-rate inserts.
+
+    Rows are coalesced into one multi-row INSERT per model and one transaction
+    per flush. Fire-and-forget callers return as soon as the row is queued;
+    durable callers wait until the flush has committed and get back the
+    generated ``id`` and ``created_at``.
+    """
+
+    def __init__(self, max_batch: int, flush_interval: float, max_queue: int, session_factory=AsyncSessionLocal):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._overflow = set()
+        self._closed = False
+        self.enqueued = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failed_rows = 0
+        self.largest_batch = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.create_task(self._run())
+
+    async def enqueue(self, model, values: Dict[str, Any], durable: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Queue one row for ``model``. Waits while the queue is full. With
+        ``durable=True`` this returns ``{"id": ..., "created_at": ...}`` once the
+        row is committed, and raises if the insert failed.
+        """
+        future = asyncio.get_running_loop().create_future() if durable else None
+        item = _PendingWrite(model, values, future)
+        self.enqueued += 1
+        if self._closed:
+            # Late writes during shutdown go straight to the database
+            await self._flush([item])
+        else:
+            self._ensure_started()
+            await self._queue.put(item)
+        if future is not None:
+            return await future
+        return None
+
+    def submit(self, model, values: Dict[str, Any]):
+        """Fire-and-forget enqueue for synchronous callers"""
+        if not self._closed:
+            self._ensure_started()
+            try:
+                self._queue.put_nowait(_PendingWrite(model, values, None))
+                self.enqueued += 1
+                return
+            except asyncio.QueueFull:
+                pass
+        # Queue full (or closing): hand the row to a task that waits for room
+        task = asyncio.create_task(self.enqueue(model, values))
+        self._overflow.add(task)
+        task.add_done_callback(self._overflow.discard)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    if self._queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: List[_PendingWrite]):
+        start = time.perf_counter()
+        # Group rows per model, keeping the submission order within each model
+        groups: Dict[Any, List[_PendingWrite]] = {}
+        for item in batch:
+            groups.setdefault(item.model, []).append(item)
+
+        try:
+            async with self._session_factory() as db:
+                results = []
+                for model, items in groups.items():
+                    result = await db.execute(
+                        insert(model).returning(model.id, model.created_at, sort_by_parameter_order=True),
+                        [item.values for item in items]
+                    )
+                    results.append((items, result.all()))
+                await db.commit()
+            for items, rows in results:
+                for item, row in zip(items, rows):
+                    if item.future is not None and not item.future.done():
+                        item.future.set_result({"id": row.id, "created_at": row.created_at})
+        except Exception as e:
+            logger.error(f"Write-behind flush of {len(batch)} rows failed, retrying row by row: {str(e)}")
+            if len(batch) > 1:
+                for item in batch:
+                    await self._flush([item])
+                return
+            item = batch[0]
+            self.failed_rows += 1
+            if item.future is not None and not item.future.done():
+                item.future.set_exception(e)
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.flushed_rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+
+    async def aclose(self):
+        """Flush everything still queued; called from the app lifespan on shutdown"""
+        self._closed = True
+        if self._overflow:
+            await asyncio.gather(*self._overflow, return_exceptions=True)
+        if self._worker is not None and not self._worker.done():
+            await self._queue.put(_STOP)
+            await self._worker
+        self._worker = None
+        self._queue = None
+        # Allow reuse (e.g. another lifespan in the same process)
+        self._closed = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "max_batch": self.max_batch,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "enqueued": self.enqueued,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+            "flushes": self.flushes,
+            "largest_batch": self.largest_batch,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+
+write_behind = WriteBehindQueue(WRITE_BEHIND_MAX_BATCH, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_QUEUE)
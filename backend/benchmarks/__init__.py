@@ -0,0 +1 @@
+# Benchmarks and fake upstream servers for the FastAPI backend
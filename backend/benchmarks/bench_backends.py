@@ -0,0 +1,133 @@
+"""
+Routing over several Ollama backends (app.utils.backends).
+
+Starts three fake Ollama servers with different per-token latencies and a
+cold-load delay for models they do not have in memory, then streams chats
+through ollama_stream():
+
+* spread   - ``--chats`` concurrent chats: how they are spread over the nodes
+             and the latency, against sending everything to the first node
+* affinity - chats alternating between two models that are each loaded on
+             one node only: cold loads with /api/ps affinity on and off
+* failover - the fastest node is stopped halfway through a run: chats that
+             fail versus chats retried on another node before their first
+             token, and whether the node was ejected
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_backends --chats 60 --load-delay 1.0
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+# (per-token delay, models in memory)
+NODES = [(0.002, ["llama2"]), (0.005, ["mistral"]), (0.01, [])]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_chats(ollama, models, count: int, concurrency: int):
+    """Latencies of the chats that completed and the number that failed"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await ollama.ollama_stream(models[i % len(models)], "system", 0.7, f"question {i}")
+                async for _ in response.body_iterator:
+                    pass
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                failures += 1
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies, failures
+
+
+async def main(chats: int, concurrency: int, load_delay: float):
+    ports = [free_port() for _ in NODES]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    os.environ["OLLAMA_HOST"] = ",".join(urls)
+
+    from app.utils import backends, ollama
+    from app.utils.http_client import upstream_clients
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    fakes = [FakeOllama(tokens=30, token_delay=delay, load_delay=load_delay, loaded=loaded) for delay, loaded in NODES]
+    pool = ollama.backend_pool
+    servers = [serve(fake, port) for fake, port in zip(fakes, ports)]
+    for server in servers:
+        await server.__aenter__()
+
+    def reset():
+        for fake, (_, models) in zip(fakes, NODES):
+            fake.reset()
+            fake.loaded = set(models)
+        for backend in pool.backends:
+            backend.requests = backend.errors = backend.failures = 0
+            backend.ejected_until = 0.0
+        pool.retries = 0
+
+    try:
+        print(f"nodes: {', '.join(f'{url} ({delay * 1000:.0f} ms/token)' for url, (delay, _) in zip(urls, NODES))}")
+
+        print(f"\nspread: {chats} chats, {concurrency} at a time")
+        print(f"{'routing':<20}{'per node':>16}{'p50':>9}{'p95':>9}")
+        for label, hosts in (("first node only", urls[:1]), ("least outstanding", urls)):
+            pool.backends = [backend for backend in pool.backends if backend.url in hosts] if len(hosts) == 1 else [
+                backends.Backend(url) for url in urls
+            ]
+            reset()
+            await pool.probe_all()
+            latencies, _ = await run_chats(ollama, ["llama2", "mistral"], chats, concurrency)
+            spread = "/".join(str(fake.paths["/api/generate"]) for fake in fakes)
+            print(f"{label:<20}{spread:>16}{percentile(latencies, 0.5) * 1000:>6.0f} ms{percentile(latencies, 0.95) * 1000:>6.0f} ms")
+
+        print(f"\naffinity: {chats} chats alternating llama2 / mistral, cold load {load_delay:.1f} s")
+        print(f"{'affinity':<20}{'cold loads':>12}{'p50':>9}{'p95':>9}")
+        for label, slack in (("off", -10 ** 6), ("on", backends.BACKEND_AFFINITY_SLACK)):
+            backends.BACKEND_AFFINITY_SLACK = slack
+            reset()
+            await pool.probe_all()
+            latencies, _ = await run_chats(ollama, ["llama2", "mistral"], chats, concurrency)
+            print(f"{label:<20}{sum(fake.cold_loads for fake in fakes):>12}"
+                  f"{percentile(latencies, 0.5) * 1000:>6.0f} ms{percentile(latencies, 0.95) * 1000:>6.0f} ms")
+
+        print(f"\nfailover: {chats} chats, {urls[0]} stopped after the first half")
+        reset()
+        await pool.probe_all()
+        first, failed_first = await run_chats(ollama, ["llama2"], chats // 2, concurrency)
+        await servers[0].__aexit__(None, None, None)
+        second, failed_second = await run_chats(ollama, ["llama2"], chats - chats // 2, concurrency)
+        dead = pool.backends[0]
+        print(f"completed {len(first) + len(second)}, failed {failed_first + failed_second}, "
+              f"retried on another node {pool.retries}, {dead.url} ejected: {not dead.available}")
+        print(f"latency after failover: p50 {statistics.median(second) * 1000:.0f} ms")
+        await pool.probe_all()
+        print(f"after a probe: {dead.url} available: {dead.available}, consecutive failures {dead.failures}")
+    finally:
+        for server in servers[1:]:
+            await server.__aexit__(None, None, None)
+        await upstream_clients.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--load-delay", type=float, default=1.0, help="fake cold-load time of a model in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.chats, args.concurrency, args.load_delay))
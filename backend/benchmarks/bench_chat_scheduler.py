@@ -0,0 +1,115 @@
+"""
+Fairness and overload behaviour of the /api/chat admission scheduler
+(app.utils.admission).
+
+Serves the real app against a fake Ollama that runs only ``--slots``
+generations at once and queues the rest in arrival order, like Ollama with
+OLLAMA_NUM_PARALLEL. Two scenarios, each with the scheduler off and on:
+
+* fairness - one heavy client sends ``--heavy`` requests at once, then a few
+             light clients send one request each; reported is the time to
+             first token of the light clients
+* overload - ``--flood`` requests at once with CHAT_QUEUE_MAX set to
+             ``--queue``; reported are how many were rejected with 429 and
+             the Retry-After they got
+
+Clients are told apart by their bearer token.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_chat_scheduler --slots 2 --heavy 16 --light 3
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+
+async def chat(client: httpx.AsyncClient, token: str):
+    """(status, seconds to first byte, total seconds, headers)"""
+    start = time.perf_counter()
+    first = None
+    async with client.stream(
+        "POST", "/api/chat",
+        json={"model": "llama2", "prompt": "hello", "options": {"temperature": 0.7}},
+        headers={"Authorization": f"Bearer {token}"},
+    ) as response:
+        async for _ in response.aiter_bytes():
+            if first is None:
+                first = time.perf_counter() - start
+    return response.status_code, first or 0.0, time.perf_counter() - start, response.headers
+
+
+async def fairness(client, heavy: int, light: int):
+    heavy_tasks = [asyncio.create_task(chat(client, "heavy")) for _ in range(heavy)]
+    await asyncio.sleep(0.05)
+    light_results = await asyncio.gather(*(chat(client, f"light{i}") for i in range(light)))
+    heavy_results = await asyncio.gather(*heavy_tasks)
+    return heavy_results, light_results
+
+
+async def overload(client, flood: int):
+    return await asyncio.gather(*(chat(client, f"user{i % 4}") for i in range(flood)))
+
+
+async def main(slots: int, heavy: int, light: int, flood: int, queue: int, token_delay: float):
+    ollama_port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{ollama_port}"
+
+    from app.main import app
+    from app.utils.admission import chat_scheduler
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    fake = FakeOllama(tokens=20, token_delay=token_delay, slots=slots)
+    generation = 20 * token_delay
+    print(f"fake Ollama: {slots} slots, {generation * 1000:.0f} ms per generation")
+    async with serve(fake, ollama_port), serve(app) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=httpx.Limits(max_connections=None)) as client:
+            print(f"\nfairness: {heavy} heavy requests, then {light} light ones")
+            print(f"{'scheduler':<11}{'light ttft p50':>16}{'light ttft max':>16}{'heavy total max':>17}")
+            for enabled in (False, True):
+                chat_scheduler.enabled = enabled
+                chat_scheduler.default_slots = slots
+                chat_scheduler.max_queue = heavy + light
+                chat_scheduler._lanes.clear()
+                heavy_results, light_results = await fairness(client, heavy, light)
+                light_ttft = [ttft for _, ttft, _, _ in light_results]
+                print(f"{'on' if enabled else 'off':<11}{statistics.median(light_ttft) * 1000:>13.0f} ms"
+                      f"{max(light_ttft) * 1000:>13.0f} ms{max(total for _, _, total, _ in heavy_results) * 1000:>14.0f} ms")
+
+            print(f"\noverload: {flood} requests at once, queue limit {queue}")
+            print(f"{'scheduler':<11}{'200':>6}{'429':>6}{'retry-after':>13}{'wall':>10}")
+            for enabled in (False, True):
+                chat_scheduler.enabled = enabled
+                chat_scheduler.max_queue = queue
+                chat_scheduler._lanes.clear()
+                start = time.perf_counter()
+                results = await overload(client, flood)
+                wall = time.perf_counter() - start
+                ok = sum(1 for status, _, _, _ in results if status == 200)
+                rejected = [headers.get("retry-after") for status, _, _, headers in results if status == 429]
+                retry = f"{min(rejected)}-{max(rejected)} s" if rejected else "-"
+                print(f"{'on' if enabled else 'off':<11}{ok:>6}{len(rejected):>6}{retry:>13}{wall:>8.2f} s")
+
+            stats = (await client.get("/api/stats/chat-scheduler")).json()["models"]["llama2"]
+            print(f"\nscheduler stats: wait p50 {stats['wait_ms_p50']} ms, p95 {stats['wait_ms_p95']} ms, "
+                  f"rejected {stats['rejected']}, avg service {stats['avg_service_seconds']} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=2)
+    parser.add_argument("--heavy", type=int, default=16)
+    parser.add_argument("--light", type=int, default=3)
+    parser.add_argument("--flood", type=int, default=40)
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="fake time per generated token in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.slots, args.heavy, args.light, args.flood, args.queue, args.token_delay))
@@ -0,0 +1,106 @@
+"""
+Event-loop concurrency check for the database layer.
+
+Streams tokens from a fake Ollama server through ollama_stream while DB-heavy
+requests run in parallel, once with the blocking SessionLocal (how the routes
+used to query) and once with AsyncSessionLocal. With the async engine the
+inter-token latency should stay flat; with the sync engine every query stalls
+the stream for the full round trip.
+
+Requires the PostgreSQL database configured through the PG_* variables.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_db_event_loop --queries 200 --query-ms 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+from sqlalchemy import text
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def stream_gaps(ollama, until):
+    """Consume chat streams until ``until()`` is true and record inter-token gaps in ms"""
+    gaps = []
+    while not until():
+        stream = await ollama.ollama_stream("llama2", "system", 0.0, "hi")
+        last = time.perf_counter()
+        async for _ in stream.body_iterator:
+            now = time.perf_counter()
+            gaps.append((now - last) * 1000)
+            last = now
+    return gaps
+
+
+async def sync_queries(total: int, concurrency: int, query_ms: int):
+    from app.db.database import SessionLocal
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            db = SessionLocal()
+            try:
+                db.execute(text("SELECT pg_sleep(:s)"), {"s": query_ms / 1000})
+            finally:
+                db.close()
+
+    await asyncio.gather(*(one() for _ in range(total)))
+
+
+async def async_queries(total: int, concurrency: int, query_ms: int):
+    from app.db.database import AsyncSessionLocal
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            async with AsyncSessionLocal() as db:
+                await db.execute(text("SELECT pg_sleep(:s)"), {"s": query_ms / 1000})
+
+    await asyncio.gather(*(one() for _ in range(total)))
+
+
+async def main(total: int, concurrency: int, query_ms: int):
+    port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+
+    from app.utils import ollama
+    from app.utils.http_client import upstream_clients
+    from app.db.database import async_engine
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    async with serve(FakeOllama(tokens=50, token_delay=0.005), port):
+        print(f"{'db driver':<12}{'wall s':>8}{'tokens/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for label, runner in (("none", None), ("sync", sync_queries), ("async", async_queries)):
+            start = time.perf_counter()
+            if runner is None:
+                gaps = await stream_gaps(ollama, lambda: time.perf_counter() - start > 2.0)
+            else:
+                db_task = asyncio.create_task(runner(total, concurrency, query_ms))
+                gaps = await stream_gaps(ollama, db_task.done)
+                await db_task
+            elapsed = time.perf_counter() - start
+            print(f"{label:<12}{elapsed:>8.2f}{len(gaps) / elapsed:>10.0f}{statistics.median(gaps):>9.1f}"
+                  f"{percentile(gaps, 99):>9.1f}{max(gaps):>9.1f}")
+        await upstream_clients.aclose()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--query-ms", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.queries, args.concurrency, args.query_ms))
@@ -0,0 +1,145 @@
+"""
+Session history benchmark: ORM entities + MessageResponse validation + stdlib
+json versus column projection + orjson, as used by /api/messages/get-session.
+
+Creates a scratch chat session with ``--messages`` messages, reads it back
+through both paths and deletes the session afterwards. Each path is split
+into fetch (query and building the rows) and serialize (response body bytes);
+the ORM path serializes the way FastAPI does for a ``response_model`` route.
+Reported per stage: median time over ``--rounds`` rounds, and in a separate
+pass under tracemalloc the peak traced memory and the number of gen-0
+garbage collections (a proxy for container objects allocated).
+
+Requires the PostgreSQL database configured through the PG_* variables.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_history_json --messages 5000 --rounds 7
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import delete, insert, select
+
+
+async def main(total: int, rounds: int):
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    from app.api.messages import MESSAGE_COLUMNS
+    from app.db.database import AsyncSessionLocal
+    from app.models.models import ChatSession, Message
+    from app.schemas.message import SessionMessagesResponse
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    field = create_response_field(name="Response_get_session_messages", type_=SessionMessagesResponse, mode="serialization")
+
+    async with AsyncSessionLocal() as db:
+        session = ChatSession(session_title="bench_history_json")
+        db.add(session)
+        await db.commit()
+        session_id = session.id
+        await db.execute(insert(Message), [
+            {
+                "session_id": session_id,
+                "sender": "user" if i % 2 == 0 else "assistant",
+                "content": f"message {i} with some ordinary chat text in it " * 6,
+                "message_type": "text",
+                "sources": {"documents": [{"title": f"doc {i}", "page": i % 40}]} if i % 2 else None
+            }
+            for i in range(total)
+        ])
+        await db.commit()
+
+    async def fetch_orm(db):
+        result = await db.execute(
+            select(Message).where(Message.session_id == session_id).order_by(Message.created_at, Message.id)
+        )
+        return result.scalars().all()
+
+    async def serialize_orm(messages):
+        content = await serialize_response(field=field, response_content={"session_id": session_id, "messages": messages})
+        return JSONResponse(content).body
+
+    async def fetch_columns(db):
+        result = await db.execute(
+            select(*MESSAGE_COLUMNS).where(Message.session_id == session_id).order_by(Message.created_at, Message.id)
+        )
+        return [row._asdict() for row in result]
+
+    async def serialize_columns(messages):
+        return ORJSONResponse({"session_id": session_id, "messages": messages, "next_cursor": None, "prev_cursor": None}).body
+
+    paths = {
+        "ORM + pydantic + json": (fetch_orm, serialize_orm),
+        "columns + orjson": (fetch_columns, serialize_columns),
+    }
+
+    async def run(fetch, serialize, traced: bool):
+        """(fetch, serialize) measurements and the body; seconds, or (peak bytes, gen-0 collections) when traced"""
+        stages = []
+        async with AsyncSessionLocal() as db:
+            messages = None
+            for stage, argument in ((fetch, db), (serialize, None)):
+                gc.collect()
+                collections = gc.get_stats()[0]["collections"]
+                if traced:
+                    tracemalloc.start()
+                start = time.perf_counter()
+                value = await stage(argument if stage is fetch else messages)
+                elapsed = time.perf_counter() - start
+                if traced:
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    stages.append((peak, gc.get_stats()[0]["collections"] - collections))
+                else:
+                    stages.append(elapsed)
+                if stage is fetch:
+                    messages = value
+        return stages, value
+
+    try:
+        timings = {label: [] for label in paths}
+        bodies = {}
+        for i in range(rounds):
+            # Alternate the order so neither path always runs on a warm cache
+            order = list(paths.items()) if i % 2 == 0 else list(reversed(paths.items()))
+            for label, (fetch, serialize) in order:
+                stages, bodies[label] = await run(fetch, serialize, traced=False)
+                timings[label].append(stages)
+        allocations = {label: (await run(fetch, serialize, traced=True))[0] for label, (fetch, serialize) in paths.items()}
+    finally:
+        async with AsyncSessionLocal() as db:
+            # messages are removed by the ON DELETE CASCADE foreign key
+            await db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+            await db.commit()
+
+    import json
+    decoded = [json.loads(body) for body in bodies.values()]
+    if decoded[0] != decoded[1]:
+        raise SystemExit("the two paths return different documents")
+
+    print(f"{total} messages, {len(bodies['columns + orjson']) / 1024:.0f} KiB body, median of {rounds} rounds")
+    print(f"{'path':<24}{'stage':<11}{'time':>10}{'peak memory':>14}{'gen-0 GCs':>11}")
+    for label in paths:
+        for index, stage in enumerate(("fetch", "serialize")):
+            elapsed = statistics.median(stages[index] for stages in timings[label])
+            peak, collections = allocations[label][index]
+            print(f"{label:<24}{stage:<11}{elapsed * 1000:>7.1f} ms{peak / 2 ** 20:>10.1f} MiB{collections:>11}")
+        total_time = statistics.median(sum(stages) for stages in timings[label])
+        print(f"{label:<24}{'total':<11}{total_time * 1000:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.rounds))
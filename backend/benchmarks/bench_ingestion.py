@@ -0,0 +1,137 @@
+"""
+Ingestion throughput benchmark for app.utils.ingestion.
+
+Creates synthetic business documents, then runs the pipeline against a local
+fake embedding server:
+
+* initial     - every section is new and gets embedded
+* edit 10%    - one paragraph changed in every tenth document
+* no change   - nothing to embed, only hashing and comparing
+* rebuild     - every section deleted and ingested again, the embeddings
+                come from the embedding cache
+* one by one  - the initial load embedded one section per request, in order,
+                as a reference for the batched and concurrent pipeline
+
+The benchmark embeds with its own model name; the synthetic documents and
+that model's embedding cache entries are deleted afterwards.
+
+Requires the PostgreSQL database configured through the PG_* variables.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_ingestion --documents 200 --paragraphs 20 --embed-delay 0.002
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+from sqlalchemy import delete, select, update
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+WORDS = "policy leave expense travel approval manager invoice budget contract renewal client onboarding".split()
+
+
+def paragraph(rng: random.Random, seed: str) -> str:
+    return f"{seed} " + " ".join(rng.choice(WORDS) for _ in range(50))
+
+
+def document_text(rng: random.Random, number: int, paragraphs: int) -> str:
+    blocks = []
+    for i in range(paragraphs):
+        if i % 5 == 0:
+            blocks.append(f"## Part {i // 5} of document {number}")
+        blocks.append(paragraph(rng, f"doc{number}-p{i}"))
+    return "\n\n".join(blocks)
+
+
+async def main(documents: int, paragraphs: int, embed_delay: float):
+    port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+    os.environ["EMBEDDING_MODEL"] = "bench-ingestion-embed"
+
+    from app.db.database import AsyncSessionLocal, async_engine
+    from app.models.models import BusinessDocument, DocumentSection, EmbeddingCacheEntry
+    from app.utils import ingestion
+    from app.utils.embedding_cache import embedding_cache
+    from app.utils.ollama import EMBEDDING_MODEL, get_embeddings
+    from app.utils.http_client import upstream_clients
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    rng = random.Random(3)
+    async with AsyncSessionLocal() as db:
+        rows = [
+            BusinessDocument(title=f"bench_ingestion {i}", content=document_text(rng, i, paragraphs), tags=["bench_ingestion"])
+            for i in range(documents)
+        ]
+        db.add_all(rows)
+        await db.commit()
+        document_ids = [row.id for row in rows]
+
+    fake = FakeOllama(embed_delay=embed_delay)
+    results = []
+    try:
+        async with serve(fake, port):
+            stats = await ingestion.ingest_documents(document_ids)
+            results.append(("initial", stats))
+
+            async with AsyncSessionLocal() as db:
+                for document_id in document_ids[::10]:
+                    content = (await db.execute(
+                        select(BusinessDocument.content).where(BusinessDocument.id == document_id)
+                    )).scalar_one()
+                    await db.execute(
+                        update(BusinessDocument)
+                        .where(BusinessDocument.id == document_id)
+                        .values(content=content.replace("-p3 ", "-p3 edited ", 1))
+                    )
+                await db.commit()
+            results.append(("edit 10%", await ingestion.ingest_documents(document_ids)))
+            results.append(("no change", await ingestion.ingest_documents(document_ids)))
+
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(DocumentSection).where(DocumentSection.document_id.in_(document_ids)))
+                await db.commit()
+            embedding_cache.clear_memory()
+            results.append(("rebuild", await ingestion.ingest_documents(document_ids)))
+
+            # Reference: the same initial sections, one embedding request per section
+            async with AsyncSessionLocal() as db:
+                sections = (await db.execute(
+                    select(DocumentSection.section_title, DocumentSection.content)
+                    .where(DocumentSection.document_id.in_(document_ids))
+                )).all()
+            start = time.perf_counter()
+            for title, text in sections:
+                await get_embeddings([ingestion._embedding_input(title, text)], lookup=False)
+            elapsed = time.perf_counter() - start
+        await upstream_clients.aclose()
+    finally:
+        async with AsyncSessionLocal() as db:
+            # sections are removed by the ON DELETE CASCADE foreign key
+            await db.execute(delete(BusinessDocument).where(BusinessDocument.id.in_(document_ids)))
+            await db.execute(delete(EmbeddingCacheEntry).where(EmbeddingCacheEntry.model == EMBEDDING_MODEL))
+            await db.commit()
+        await async_engine.dispose()
+
+    print(f"{'run':<12}{'embedded':>10}{'cached':>8}{'unchanged':>11}{'deleted':>9}{'requests':>10}{'seconds':>9}{'sections/s':>12}")
+    for label, stats in results:
+        print(f"{label:<12}{stats.sections_embedded:>10}{stats.sections_cached:>8}{stats.sections_unchanged:>11}{stats.sections_deleted:>9}"
+              f"{stats.embedding_requests:>10}{stats.elapsed:>9.2f}{stats.sections_embedded / stats.elapsed:>12.0f}")
+    print(f"{'one by one':<12}{len(sections):>10}{'':>8}{'':>11}{'':>9}{len(sections):>10}{elapsed:>9.2f}{len(sections) / elapsed:>12.0f}")
+    cache = embedding_cache.stats()
+    print(f"embedding cache: hit ratio {cache['hit_ratio']:.2f}, {cache['upstream_calls']} upstream calls, "
+          f"{cache['upstream_calls_saved']} saved")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per document")
+    parser.add_argument("--embed-delay", type=float, default=0.002, help="fake embedding time per text in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.documents, args.paragraphs, args.embed_delay))
@@ -0,0 +1,107 @@
+"""
+Login storm benchmark for password hashing.
+
+Fires a burst of concurrent password verifications while chat streams are
+started against a fake Ollama server, once with bcrypt inline on the event
+loop (the previous behaviour) and once through the bounded hashing pool.
+Reports login throughput, rejected logins and chat TTFT (time to first token).
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_login_storm --logins 200 --chats 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def measure_ttft(ollama, chats: int, interval: float):
+    """Start chats on a fixed schedule; TTFT counts from the scheduled start so loop stalls are included"""
+    ttfts = []
+    origin = time.perf_counter()
+
+    async def one(start):
+        stream = await ollama.ollama_stream("llama2", "system", 0.0, "hi")
+        first = True
+        async for _ in stream.body_iterator:
+            if first:
+                ttfts.append((time.perf_counter() - start) * 1000)
+                first = False
+
+    tasks = []
+    for i in range(chats):
+        scheduled = origin + i * interval
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(one(scheduled)))
+    await asyncio.gather(*tasks)
+    return ttfts
+
+
+async def login_storm(verify, hashed: str, logins: int):
+    ok = rejected = 0
+
+    async def one():
+        nonlocal ok, rejected
+        try:
+            if await verify("secret", hashed):
+                ok += 1
+        except HTTPException:
+            rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    return ok, rejected, time.perf_counter() - start
+
+
+async def main(logins: int, chats: int, interval: float):
+    port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+
+    from app.utils import ollama
+    from app.utils.auth import get_password_hash, verify_password, verify_password_async, password_hash_pool
+    from app.utils.http_client import upstream_clients
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    hashed = get_password_hash("secret")
+
+    async def inline_verify(password, hashed_password):
+        return verify_password(password, hashed_password)
+
+    async with serve(FakeOllama(tokens=5), port):
+        print(f"{'mode':<10}{'logins/s':>10}{'rejected':>10}{'TTFT p50 ms':>13}{'TTFT p99 ms':>13}")
+        for label, verify in (("idle", None), ("inline", inline_verify), ("pooled", verify_password_async)):
+            storm = None
+            if verify is not None:
+                storm = asyncio.create_task(login_storm(verify, hashed, logins))
+                await asyncio.sleep(0)
+            ttfts = await measure_ttft(ollama, chats, interval)
+            rate, rejected = 0.0, 0
+            if storm is not None:
+                ok, rejected, elapsed = await storm
+                rate = ok / elapsed
+            print(f"{label:<10}{rate:>10.1f}{rejected:>10}{statistics.median(ttfts):>13.1f}{percentile(ttfts, 99):>13.1f}")
+        print("pool stats:", password_hash_pool.stats())
+        password_hash_pool.shutdown()
+        await upstream_clients.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between chat starts")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.chats, args.interval))
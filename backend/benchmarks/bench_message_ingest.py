@@ -0,0 +1,77 @@
+"""
+Message ingestion benchmark: per-message /save versus /save-batch.
+
+Creates a scratch chat session, saves the same messages through both
+endpoints of the in-process app and deletes the session afterwards.
+
+Requires the PostgreSQL database configured through the PG_* variables.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_message_ingest --messages 10000 --batch-size 1000
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+from sqlalchemy import delete
+
+
+async def main(total: int, batch_size: int, concurrency: int):
+    from app.main import app
+    from app.db.database import AsyncSessionLocal
+    from app.models.models import ChatSession
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    async with AsyncSessionLocal() as db:
+        session = ChatSession(session_title="bench_message_ingest")
+        db.add(session)
+        await db.commit()
+        session_id = session.id
+
+    messages = [
+        {"session_id": session_id, "sender": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " * 8}
+        for i in range(total)
+    ]
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def save_one(message):
+                    async with semaphore:
+                        response = await client.post("/api/messages/save", json=message)
+                        response.raise_for_status()
+
+                start = time.perf_counter()
+                await asyncio.gather(*(save_one(message) for message in messages))
+                single = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for i in range(0, total, batch_size):
+                    response = await client.post("/api/messages/save-batch", json={"messages": messages[i:i + batch_size]})
+                    response.raise_for_status()
+                batched = time.perf_counter() - start
+
+        print(f"{'path':<28}{'messages':>10}{'seconds':>10}{'msg/s':>10}")
+        print(f"{'/save (concurrency ' + str(concurrency) + ')':<28}{total:>10}{single:>10.2f}{total / single:>10.0f}")
+        print(f"{'/save-batch (' + str(batch_size) + ' per call)':<28}{total:>10}{batched:>10.2f}{total / batched:>10.0f}")
+    finally:
+        async with AsyncSessionLocal() as db:
+            # messages are removed by the ON DELETE CASCADE foreign key
+            await db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+            await db.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.batch_size, args.concurrency))
@@ -0,0 +1,237 @@
+"""
+Latency of /api/messages/search on a large synthetic message history.
+
+Loads ``--messages`` messages (generated inside PostgreSQL) into
+``--sessions-per-user`` sessions for each of ``--users`` users. Message
+words are drawn from a synthetic vocabulary with a Zipf-like distribution,
+so the first words are in most messages and the last ones in very few. The
+GIN index on messages.content_tsv is dropped during the load and rebuilt
+afterwards. Then ``--queries`` random searches per query class go through the
+in-process app as random users:
+
+* common word   - one of the 10 most frequent words
+* rare word     - a word from the rare tail of the vocabulary
+* two words     - two mid-frequency words, both required
+* phrase        - two of the 10 most frequent words, adjacent
+* deep page     - a common word, 5th page of 20 hits via the cursor
+* one session   - a mid-frequency word within one of the user's sessions
+
+Reported per class: p50, p95 and p99 latency and hits per page. Last, a
+message is saved through /api/messages/save and searched for at once, to
+check that the index is maintained on insert.
+
+The index is rebuilt over the whole messages table, so run this against a
+scratch database. The synthetic users, sessions and messages are deleted at
+the end unless ``--keep`` is given; a later run with the same sizes reuses
+kept data instead of loading it again.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_message_search --messages 10000000 --users 1000 --queries 100
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+
+import httpx
+from sqlalchemy import text
+
+USER_PREFIX = "bench_search_"
+SYLLABLES = ["ba", "ko", "ri", "mu", "te", "sa", "lo", "ni", "du", "ve", "pa", "zo", "ki", "ma", "ru", "fe", "go", "li", "na", "so"]
+LOAD_BATCH = 500000
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def vocabulary(size: int):
+    """``size`` distinct made-up words; position in the list is frequency rank"""
+    rng = random.Random(11)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def load(engine, messages: int, users: int, sessions_per_user: int, words):
+    """Insert the synthetic users, sessions and messages unless they are already there"""
+    from app.models.models import Message
+
+    with engine.connect() as conn:
+        existing = conn.execute(text(
+            "SELECT count(*) FROM messages m JOIN chat_sessions s ON s.id = m.session_id "
+            "JOIN users u ON u.id = s.user_id WHERE u.username LIKE :prefix"
+        ), {"prefix": USER_PREFIX + "%"}).scalar()
+        if existing == messages:
+            print(f"reusing {existing} synthetic messages")
+            return
+        if existing:
+            raise SystemExit(f"{existing} synthetic messages of another run exist, delete them first")
+
+        start = time.perf_counter()
+        conn.execute(text(
+            "INSERT INTO users (username, email, password_hash, role) "
+            "SELECT :prefix || i, :prefix || i || '@example.com', 'x', 'user' FROM generate_series(0, :users - 1) i"
+        ), {"prefix": USER_PREFIX, "users": users})
+        conn.execute(text(
+            "INSERT INTO chat_sessions (user_id, session_title, started_at) "
+            "SELECT u.id, 'bench_message_search', now() FROM users u, generate_series(1, :per_user) "
+            "WHERE u.username LIKE :prefix ORDER BY u.id"
+        ), {"prefix": USER_PREFIX + "%", "per_user": sessions_per_user})
+        conn.execute(text("DROP INDEX IF EXISTS ix_messages_content_tsv"))
+        conn.execute(text("CREATE TEMP TABLE bench_sessions AS SELECT row_number() OVER (ORDER BY s.id) - 1 AS slot, s.id "
+                          "FROM chat_sessions s JOIN users u ON u.id = s.user_id WHERE u.username LIKE :prefix"),
+                     {"prefix": USER_PREFIX + "%"})
+        conn.execute(text("CREATE TEMP TABLE bench_vocabulary (rank int PRIMARY KEY, word text NOT NULL)"))
+        conn.execute(text(
+            "INSERT INTO bench_vocabulary SELECT rank, word FROM unnest(CAST(:words AS text[])) WITH ORDINALITY AS w(word, rank)"
+        ), {"words": words})
+        conn.execute(text("ANALYZE bench_vocabulary"))
+        conn.commit()
+
+        sessions = users * sessions_per_user
+        for offset in range(0, messages, LOAD_BATCH):
+            # Word k (1-based) is drawn with probability ~ 1/k: floor(V^random()).
+            # The word subquery references n so it is evaluated once per row;
+            # words are looked up by primary key, subscripting a large text[] is O(V).
+            conn.execute(text(
+                "INSERT INTO messages (session_id, sender, content, created_at, message_type) "
+                "SELECT s.id, CASE WHEN n % 2 = 0 THEN 'user' ELSE 'assistant' END, "
+                "       (SELECT string_agg((SELECT word FROM bench_vocabulary WHERE rank = k), ' ') "
+                "        FROM (SELECT floor(power(:size, random()))::int AS k "
+                "              FROM generate_series(1, 8 + n % 33) WHERE n IS NOT NULL) picks), "
+                "       timestamp '2024-01-01' + n * interval '1 second', 'text' "
+                "FROM generate_series(:start, :stop - 1) n JOIN bench_sessions s ON s.slot = n % :sessions"
+            ), {"size": len(words), "start": offset, "stop": min(offset + LOAD_BATCH, messages), "sessions": sessions})
+            conn.commit()
+            done = min(offset + LOAD_BATCH, messages)
+            print(f"  {done} messages loaded, {time.perf_counter() - start:.0f} s")
+
+        index_start = time.perf_counter()
+        conn.execute(text("SET maintenance_work_mem = '512MB'"))
+        for index in Message.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+        conn.execute(text("ANALYZE users; ANALYZE chat_sessions; ANALYZE messages"))
+        conn.commit()
+        print(f"loaded in {time.perf_counter() - start:.0f} s, GIN index built in {time.perf_counter() - index_start:.0f} s")
+
+
+def cleanup(engine):
+    from app.models.models import Message
+
+    with engine.connect() as conn:
+        # sessions and messages are removed by the ON DELETE CASCADE foreign keys
+        conn.execute(text("DELETE FROM users WHERE username LIKE :prefix"), {"prefix": USER_PREFIX + "%"})
+        # In case the load was interrupted after dropping the GIN index
+        for index in Message.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+        conn.commit()
+
+
+async def main(messages: int, users: int, sessions_per_user: int, vocabulary_size: int, queries: int, keep: bool):
+    from app.main import app
+    from app.db.database import engine
+    from app.utils.auth import create_access_token
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    words = vocabulary(vocabulary_size)
+    rng = random.Random(5)
+    middle = len(words) // 50
+    classes = {
+        "common word": lambda: ({"q": rng.choice(words[:10])}, 1),
+        "rare word": lambda: ({"q": rng.choice(words[len(words) // 2:])}, 1),
+        "two words": lambda: ({"q": f"{rng.choice(words[10:middle])} {rng.choice(words[10:middle])}"}, 1),
+        "phrase": lambda: ({"q": f'"{rng.choice(words[:10])} {rng.choice(words[:10])}"'}, 1),
+        "deep page": lambda: ({"q": rng.choice(words[:10])}, 5),
+        "one session": lambda: ({"q": rng.choice(words[10:middle])}, 1),
+    }
+
+    try:
+        load(engine, messages, users, sessions_per_user, words)
+        with engine.connect() as conn:
+            sessions = {}
+            for user_id, session_id in conn.execute(text(
+                "SELECT s.user_id, s.id FROM chat_sessions s JOIN users u ON u.id = s.user_id WHERE u.username LIKE :prefix"
+            ), {"prefix": USER_PREFIX + "%"}):
+                sessions.setdefault(user_id, []).append(session_id)
+            usernames = dict(conn.execute(text("SELECT id, username FROM users WHERE username LIKE :prefix"),
+                                          {"prefix": USER_PREFIX + "%"}).all())
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                tokens = {}
+
+                async def search(user_id, params, page):
+                    if user_id not in tokens:
+                        tokens[user_id] = {"Authorization": f"Bearer {create_access_token({'sub': usernames[user_id]})}"}
+                    params = dict(params, limit=20)
+                    elapsed = 0.0
+                    for _ in range(page):
+                        start = time.perf_counter()
+                        response = await client.get("/api/messages/search", params=params, headers=tokens[user_id])
+                        elapsed = time.perf_counter() - start
+                        response.raise_for_status()
+                        body = response.json()
+                        if not body["next_cursor"]:
+                            break
+                        params["cursor"] = body["next_cursor"]
+                    return elapsed, len(body["hits"])
+
+                # Warm up the connection pool and the principal cache path
+                await search(next(iter(sessions)), {"q": words[0]}, 1)
+
+                print(f"{messages} messages, {users} users x {sessions_per_user} sessions, "
+                      f"{vocabulary_size} words, {queries} queries per class")
+                print(f"{'query':<14}{'p50':>10}{'p95':>10}{'p99':>10}{'hits/page':>11}")
+                for label, make in classes.items():
+                    latencies, hits = [], []
+                    for _ in range(queries):
+                        user_id = rng.choice(list(sessions))
+                        params, page = make()
+                        if label == "one session":
+                            params["session_id"] = rng.choice(sessions[user_id])
+                        elapsed, count = await search(user_id, params, page)
+                        latencies.append(elapsed)
+                        hits.append(count)
+                    print(f"{label:<14}{percentile(latencies, 0.5) * 1000:>7.1f} ms{percentile(latencies, 0.95) * 1000:>7.1f} ms"
+                          f"{percentile(latencies, 0.99) * 1000:>7.1f} ms{statistics.mean(hits):>11.1f}")
+
+                # A saved message is searchable as soon as it is acknowledged
+                user_id = next(iter(sessions))
+                marker = "zyxwvut" + "".join(rng.choice("abcdefghij") for _ in range(8))
+                start = time.perf_counter()
+                response = await client.post("/api/messages/save", json={
+                    "session_id": sessions[user_id][0], "sender": "user", "content": f"please remember {marker}"
+                })
+                response.raise_for_status()
+                saved = time.perf_counter() - start
+                _, found = await search(user_id, {"q": marker}, 1)
+                print(f"\nsave took {saved * 1000:.1f} ms, found by search right after: {'yes' if found == 1 else 'NO'}")
+                # Leave the synthetic data as loaded, a kept run is reused by its message count
+                with engine.connect() as conn:
+                    conn.execute(text("DELETE FROM messages WHERE id = :id"), {"id": response.json()["id"]})
+                    conn.commit()
+    finally:
+        if not keep:
+            cleanup(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sessions-per-user", type=int, default=20)
+    parser.add_argument("--vocabulary", type=int, default=50000, help="distinct words in the synthetic messages")
+    parser.add_argument("--queries", type=int, default=100, help="searches per query class")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic data for another run")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.users, args.sessions_per_user, args.vocabulary, args.queries, args.keep))
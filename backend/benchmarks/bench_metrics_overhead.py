@@ -0,0 +1,85 @@
+"""
+Overhead of the Prometheus instrumentation (app.utils.metrics) on chat
+streaming.
+
+* end to end - CPU time per streamed token of ollama_stream() against a local
+               fake Ollama with no token delay, metrics on and off, in
+               rounds that alternate which goes first so drift and warm-up
+               affect both equally
+* per stream - cost of the StreamTimer bookkeeping for one stream
+* per token  - cost of the first-token check done for every token
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_metrics_overhead --tokens 2000 --streams 20 --rounds 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+import timeit
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+
+async def stream_cpu(ollama, streams: int) -> float:
+    """CPU seconds spent streaming ``streams`` chats"""
+    start = time.process_time()
+    for i in range(streams):
+        response = await ollama.ollama_stream("llama2", "system", 0.7, f"question {i}")
+        async for _ in response.body_iterator:
+            pass
+    return time.process_time() - start
+
+
+async def main(tokens: int, streams: int, rounds: int):
+    port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+
+    from app.utils import metrics, ollama
+    from app.utils.http_client import upstream_clients
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    per_token = {True: [], False: []}
+    async with serve(FakeOllama(tokens=tokens), port):
+        await stream_cpu(ollama, 2)
+        for i in range(rounds):
+            for enabled in ((False, True) if i % 2 == 0 else (True, False)):
+                metrics.METRICS_ENABLED = enabled
+                per_token[enabled].append(await stream_cpu(ollama, streams) / (streams * tokens))
+        await upstream_clients.aclose()
+    metrics.METRICS_ENABLED = True
+
+    off = statistics.median(per_token[False]) * 1e6
+    on = statistics.median(per_token[True]) * 1e6
+    print(f"end to end, {streams} streams x {tokens} tokens, median of {rounds} rounds "
+          f"(includes the fake server, which runs in this process):")
+    print(f"  metrics off  {off:8.2f} us CPU per token")
+    print(f"  metrics on   {on:8.2f} us CPU per token   ({(on - off) / off * 100:+.1f}%)")
+
+    n = 20000
+
+    def one_stream():
+        timer = metrics.StreamTimer("llama2")
+        timer.first_token_at = time.perf_counter()
+        timer.finish(tokens, "completed")
+
+    per_stream = timeit.timeit(one_stream, number=n) / n * 1e6
+    print(f"per stream: StreamTimer start + finish {per_stream:.1f} us "
+          f"({per_stream / tokens * 1000:.1f} ns per token at {tokens} tokens)")
+
+    setup = "import time\nclass T: first_token_at = 1.0\ntimer = T()"
+    check = timeit.timeit("if timer.first_token_at is None: timer.first_token_at = time.perf_counter()", setup, number=10 ** 6) * 1000
+    print(f"per token: first-token check {check:.1f} ns")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.tokens, args.streams, args.rounds))
@@ -0,0 +1,163 @@
+"""
+Recall and latency of the ANN index behind /api/retrieve versus exact search.
+
+Loads a synthetic clustered corpus of 768-dimensional section embeddings
+(generated inside PostgreSQL), builds the index through create_vector_index()
+and runs the same queries through app.utils.retrieval.search_sections() with
+the index and with index scans disabled. Recall@k is the share of the exact
+top-k that the index also returned.
+
+The ANN index is dropped during the load and rebuilt afterwards, and every
+search covers the whole document_sections table, so run this against a
+scratch database. The synthetic documents are deleted at the end.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_retrieval --sections 1000000 --queries 200
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+
+from sqlalchemy import delete, text
+
+DIMENSIONS = 768
+DOCUMENTS = 20
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def load_corpus(engine, sections: int, clusters: int, noise: float, batch: int):
+    """Insert the synthetic documents and sections, returns (document ids, centroids)"""
+    from app.db.create_db import VECTOR_INDEX_NAME
+
+    rng = random.Random(7)
+    centroids = [[rng.gauss(0.0, 1.0) for _ in range(DIMENSIONS)] for _ in range(clusters)]
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}"))
+        document_ids = [
+            conn.execute(text(
+                "INSERT INTO business_documents (title, content, status, tags) "
+                "VALUES (:title, 'synthetic', :status, :tags) RETURNING id"
+            ), {
+                "title": f"bench_retrieval {i}",
+                "status": "active" if i % 2 == 0 else "archived",
+                "tags": ["bench_retrieval", f"group{i % 4}"],
+            }).scalar()
+            for i in range(DOCUMENTS)
+        ]
+        # Sections are centroid + noise vectors from two small pools, combined
+        # with pgvector's element-wise "+" so the load stays cheap at 1M rows.
+        # The noise subquery references n so it is evaluated once per row.
+        # Documents are spread evenly over every cluster.
+        noise_pool = max(1000, sections // clusters + 1)
+        conn.execute(text("CREATE TEMP TABLE bench_centroids (id int PRIMARY KEY, v vector)"))
+        conn.execute(text("INSERT INTO bench_centroids VALUES (:id, CAST(:v AS vector))"), [
+            {"id": i, "v": str(centroid)} for i, centroid in enumerate(centroids)
+        ])
+        conn.execute(text(
+            "CREATE TEMP TABLE bench_noise AS "
+            "SELECT n AS id, (SELECT array_agg(:noise * (random() - 0.5)) FROM generate_series(1, :dims) j WHERE n >= 0)::vector AS v "
+            "  FROM generate_series(0, :pool - 1) n"
+        ), {"noise": noise, "dims": DIMENSIONS, "pool": noise_pool})
+        conn.commit()
+
+        start = time.perf_counter()
+        for offset in range(0, sections, batch):
+            count = min(batch, sections - offset)
+            conn.execute(text(
+                "INSERT INTO document_sections (document_id, section_title, content, embedding) "
+                "SELECT (:documents)[1 + (g / :clusters) % :document_count], 'section ' || g, 'synthetic', c.v + n.v "
+                "  FROM generate_series(:first, :last) g "
+                "  JOIN bench_centroids c ON c.id = g % :clusters "
+                "  JOIN bench_noise n ON n.id = (g / :clusters) % :pool"
+            ), {
+                "documents": document_ids, "document_count": DOCUMENTS, "clusters": clusters, "pool": noise_pool,
+                "first": offset, "last": offset + count - 1,
+            })
+            conn.commit()
+            done = offset + count
+            rate = done / (time.perf_counter() - start)
+            print(f"\rloaded {done}/{sections} sections ({rate:.0f}/s)", end="", flush=True)
+        print()
+    return document_ids, centroids
+
+
+async def run_queries(queries, top_k: int, status, tags):
+    from app.db.database import AsyncSessionLocal
+    from app.utils.retrieval import search_sections
+
+    ann_ms, exact_ms, recalls = [], [], []
+    for embedding in queries:
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            ann = await search_sections(db, embedding, top_k, status=status, tags=tags)
+            ann_ms.append((time.perf_counter() - start) * 1000)
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            exact = await search_sections(db, embedding, top_k, status=status, tags=tags, exact=True)
+            exact_ms.append((time.perf_counter() - start) * 1000)
+        expected = {row["id"] for row in exact}
+        if expected:
+            recalls.append(len(expected & {row["id"] for row in ann}) / len(expected))
+    return ann_ms, exact_ms, recalls
+
+
+async def main(sections: int, clusters: int, queries: int, top_k: int, noise: float, batch: int, keep: bool):
+    from app.db.database import engine, async_engine, AsyncSessionLocal
+    from app.db.create_db import create_vector_index
+    from app.models.models import BusinessDocument
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    document_ids, centroids = load_corpus(engine, sections, clusters, noise, batch)
+    try:
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            create_vector_index(conn)
+            conn.execute(text("ANALYZE document_sections"))
+            conn.commit()
+        print(f"index build: {time.perf_counter() - start:.1f} s")
+
+        rng = random.Random(11)
+        query_vectors = []
+        for _ in range(queries):
+            centroid = rng.choice(centroids)
+            query_vectors.append([value + noise * (rng.random() - 0.5) for value in centroid])
+
+        print(f"{'search':<26}{'recall@' + str(top_k):>10}{'ann p50':>10}{'ann p95':>10}{'exact p50':>11}{'exact p95':>11}")
+        for label, status, tags in [
+            ("unfiltered", None, None),
+            ("status=active", "active", None),
+            ("tags=[group1]", None, ["group1"]),
+        ]:
+            ann_ms, exact_ms, recalls = await run_queries(query_vectors, top_k, status, tags)
+            print(f"{label:<26}{statistics.mean(recalls):>10.3f}"
+                  f"{percentile(ann_ms, 0.5):>10.1f}{percentile(ann_ms, 0.95):>10.1f}"
+                  f"{percentile(exact_ms, 0.5):>11.1f}{percentile(exact_ms, 0.95):>11.1f}")
+    finally:
+        if not keep:
+            async with AsyncSessionLocal() as db:
+                # sections are removed by the ON DELETE CASCADE foreign key
+                await db.execute(delete(BusinessDocument).where(BusinessDocument.id.in_(document_ids)))
+                await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=1000000)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=1.0, help="width of the uniform noise added per dimension")
+    parser.add_argument("--batch", type=int, default=10000, help="sections inserted per statement")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic corpus afterwards")
+    args = parser.parse_args()
+    asyncio.run(main(args.sections, args.clusters, args.queries, args.top_k, args.noise, args.batch, args.keep))
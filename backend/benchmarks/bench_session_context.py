@@ -0,0 +1,98 @@
+"""
+Multi-turn prefill benchmark: re-sending the conversation versus session context reuse.
+
+Runs a fake Ollama server whose prefill time grows with the number of words it
+has to process and holds the same conversation twice:
+
+* full history - every turn sends the whole conversation flattened into the
+  prompt, as the frontend does today
+* keep_context - every turn sends only the new prompt and Ollama continues from
+  the context returned by the previous turn
+
+Time to first token per turn shows prefill growing with the conversation in the
+first case and staying flat in the second.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_session_context --turns 20 --words 60
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+logging.basicConfig(level=logging.WARNING)
+
+SYSTEM_PROMPT = "You are an AI assistant that follows instructions. Help the user with their tasks."
+
+
+async def run_turn(ollama, model, prompt, **kwargs):
+    """Stream one turn, return (time to first token, reply)"""
+    start = time.perf_counter()
+    response = await ollama.ollama_stream(model, SYSTEM_PROMPT, 0.0, prompt, **kwargs)
+    ttft = None
+    reply = []
+    async for chunk in response.body_iterator:
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        reply.append(chunk.decode("utf-8"))
+    return ttft, "".join(reply)
+
+
+async def main(turns: int, words: int, tokens: int, prefill_delay: float):
+    port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+
+    from app.utils import ollama
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    prompts = [" ".join(f"turn{turn}word{i}" for i in range(words)) for turn in range(turns)]
+    fake = FakeOllama(tokens=tokens, prefill_delay=prefill_delay)
+
+    async with serve(fake, port):
+        # Full history: the prompt is the whole conversation so far
+        history = []
+        full = []
+        for prompt in prompts:
+            flattened = " ".join([message["content"] for message in history] + [prompt])
+            ttft, reply = await run_turn(ollama, "llama2", flattened)
+            history += [{"role": "user", "content": prompt}, {"role": "assistant", "content": reply}]
+            full.append((ttft, fake.prefilled[-1]))
+
+        # keep_context: only the new turn, history is only needed on a context miss
+        fake.reset()
+        ollama.session_contexts.invalidate()
+        history = []
+        reused = []
+
+        async def load_history():
+            return list(history)
+
+        for prompt in prompts:
+            ttft, reply = await run_turn(ollama, "llama2", prompt, session_id=1, load_history=load_history)
+            history += [{"role": "user", "content": prompt}, {"role": "assistant", "content": reply}]
+            reused.append((ttft, fake.prefilled[-1]))
+
+        stats = ollama.session_contexts.stats()
+        await ollama.upstream_clients.aclose()
+
+    print(f"{'turn':>6}{'full ttft ms':>14}{'full words':>12}{'ctx ttft ms':>14}{'ctx words':>12}")
+    for turn in sorted({0, 1, turns // 4, turns // 2, turns - 1}):
+        print(f"{turn + 1:>6}{full[turn][0] * 1000:>14.1f}{full[turn][1]:>12}{reused[turn][0] * 1000:>14.1f}{reused[turn][1]:>12}")
+    print(f"{'total':>6}{sum(t for t, _ in full) * 1000:>14.1f}{sum(w for _, w in full):>12}"
+          f"{sum(t for t, _ in reused) * 1000:>14.1f}{sum(w for _, w in reused):>12}")
+    print(f"context store: {stats['hits']} hits, {stats['misses']} misses, {stats['context_tokens']} tokens held")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--words", type=int, default=60, help="words per user turn")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per reply")
+    parser.add_argument("--prefill-delay", type=float, default=0.0005, help="seconds per prefilled word")
+    args = parser.parse_args()
+    asyncio.run(main(args.turns, args.words, args.tokens, args.prefill_delay))
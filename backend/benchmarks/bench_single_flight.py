@@ -0,0 +1,83 @@
+"""
+Upstream requests made by a burst of identical calls, with and without
+single-flight coalescing (app.utils.singleflight).
+
+Simulates a page load: ``--clients`` concurrent calls each for the model list,
+the details of one model and the embedding of one query, all on a cold
+cache, against a local fake Ollama whose metadata and embedding endpoints
+are slow. "without" calls the upstream fetch functions directly, the way
+every cache miss did before; "with" goes through the public functions.
+
+The last line cancels every waiter of a slow call and checks that the shared
+upstream call was cancelled too. The embedding cache is disabled, so no
+database is needed.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_single_flight --clients 50 --delay 0.2
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+
+async def burst(clients: int, call) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(clients)))
+    return time.perf_counter() - start
+
+
+async def main(clients: int, delay: float):
+    port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+    from app.utils import ollama
+    from app.utils.http_client import upstream_clients
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    fake = FakeOllama(metadata_delay=delay, embed_delay=delay)
+    cases = [
+        ("model list", "/api/tags", ollama._fetch_ollama_models, ollama.get_ollama_models),
+        ("model details", "/api/show", lambda: ollama._fetch_model_details("llama2"), lambda: ollama.get_model_details("llama2")),
+        ("embedding", "/api/embed", lambda: ollama._request_embeddings(["leave policy"], ollama.EMBEDDING_MODEL),
+         lambda: ollama.get_embeddings(["leave policy"])),
+    ]
+    print(f"{clients} concurrent identical calls, upstream answers after {delay * 1000:.0f} ms")
+    print(f"{'call':<16}{'without':>10}{'with':>8}{'seconds without':>18}{'seconds with':>15}")
+    async with serve(fake, port):
+        for label, path, direct, coalesced in cases:
+            fake.reset()
+            direct_seconds = await burst(clients, direct)
+            direct_requests = fake.paths[path]
+
+            fake.reset()
+            ollama.model_cache.invalidate()
+            coalesced_seconds = await burst(clients, coalesced)
+            print(f"{label:<16}{direct_requests:>10}{fake.paths[path]:>8}{direct_seconds:>18.3f}{coalesced_seconds:>15.3f}")
+
+        ollama.model_cache.invalidate()
+        waiters = [asyncio.create_task(ollama.get_ollama_models()) for _ in range(clients)]
+        await asyncio.sleep(delay / 2)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        flights = ollama.upstream_flights
+        print(f"cancelled all {clients} waiters: shared calls cancelled {flights['models'].cancelled}, "
+              f"in flight {flights['models'].stats()['in_flight']}")
+        print("deduplicated: " + ", ".join(f"{name} {flight.deduplicated}" for name, flight in flights.items()))
+        await upstream_clients.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.2, help="fake upstream latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.delay))
@@ -0,0 +1,123 @@
+"""
+CPU per streamed token of /api/chat with and without token coalescing
+(app.utils.stream_coalescer).
+
+The app runs in a child process with STREAM_COALESCE_WINDOW_MS set per run,
+so only the API node's own CPU time is measured; the fake Ollama and the
+clients run in this process. ``--streams`` chats stream at once, each
+``--tokens`` tokens long, ``--token-delay`` seconds apart (0 sends them as fast
+as possible, like a cached reply). Plain text and SSE framing are both run.
+Reported per mode, as the median over ``--rounds`` rounds that alternate
+which mode runs first: API CPU microseconds per token, writes (chunks
+received) per stream and time to first byte.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_stream_coalescing --streams 20 --tokens 400 --token-delay 0.005
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+
+def run_app(port: int, ollama_url: str, window_ms: float, conn):
+    """Child process: serve the app until told to stop, report CPU time between start and stop"""
+    os.environ["OLLAMA_HOST"] = ollama_url
+    os.environ["STREAM_COALESCE_WINDOW_MS"] = str(window_ms)
+    os.environ["CHAT_SCHEDULER_ENABLED"] = "false"
+
+    import logging
+
+    from app.main import app
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        async with serve(app, port):
+            conn.send("ready")
+            await loop.run_in_executor(None, conn.recv)
+            start = time.process_time()
+            await loop.run_in_executor(None, conn.recv)
+            conn.send(time.process_time() - start)
+
+    asyncio.run(main())
+
+
+async def chat(client: httpx.AsyncClient, sse: bool):
+    """(chunks received, seconds to first byte, body)"""
+    start = time.perf_counter()
+    first, chunks, body = None, 0, []
+    headers = {"Accept": "text/event-stream"} if sse else {}
+    async with client.stream("POST", "/api/chat", json={"model": "llama2", "prompt": "hello"}, headers=headers) as response:
+        async for chunk in response.aiter_raw():
+            if first is None:
+                first = time.perf_counter() - start
+            chunks += 1
+            body.append(chunk)
+    return chunks, first, b"".join(body)
+
+
+async def measure(window_ms: float, sse: bool, streams: int, tokens: int, ollama_url: str):
+    port = free_port()
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context("spawn").Process(target=run_app, args=(port, ollama_url, window_ms, child))
+    process.start()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, parent.recv)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=300,
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        await chat(client, sse)
+        parent.send("start")
+        results = await asyncio.gather(*(chat(client, sse) for _ in range(streams)))
+        parent.send("stop")
+        cpu = await loop.run_in_executor(None, parent.recv)
+    process.join()
+    expected = "".join(f"tok{i} " for i in range(tokens)).encode()
+    if not sse and any(body != expected for _, _, body in results):
+        raise SystemExit("coalesced body differs from the token stream")
+    return (
+        cpu / (streams * tokens) * 1e6,
+        statistics.mean(chunks for chunks, _, _ in results),
+        statistics.median(first for _, first, _ in results),
+    )
+
+
+async def main(streams: int, tokens: int, token_delay: float, window: float, rounds: int):
+    ollama_port = free_port()
+    fake = FakeOllama(tokens=tokens, token_delay=token_delay)
+    print(f"{streams} concurrent streams x {tokens} tokens, {token_delay * 1000:.0f} ms between tokens, "
+          f"median of {rounds} rounds")
+    print(f"{'framing':<8}{'window':>9}{'API CPU/token':>16}{'writes/stream':>15}{'first byte p50':>16}")
+    async with serve(fake, ollama_port) as ollama_url:
+        for sse in (False, True):
+            runs = {0: [], window: []}
+            for i in range(rounds):
+                for window_ms in ((0, window) if i % 2 == 0 else (window, 0)):
+                    runs[window_ms].append(await measure(window_ms, sse, streams, tokens, ollama_url))
+            baseline = statistics.median(per_token for per_token, _, _ in runs[0])
+            for window_ms, results in runs.items():
+                per_token = statistics.median(per_token for per_token, _, _ in results)
+                writes = statistics.median(writes for _, writes, _ in results)
+                first = statistics.median(first for _, _, first in results)
+                change = f"  ({(per_token - baseline) / baseline * 100:+.0f}%)" if window_ms else ""
+                print(f"{'sse' if sse else 'plain':<8}{window_ms:>6.0f} ms{per_token:>13.1f} us{writes:>15.1f}"
+                      f"{first * 1000:>13.1f} ms{change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--token-delay", type=float, default=0.005, help="fake time per generated token in seconds")
+    parser.add_argument("--window", type=float, default=15, help="coalescing window in milliseconds")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.streams, args.tokens, args.token_delay, args.window, args.rounds))
@@ -0,0 +1,133 @@
+"""
+Throughput benchmark for the incremental NDJSON and SSE stream decoders.
+
+Builds synthetic multi-thousand-token Ollama (NDJSON) and LMStudio (SSE)
+streams, cuts them into network-like chunks and measures parse throughput in
+MB/s and the per-token overhead. The previous string-buffer SSE loop is
+included as a reference; its "decoded" column shows the tokens it loses when
+a "data: " prefix is split across chunks.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_stream_parsers --tokens 5000
+"""
+import argparse
+import json
+import random
+import time
+
+from app.utils.stream_parsers import NDJSONDecoder, SSEDecoder
+
+
+def ndjson_stream(tokens: int) -> bytes:
+    lines = [json.dumps({"model": "llama2", "created_at": "2024-01-01T00:00:00Z", "response": f" token{i}", "done": False})
+             for i in range(tokens)]
+    lines.append(json.dumps({"model": "llama2", "response": "", "done": True}))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def sse_stream(tokens: int) -> bytes:
+    events = [
+        "data: " + json.dumps({"id": "chatcmpl-1", "object": "chat.completion.chunk",
+                               "choices": [{"index": 0, "delta": {"content": f" token{i}"}}]})
+        for i in range(tokens)
+    ]
+    events.append("data: [DONE]")
+    return ("\n\n".join(events) + "\n\n").encode()
+
+
+def split(payload: bytes, pattern: str, seed: int = 0) -> list:
+    """Cut a payload into chunks: one line per chunk, fixed size or random sizes"""
+    if pattern == "line":
+        parts = payload.split(b"\n")
+        return [part + b"\n" for part in parts[:-1]]
+    if pattern.isdigit():
+        size = int(pattern)
+        return [payload[i:i + size] for i in range(0, len(payload), size)]
+    rng = random.Random(seed)
+    chunks, i = [], 0
+    while i < len(payload):
+        size = rng.randint(1, 4096)
+        chunks.append(payload[i:i + size])
+        i += size
+    return chunks
+
+
+def legacy_sse(chunks: list) -> int:
+    """The string-buffer loop the LMStudio branch used before"""
+    count = 0
+    buffer = ""
+    for raw in chunks:
+        buffer += raw.decode("utf-8", "ignore")
+        while "data: " in buffer:
+            parts = buffer.split("data: ", 1)
+            if len(parts) != 2:
+                break
+            buffer = parts[1]
+            newline_pos = buffer.find("\n")
+            if newline_pos == -1:
+                break
+            data_line = buffer[:newline_pos].strip()
+            buffer = buffer[newline_pos + 1:]
+            if data_line == "[DONE]":
+                continue
+            data = json.loads(data_line)
+            if data["choices"][0]["delta"].get("content"):
+                count += 1
+    return count
+
+
+def ndjson(chunks: list) -> int:
+    decoder = NDJSONDecoder()
+    count = 0
+    for chunk in chunks:
+        for data in decoder.feed(chunk):
+            if data.get("response"):
+                count += 1
+    for data in decoder.flush():
+        if data.get("response"):
+            count += 1
+    return count
+
+
+def sse(chunks: list) -> int:
+    decoder = SSEDecoder()
+    count = 0
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            if event.data != "[DONE]" and json.loads(event.data)["choices"][0]["delta"].get("content"):
+                count += 1
+    return count
+
+
+def measure(fn, chunks, size, tokens, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    return size / best / 1e6, best / tokens * 1e6, count
+
+
+def main(tokens: int, repeat: int):
+    payloads = {"ndjson": ndjson_stream(tokens), "sse": sse_stream(tokens)}
+    cases = [
+        ("ndjson", "NDJSONDecoder", ndjson),
+        ("sse", "SSEDecoder", sse),
+        ("sse", "legacy str buffer", legacy_sse),
+    ]
+    print(f"{tokens} tokens per stream, best of {repeat}")
+    print(f"{'parser':<20}{'chunking':<12}{'MB/s':>10}{'us/token':>12}{'decoded':>10}")
+    for kind, label, fn in cases:
+        payload = payloads[kind]
+        for pattern in ("line", "64", "random"):
+            chunks = split(payload, pattern)
+            mbps, per_token, count = measure(fn, chunks, len(payload), tokens, repeat)
+            print(f"{label:<20}{pattern:<12}{mbps:>10.1f}{per_token:>12.2f}{count:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.tokens, args.repeat)
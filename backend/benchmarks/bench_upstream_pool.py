@@ -0,0 +1,91 @@
+"""
+Connection reuse benchmark for the pooled upstream client.
+
+Runs a fake Ollama server locally and issues the same mix of model listing,
+model detail and chat stream calls twice: once with a fresh httpx.AsyncClient
+per call (the previous behaviour) and once through the shared clients of
+app.utils.http_client. Both go straight to the upstream, so the model caches
+and single-flight in app.utils.ollama do not hide any of the calls.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_upstream_pool --requests 500 --concurrency 10
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+logging.basicConfig(level=logging.WARNING)
+
+
+async def run_batch(call, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await call(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start
+
+
+async def main(total: int, concurrency: int):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    os.environ["OLLAMA_HOST"] = base_url
+
+    from app.utils.http_client import upstream_clients
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    fake = FakeOllama(tokens=20)
+    async with serve(fake, port):
+        async def per_call_client(i):
+            async with httpx.AsyncClient(timeout=10) as client:
+                if i % 3 == 0:
+                    await client.get(f"{base_url}/api/tags")
+                elif i % 3 == 1:
+                    await client.post(f"{base_url}/api/show", json={"name": "llama2"})
+                else:
+                    async with client.stream("POST", f"{base_url}/api/generate", json={"model": "llama2", "prompt": "hi"}) as response:
+                        async for _ in response.aiter_bytes():
+                            pass
+
+        async def pooled(i):
+            client = upstream_clients.get(base_url)
+            with upstream_clients.track(base_url):
+                if i % 3 == 0:
+                    await client.get(f"{base_url}/api/tags")
+                elif i % 3 == 1:
+                    await client.post(f"{base_url}/api/show", json={"name": "llama2"})
+                else:
+                    async with client.stream("POST", f"{base_url}/api/generate", json={"model": "llama2", "prompt": "hi"}) as response:
+                        async for _ in response.aiter_bytes():
+                            pass
+
+        results = {}
+        for label, call in (("client-per-call", per_call_client), ("pooled", pooled)):
+            fake.reset()
+            elapsed = await run_batch(call, total, concurrency)
+            results[label] = (elapsed, len(fake.connections), fake.requests)
+
+        print(f"{'mode':<18}{'requests':>10}{'connections':>14}{'req/s':>10}")
+        for label, (elapsed, connections, requests) in results.items():
+            print(f"{label:<18}{requests:>10}{connections:>14}{requests / elapsed:>10.0f}")
+        print("pool stats:", upstream_clients.snapshot())
+        await upstream_clients.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,93 @@
+"""
+Build time, query latency and memory of the in-process vector index that
+/api/retrieve falls back to without pgvector (app.utils.vector_index).
+
+Adds clustered random 768-dimensional embeddings to a VectorIndex in a
+temporary directory, then runs top-k queries over the whole index and over
+the sections of 10% of the documents. Memory is read from /proc/self/status:
+RssAnon is the Python heap and temporary arrays, RssFile the pages of the
+memory-mapped matrix that are resident in the page cache.
+
+Needs no database and no upstream server.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_vector_index --sections 100000 1000000
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+DIMENSIONS = 768
+DOCUMENTS = 1000
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def rss_mb():
+    """(RssAnon, RssFile) of this process in MiB"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                name, kb, _ = line.split()
+                values[name.rstrip(":")] = int(kb) / 1024
+    return values.get("RssAnon", 0.0), values.get("RssFile", 0.0)
+
+
+def run(sections: int, clusters: int, queries: int, top_k: int, batch: int):
+    from app.utils.vector_index import VectorIndex
+
+    rng = np.random.default_rng(7)
+    centroids = rng.standard_normal((clusters, DIMENSIONS), dtype=np.float32)
+    with tempfile.TemporaryDirectory() as directory:
+        index = VectorIndex(directory, DIMENSIONS)
+        start = time.perf_counter()
+        for offset in range(0, sections, batch):
+            ids = np.arange(offset + 1, min(offset + batch, sections) + 1)
+            vectors = centroids[ids % clusters] + 0.5 * rng.standard_normal((len(ids), DIMENSIONS), dtype=np.float32)
+            index.add(ids, ids % DOCUMENTS, vectors)
+        index.save()
+        build = time.perf_counter() - start
+
+        query_vectors = centroids[rng.integers(0, clusters, queries)] + 0.5 * rng.standard_normal((queries, DIMENSIONS), dtype=np.float32)
+        subset = np.arange(0, DOCUMENTS, 10)
+        latencies = {}
+        for label, documents in (("unfiltered", None), ("10% of documents", subset)):
+            timings = []
+            for query in query_vectors:
+                start = time.perf_counter()
+                index.search(query, top_k, documents)
+                timings.append((time.perf_counter() - start) * 1000)
+            latencies[label] = timings
+        anon, file_backed = rss_mb()
+        matrix_mb = index.stats()["matrix_bytes"] / 2 ** 20
+        index.close()
+
+    print(f"{sections} sections: build {build:.1f} s ({sections / build:.0f}/s), matrix file {matrix_mb:.0f} MiB, "
+          f"RssAnon {anon:.0f} MiB, RssFile {file_backed:.0f} MiB")
+    for label, timings in latencies.items():
+        print(f"  {label:<18} p50 {percentile(timings, 0.5):8.1f} ms   p95 {percentile(timings, 0.95):8.1f} ms   "
+              f"mean {statistics.mean(timings):8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=10000, help="sections added per call")
+    args = parser.parse_args()
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    for count in args.sections:
+        run(count, args.clusters, args.queries, args.top_k, args.batch)
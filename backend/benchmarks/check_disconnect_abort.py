@@ -0,0 +1,162 @@
+"""
+Checks that a chat stream stops its upstream generation when the client goes
+away, instead of reading from Ollama until the model finishes.
+
+Runs the real app against a fake Ollama that generates ``--tokens`` tokens at
+``--token-delay`` seconds each and stops as soon as its client hangs up.
+Scenarios:
+
+* disconnect    - a client reads a few chunks of /api/chat and closes the
+                  connection
+* cancelled     - the task iterating the StreamingResponse is cancelled
+* stuck send    - the ASGI send() never returns (a client that stopped
+                  reading) and the server then reports a disconnect, which
+                  leaves the body generator suspended at a yield
+
+One complete chat runs first so there is a typical reply length to estimate
+the tokens saved from. For each scenario the upstream request must be gone,
+the fake must have stopped generating and the admission slot must be free
+within ``--bound`` seconds.
+Exits with status 1 when a scenario fails.
+
+Usage (from the backend directory):
+    python -m benchmarks.check_disconnect_abort --tokens 1000 --token-delay 0.005 --bound 1.0
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+
+async def wait_for(condition, timeout: float) -> float:
+    """Seconds until ``condition()`` held, or None after ``timeout``"""
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return None
+        await asyncio.sleep(0.002)
+    return time.perf_counter() - start
+
+
+async def client_disconnect(client: httpx.AsyncClient, chunks: int):
+    async with client.stream("POST", "/api/chat", json={"model": "llama2", "prompt": "hello"}) as response:
+        read = 0
+        async for _ in response.aiter_raw():
+            read += 1
+            if read >= chunks:
+                break
+    # Leaving the block without reading the body closes the connection
+
+
+async def cancelled(ollama, chunks: int):
+    response = await ollama.ollama_stream("llama2", "system", 0.7, "hello")
+
+    async def consume():
+        read = 0
+        async for _ in response.body_iterator:
+            read += 1
+            if read >= chunks:
+                await asyncio.Event().wait()
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.2)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def stuck_send(ollama, chunks: int):
+    response = await ollama.ollama_stream("llama2", "system", 0.7, "hello")
+    sent = 0
+    disconnect = asyncio.Event()
+
+    async def send(message):
+        nonlocal sent
+        sent += 1
+        if sent > chunks:
+            disconnect.set()
+            await asyncio.Event().wait()
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    await response({"type": "http"}, receive, send)
+
+
+async def main(tokens: int, token_delay: float, chunks: int, bound: float):
+    port = free_port()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+
+    from app.main import app
+    from app.utils import metrics, ollama
+    from app.utils.admission import chat_scheduler
+    from app.utils.http_client import upstream_clients
+
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    fake = FakeOllama(tokens=tokens, token_delay=token_delay)
+    upstream = ollama.OLLAMA_HOST
+    full = tokens * token_delay
+    print(f"fake Ollama: {tokens} tokens, {full:.1f} s per generation, client leaves after {chunks} chunks")
+    print(f"{'scenario':<14}{'upstream closed':>17}{'generation stopped':>20}{'slot free':>11}{'tokens generated':>18}  result")
+
+    failures = 0
+    async with serve(fake, port), serve(app) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            chat_scheduler.enabled = False
+            response = await ollama.ollama_stream("llama2", "system", 0.7, "hello")
+            async for _ in response.body_iterator:
+                pass
+
+            scenarios = (
+                ("disconnect", lambda: client_disconnect(client, chunks)),
+                ("cancelled", lambda: cancelled(ollama, chunks)),
+                ("stuck send", lambda: stuck_send(ollama, chunks)),
+            )
+            for label, run in scenarios:
+                fake.reset()
+                chat_scheduler.enabled = label == "disconnect"
+                chat_scheduler._lanes.clear()
+                await run()
+                stats = upstream_clients.stats(upstream)
+                closed = await wait_for(lambda: stats.in_flight == 0, bound)
+                stopped = await wait_for(lambda: fake.active == 0, bound)
+                lane = chat_scheduler._lanes.get("llama2")
+                free = await wait_for(lambda: lane is None or lane.active == 0, bound)
+                ok = None not in (closed, stopped, free) and fake.aborted == 1
+                failures += not ok
+
+                def ms(value):
+                    return f"{value * 1000:.0f} ms" if value is not None else "timeout"
+
+                print(f"{label:<14}{ms(closed):>17}{ms(stopped):>20}{ms(free):>11}{fake.generated:>11} / {tokens:<5} "
+                      f"{'ok' if ok else 'FAILED'}")
+
+    if metrics.METRICS_ENABLED:
+        aborted = sum(sample.value for sample in metrics.CHAT_STREAMS_ABORTED.collect()[0].samples
+                      if sample.name.endswith("_total"))
+        saved = sum(sample.value for sample in metrics.CHAT_TOKENS_SAVED.collect()[0].samples
+                    if sample.name.endswith("_total"))
+        print(f"\nchat_streams_aborted_total {aborted:.0f}, chat_tokens_saved_total {saved:.0f} (estimated)")
+    await upstream_clients.aclose()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--token-delay", type=float, default=0.005, help="fake time per generated token in seconds")
+    parser.add_argument("--chunks", type=int, default=5, help="chunks the client reads before it goes away")
+    parser.add_argument("--bound", type=float, default=1.0, help="seconds allowed for the upstream to be released")
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(main(args.tokens, args.token_delay, args.chunks, args.bound)) else 0)
@@ -0,0 +1,372 @@
+"""
+Minimal ASGI stand-ins for an Ollama server (FakeOllama) and an LM Studio
+server (FakeLMStudio).
+
+Serves /api/tags, /api/show and a streaming /api/generate, and records the
+client address of every request so benchmarks can count how many distinct
+TCP connections the backend opened, and how many requests hit each path.
+/api/tags and /api/show take ``metadata_delay`` seconds to answer. With
+``slots`` only that many generations run at once and the rest queue, the way
+Ollama handles more requests than OLLAMA_NUM_PARALLEL. /api/ps lists the
+models in memory (``loaded``, by default all of ``models``); generating with
+any other model first waits ``load_delay`` seconds and then loads it.
+
+/api/generate models prefill cost: it waits ``prefill_delay`` seconds per
+whitespace-separated word it has to process (system prompt and prompt, or only
+the prompt when a ``context`` is passed) and returns a ``context`` array in the
+final ``done`` object, like Ollama does. ``ttft`` adds a fixed delay before
+the first token. Like Ollama it stops generating as soon as the client closes
+the connection; ``active`` is the number of generations running, ``generated``
+the tokens produced so far and ``aborted`` the generations cut short by a
+disconnect.
+
+``chunking`` sets how the stream is cut into network writes:
+
+* line   - one write per line, like Ollama (default)
+* batch  - ``batch_lines`` lines per write
+* split  - every line split over two writes, so no write ends on a line break
+
+Failure injection, drawn from a generator seeded with ``seed``: a generation
+is answered with HTTP 500 with probability ``error_rate``, and has its
+connection dropped halfway through the tokens with probability ``drop_rate``.
+
+FakeLMStudio serves /v1/models and a streaming /v1/chat/completions in the
+OpenAI SSE format with the same knobs.
+
+/api/embed returns deterministic pseudo-random unit vectors derived from each
+input text, so equal texts always get equal embeddings.
+
+Run standalone (from the backend directory):
+    python -m benchmarks.fake_ollama --port 11434 --token-rate 50 --ttft 0.2 --chunking split --error-rate 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import socket
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import uvicorn
+
+
+class InjectedDrop(Exception):
+    """Raised inside a response to make the server cut the connection"""
+
+
+class _ChunkWriter:
+    """Writes stream lines to the ASGI ``send`` following a chunking pattern"""
+
+    def __init__(self, send, chunking: str, batch_lines: int):
+        self.send = send
+        self.chunking = chunking
+        self.batch_lines = batch_lines
+        self.pending = []
+
+    async def _body(self, data: bytes, more: bool = True):
+        await self.send({"type": "http.response.body", "body": data, "more_body": more})
+
+    async def write(self, line: bytes):
+        if self.chunking == "batch":
+            self.pending.append(line)
+            if len(self.pending) >= self.batch_lines:
+                await self.flush()
+        elif self.chunking == "split":
+            middle = len(line) // 2
+            await self._body(line[:middle])
+            await self._body(line[middle:])
+        else:
+            await self._body(line)
+
+    async def flush(self):
+        if self.pending:
+            data = b"".join(self.pending)
+            self.pending.clear()
+            await self._body(data)
+
+    async def close(self, last: bytes):
+        await self.flush()
+        await self._body(last, more=False)
+
+
+class FakeOllama:
+    generate_paths = ("/api/generate",)
+    stream_media_type = b"application/x-ndjson"
+
+    def __init__(self, tokens: int = 20, token_delay: float = 0.0, models=("llama2", "mistral"), prefill_delay: float = 0.0,
+                 dimensions: int = 768, embed_delay: float = 0.0, metadata_delay: float = 0.0, slots: int = 0,
+                 load_delay: float = 0.0, loaded=None, ttft: float = 0.0, chunking: str = "line", batch_lines: int = 4,
+                 error_rate: float = 0.0, drop_rate: float = 0.0, seed: int = 0):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.prefill_delay = prefill_delay
+        self.prefilled = []
+        self.dimensions = dimensions
+        self.embed_delay = embed_delay
+        self.metadata_delay = metadata_delay
+        # Like OLLAMA_NUM_PARALLEL: generations beyond this many wait in arrival order (0 = no limit)
+        self.slots = asyncio.Semaphore(slots) if slots else None
+        # Models in memory, as reported by /api/ps; the first generation of another model takes load_delay
+        self.load_delay = load_delay
+        self.loaded = set(models if loaded is None else loaded)
+        self.cold_loads = 0
+        self._loading = {}
+        self.ttft = ttft
+        if chunking not in ("line", "batch", "split"):
+            raise ValueError(f"Unknown chunking pattern: {chunking}")
+        self.chunking = chunking
+        self.batch_lines = batch_lines
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.errors_injected = 0
+        self.drops_injected = 0
+        self.embedded = 0
+        self.models = list(models)
+        self.connections = set()
+        self.requests = 0
+        self.paths = Counter()
+        self.active = 0
+        self.generated = 0
+        self.aborted = 0
+        self.last_stopped_at = None
+
+    def reset(self):
+        self.connections.clear()
+        self.requests = 0
+        self.paths.clear()
+        self.prefilled.clear()
+        self.embedded = 0
+        self.cold_loads = 0
+        self.generated = 0
+        self.aborted = 0
+        self.last_stopped_at = None
+        self.errors_injected = 0
+        self.drops_injected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        self.requests += 1
+        self.paths[scope["path"]] += 1
+        self.connections.add(tuple(scope.get("client") or ()))
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        path = scope["path"]
+        if path in self.generate_paths:
+            request = json.loads(body or b"{}")
+            if self.slots is None:
+                await self._generate(receive, send, request)
+            else:
+                async with self.slots:
+                    await self._generate(receive, send, request)
+        else:
+            await self.handle(path, body, send)
+
+    async def handle(self, path: str, body: bytes, send):
+        """Non-streaming endpoints"""
+        if self.metadata_delay and path in ("/api/tags", "/api/show"):
+            await asyncio.sleep(self.metadata_delay)
+        if path == "/api/tags":
+            await self._json(send, {"models": [
+                {"name": name, "modified_at": "2024-01-01T00:00:00Z", "size": 1, "digest": f"sha256:{name}"}
+                for name in self.models
+            ]})
+        elif path == "/api/ps":
+            await self._json(send, {"models": [{"name": name, "model": name} for name in sorted(self.loaded)]})
+        elif path == "/api/show":
+            await self._json(send, {"license": "MIT", "modelfile": "", "parameters": "", "template": "", "system": ""})
+        elif path == "/api/embed":
+            request = json.loads(body or b"{}")
+            texts = request.get("input") or []
+            if isinstance(texts, str):
+                texts = [texts]
+            self.embedded += len(texts)
+            if self.embed_delay:
+                await asyncio.sleep(self.embed_delay * len(texts))
+            await self._json(send, {"model": request.get("model"), "embeddings": [self.embedding(text) for text in texts]})
+        else:
+            await self._json(send, {"error": "not found"}, status=404)
+
+    def embedding(self, text: str):
+        vector = [byte - 127.5 for byte in hashlib.shake_256(text.encode("utf-8")).digest(self.dimensions)]
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector]
+
+    async def _json(self, send, payload, status=200):
+        data = json.dumps(payload).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]})
+        await send({"type": "http.response.body", "body": data})
+
+    def prompt_words(self, request) -> int:
+        """Words the model has to prefill for a request"""
+        words = len(request.get("prompt", "").split())
+        if not request.get("context"):
+            words += len((request.get("system") or "").split())
+        return words
+
+    def token_line(self, model: str, i: int) -> bytes:
+        return (json.dumps({"model": model, "response": f"tok{i} ", "done": False}) + "\n").encode()
+
+    def final_line(self, model: str, request, words: int) -> bytes:
+        context = list(request.get("context") or [])
+        context.extend(range(len(context), len(context) + words + self.tokens))
+        return (json.dumps({"model": model, "response": "", "done": True, "context": context}) + "\n").encode()
+
+    async def _generate(self, receive, send, request):
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors_injected += 1
+            await self._json(send, {"error": "injected failure"}, status=500)
+            return
+        drop_at = self.tokens // 2 if self.drop_rate and self.random.random() < self.drop_rate else None
+
+        self.active += 1
+        disconnected = asyncio.Event()
+
+        async def watch():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await self._generate_tokens(send, request, disconnected, drop_at)
+        finally:
+            watcher.cancel()
+            self.active -= 1
+            self.last_stopped_at = time.perf_counter()
+
+    async def _generate_tokens(self, send, request, disconnected: asyncio.Event, drop_at):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", self.stream_media_type)]})
+        model = request.get("model", "llama2")
+        if model in self._loading:
+            await self._loading[model].wait()
+        elif model not in self.loaded:
+            self.cold_loads += 1
+            self._loading[model] = asyncio.Event()
+            await asyncio.sleep(self.load_delay)
+            self.loaded.add(model)
+            self._loading.pop(model).set()
+        words = self.prompt_words(request)
+        self.prefilled.append(words)
+        if self.prefill_delay:
+            await asyncio.sleep(self.prefill_delay * words)
+        if self.ttft:
+            await asyncio.sleep(self.ttft)
+        writer = _ChunkWriter(send, self.chunking, self.batch_lines)
+        for i in range(self.tokens):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            if disconnected.is_set():
+                self.aborted += 1
+                return
+            if i == drop_at:
+                self.drops_injected += 1
+                await writer.flush()
+                raise InjectedDrop(f"dropped after {i} tokens")
+            self.generated += 1
+            await writer.write(self.token_line(model, i))
+        await writer.close(self.final_line(model, request, words))
+
+
+class FakeLMStudio(FakeOllama):
+    """LM Studio's OpenAI-compatible API: /v1/models and a streaming /v1/chat/completions"""
+
+    generate_paths = ("/v1/chat/completions",)
+    stream_media_type = b"text/event-stream"
+
+    async def handle(self, path: str, body: bytes, send):
+        if self.metadata_delay and path == "/v1/models":
+            await asyncio.sleep(self.metadata_delay)
+        if path == "/v1/models":
+            await self._json(send, {"object": "list", "data": [
+                {"id": name, "object": "model", "owned_by": "organization_owner"} for name in self.models
+            ]})
+        else:
+            await self._json(send, {"error": "not found"}, status=404)
+
+    def prompt_words(self, request) -> int:
+        return sum(len((message.get("content") or "").split()) for message in request.get("messages") or [])
+
+    def token_line(self, model: str, i: int) -> bytes:
+        chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                 "choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": None}]}
+        return f"data: {json.dumps(chunk)}\n\n".encode()
+
+    def final_line(self, model: str, request, words: int) -> bytes:
+        chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        return f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def serve(app, port: int = 0):
+    """Run an ASGI app with uvicorn inside the current event loop"""
+    port = port or free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on", timeout_keep_alive=120)
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Command line knobs of the fakes, shared with the load generator"""
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per reply")
+    parser.add_argument("--token-rate", type=float, default=50, help="tokens per second per stream (0 = no delay)")
+    parser.add_argument("--ttft", type=float, default=0.1, help="seconds before the first token")
+    parser.add_argument("--chunking", choices=("line", "batch", "split"), default="line")
+    parser.add_argument("--batch-lines", type=int, default=4, help="lines per write with --chunking batch")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of generations answered with HTTP 500")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of generations dropped halfway")
+    parser.add_argument("--slots", type=int, default=0, help="generations run at once, the rest queue (0 = no limit)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def from_arguments(args: argparse.Namespace, lmstudio: bool = False) -> FakeOllama:
+    return (FakeLMStudio if lmstudio else FakeOllama)(
+        tokens=args.tokens, token_delay=1 / args.token_rate if args.token_rate > 0 else 0.0, ttft=args.ttft,
+        chunking=args.chunking, batch_lines=args.batch_lines, error_rate=args.error_rate, drop_rate=args.drop_rate,
+        slots=args.slots, seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--lmstudio", action="store_true", help="serve the LM Studio API instead of Ollama's")
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(from_arguments(args, args.lmstudio), host=args.host, port=args.port, log_level="warning",
+                timeout_keep_alive=120)
@@ -0,0 +1,443 @@
+"""
+Load generator for the backend: /api/chat, /api/messages/* and /api/models.
+
+By default everything runs on this machine with no network access and no
+GPU: a fake Ollama (or LM Studio with ``--lmstudio``, see fake_ollama.py for
+the knobs) and the app under uvicorn, each in its own process, so the app's
+memory and CPU can be sampled on their own. With ``--url`` an already running
+backend is driven instead (pass ``--pid`` to sample its memory and CPU).
+
+``--concurrency`` workers send requests back to back for ``--warmup`` plus
+``--duration`` seconds; only requests that complete within the last
+``--duration`` seconds are counted. Each request is drawn from ``--mix``
+(weights per scenario):
+
+* chat     - POST /api/chat, streamed to the end
+* messages - POST /api/messages/save and GET /api/messages/get-session/{id}
+             alternately, on a scratch chat session that is deleted again
+             (needs the PostgreSQL database configured through PG_*)
+* models   - GET /api/models
+
+Reported per endpoint: requests/sec, errors and latency p50/p95/p99 of the
+successful requests; for chat
+also time to first token and inter-token latency (time between the first and
+last byte over the words in the reply); for the app its RSS (start, peak, end)
+and CPU seconds. ``--output`` writes the results as JSON; ``--baseline``
+compares against an earlier file and exits with status 1 when a metric got
+worse by more than ``--tolerance`` (and, for times, by at least
+``--min-delta-ms``, so noise on very fast endpoints is not flagged).
+
+Usage (from the backend directory):
+    python -m benchmarks.loadgen --duration 30 --concurrency 32 --mix chat=6,messages=3,models=1 \\
+        --token-rate 50 --ttft 0.2 --output results.json
+    python -m benchmarks.loadgen --duration 30 --concurrency 32 --baseline results.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.fake_ollama import add_arguments, free_port
+
+# Metrics compared with a baseline, and whether a higher value is better
+COMPARED = {
+    "rps": True,
+    "error_ratio": False,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "ttft_ms.p50": False,
+    "ttft_ms.p95": False,
+    "ttft_ms.p99": False,
+    "itl_ms.p50": False,
+    "itl_ms.p95": False,
+    "itl_ms.p99": False,
+}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summary(values):
+    if not values:
+        return None
+    return {name: round(percentile(values, q) * 1000, 2) for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+
+
+class Recorder:
+    """Samples of the requests completed within the measured window, per endpoint"""
+
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.completed = defaultdict(int)
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.ttft = []
+        self.itl = []
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> bool:
+        if not self.start <= time.monotonic() <= self.end:
+            return False
+        self.completed[endpoint] += 1
+        if ok:
+            self.latency[endpoint].append(seconds)
+        else:
+            self.errors[endpoint] += 1
+        return True
+
+
+async def chat(client: httpx.AsyncClient, recorder: Recorder, state):
+    start = time.perf_counter()
+    first = last = None
+    body = []
+    ok = False
+    try:
+        async with client.stream("POST", "/api/chat", json={
+            "model": state["model"], "prompt": f"question {random.random()}", "options": {"temperature": 0.7},
+        }) as response:
+            async for chunk in response.aiter_raw():
+                last = time.perf_counter()
+                if first is None:
+                    first = last
+                body.append(chunk)
+            ok = response.status_code == 200 and first is not None
+    except httpx.HTTPError:
+        pass
+    if recorder.record("chat", time.perf_counter() - start, ok) and ok:
+        recorder.ttft.append(first - start)
+        words = len(b"".join(body).split())
+        if words > 1:
+            recorder.itl.append((last - first) / (words - 1))
+
+
+async def messages(client: httpx.AsyncClient, recorder: Recorder, state):
+    state["messages"] += 1
+    start = time.perf_counter()
+    try:
+        if state["messages"] % 2:
+            endpoint = "messages.save"
+            response = await client.post("/api/messages/save", json={
+                "session_id": state["session_id"], "sender": "user", "content": f"load test message {state['messages']}",
+            })
+        else:
+            endpoint = "messages.get_session"
+            response = await client.get(f"/api/messages/get-session/{state['session_id']}", params={"limit": 50})
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    recorder.record(endpoint, time.perf_counter() - start, ok)
+
+
+async def models(client: httpx.AsyncClient, recorder: Recorder, state):
+    start = time.perf_counter()
+    try:
+        ok = (await client.get("/api/models")).status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    recorder.record("models", time.perf_counter() - start, ok)
+
+
+SCENARIOS = {"chat": chat, "messages": messages, "models": models}
+
+
+def parse_mix(value: str):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class ProcessSampler:
+    """RSS and CPU time of a process, read from /proc"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.rss = []
+        self._task = None
+
+    def rss_mib(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as stat:
+                fields = stat.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except OSError:
+            return None
+
+    async def _sample(self, interval: float):
+        while True:
+            rss = self.rss_mib()
+            if rss is not None:
+                self.rss.append(rss)
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = 0.25):
+        self._task = asyncio.create_task(self._sample(interval))
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        rss = self.rss_mib()
+        if rss is not None:
+            self.rss.append(rss)
+
+
+async def wait_ready(url: str, process=None, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise SystemExit(f"{url} exited with status {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f} s")
+
+
+def start_servers(args):
+    """Fake upstream and the app in their own processes; returns (processes, app url, app pid)"""
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake_args = [
+        "--port", str(fake_port), "--tokens", str(args.tokens), "--token-rate", str(args.token_rate),
+        "--ttft", str(args.ttft), "--chunking", args.chunking, "--batch-lines", str(args.batch_lines),
+        "--error-rate", str(args.error_rate), "--drop-rate", str(args.drop_rate), "--slots", str(args.slots),
+        "--seed", str(args.seed),
+    ]
+    if args.lmstudio:
+        fake_args.append("--lmstudio")
+    fake = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_ollama", *fake_args])
+
+    env = dict(os.environ, OLLAMA_HOST=fake_url)
+    if args.lmstudio:
+        env["LMSTUDIO_HOST"] = fake_url
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning", "--timeout-keep-alive", "120"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return [fake, app], fake_url, f"http://127.0.0.1:{app_port}", app.pid
+
+
+async def create_session():
+    from app.db.database import AsyncSessionLocal
+    from app.models.models import ChatSession
+
+    async with AsyncSessionLocal() as db:
+        session = ChatSession(session_title="loadgen")
+        db.add(session)
+        await db.commit()
+        return session.id
+
+
+async def delete_session(session_id: int):
+    from sqlalchemy import delete
+
+    from app.db.database import AsyncSessionLocal, async_engine
+    from app.models.models import ChatSession
+
+    async with AsyncSessionLocal() as db:
+        # messages are removed by the ON DELETE CASCADE foreign key
+        await db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+        await db.commit()
+    await async_engine.dispose()
+
+
+async def run(args):
+    processes = []
+    pid = args.pid
+    url = args.url
+    state = {"model": args.model, "messages": 0, "session_id": None}
+    try:
+        if url is None:
+            processes, fake_url, url, pid = start_servers(args)
+            await wait_ready(fake_url + ("/v1/models" if args.lmstudio else "/api/tags"), processes[0])
+            await wait_ready(url + "/", processes[1])
+        if "messages" in args.mix:
+            state["session_id"] = await create_session()
+
+        sampler = ProcessSampler(pid) if pid else None
+        measure_from = time.monotonic() + args.warmup
+        recorder = Recorder(measure_from, measure_from + args.duration)
+        names, weights = list(args.mix), list(args.mix.values())
+        rng = random.Random(args.seed)
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+
+            async def worker():
+                while True:
+                    await SCENARIOS[rng.choices(names, weights)[0]](client, recorder, state)
+
+            workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+            await asyncio.sleep(args.warmup)
+            if sampler is not None:
+                sampler.start()
+                cpu_start = sampler.cpu_seconds()
+            await asyncio.sleep(args.duration)
+            if sampler is not None:
+                await sampler.stop()
+                cpu_end = sampler.cpu_seconds()
+            # Requests still running are not counted
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        elapsed = args.duration
+    finally:
+        if state["session_id"] is not None:
+            await delete_session(state["session_id"])
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    endpoints = {}
+    for endpoint, completed in sorted(recorder.completed.items()):
+        endpoints[endpoint] = {
+            "requests": completed,
+            "errors": recorder.errors[endpoint],
+            "error_ratio": round(recorder.errors[endpoint] / completed, 4),
+            "rps": round(completed / elapsed, 2),
+            "latency_ms": summary(recorder.latency[endpoint]),
+        }
+    if "chat" in endpoints:
+        endpoints["chat"]["ttft_ms"] = summary(recorder.ttft)
+        endpoints["chat"]["itl_ms"] = summary(recorder.itl)
+    total = sum(recorder.completed.values())
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "tolerance", "min_delta_ms")}
+    return {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        "seconds": round(elapsed, 2),
+        "rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+        "app": {
+            "rss_mib": {
+                "start": round(sampler.rss[0], 1), "peak": round(max(sampler.rss), 1), "end": round(sampler.rss[-1], 1),
+            } if sampler is not None and sampler.rss else None,
+            "cpu_seconds": round(cpu_end - cpu_start, 2) if sampler is not None and cpu_start is not None else None,
+        },
+    }
+
+
+def print_results(results):
+    print(f"{results['seconds']:.0f} s measured, {results['rps']:.1f} requests/s in total")
+    print(f"{'endpoint':<24}{'req/s':>8}{'errors':>8}{'p50':>12}{'p95':>12}{'p99':>12}")
+    rows = []
+    for endpoint, result in results["endpoints"].items():
+        rows.append((endpoint, result, "latency_ms"))
+        for extra in ("ttft_ms", "itl_ms"):
+            if result.get(extra):
+                rows.append((f"  {endpoint} {extra[:-3]}", result, extra))
+    for label, result, key in rows:
+        if key == "latency_ms":
+            head = f"{label:<24}{result['rps']:>8.1f}{result['errors']:>8}"
+        else:
+            head = f"{label:<24}{'':>16}"
+        values = result[key] or {}
+        print(head + "".join(f"{values.get(q, 0):>9.1f} ms" for q in ("p50", "p95", "p99")))
+    app = results["app"]
+    if app["rss_mib"]:
+        rss = app["rss_mib"]
+        print(f"app RSS {rss['start']:.0f} -> peak {rss['peak']:.0f} -> {rss['end']:.0f} MiB, "
+              f"CPU {app['cpu_seconds']:.1f} s")
+
+
+def flatten(results):
+    flat = {}
+    for endpoint, result in results["endpoints"].items():
+        for metric in COMPARED:
+            key, _, q = metric.partition(".")
+            value = result.get(key)
+            if q:
+                value = value.get(q) if value else None
+            if value is not None:
+                flat[f"{endpoint} {metric}"] = (value, COMPARED[metric])
+    if results["app"]["rss_mib"]:
+        flat["app rss_mib.peak"] = (results["app"]["rss_mib"]["peak"], False)
+    return flat
+
+
+def compare(results, baseline, tolerance: float, min_delta_ms: float) -> int:
+    """Print the changes against ``baseline``; returns the number of regressions"""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = 0
+    print(f"\ncompared with the baseline from {baseline['created_at']} (tolerance {tolerance * 100:.0f}%)")
+    differences = [key for key, value in results["config"].items() if baseline["config"].get(key) != value]
+    if differences:
+        print(f"note: the configuration differs in {', '.join(differences)}")
+    print(f"{'metric':<34}{'baseline':>11}{'current':>11}{'change':>9}")
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous:
+            continue
+        before = previous[name][0]
+        change = (value - before) / before if before else (0.0 if value == before else float("inf"))
+        worse = -change if higher_is_better else change
+        # Ratios near zero (errors) are compared in absolute terms
+        if name.endswith("error_ratio"):
+            regressed = worse > tolerance and value - before > 0.01
+        elif "_ms." in name:
+            regressed = worse > tolerance and value - before >= min_delta_ms
+        else:
+            regressed = worse > tolerance
+        regressions += regressed
+        print(f"{name:<34}{before:>11.2f}{value:>11.2f}{change * 100:>+8.0f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive this running backend instead of starting one")
+    parser.add_argument("--pid", type=int, help="process id of the backend behind --url, to sample its RSS and CPU")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=6,messages=3,models=1"))
+    parser.add_argument("--model", default="llama2")
+    parser.add_argument("--lmstudio", action="store_true", help="start a fake LM Studio instead of a fake Ollama")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=5, help="smallest change of a time that counts as a regression")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            if compare(results, json.load(baseline), args.tolerance, args.min_delta_ms):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Shared fixtures. The suite needs no database and no Ollama: upstream calls go
+to the fake Ollama of the benchmarks, started on a free port for each test
+that asks for ``fake_ollama``. Async tests are marked with ``pytest.mark.anyio``
+(the pytest plugin that comes with anyio).
+"""
+import os
+
+import pytest
+
+from benchmarks.fake_ollama import FakeOllama, free_port, serve
+
+# Read by app.utils.ollama at import time, so it is set before any app module is imported
+OLLAMA_PORT = free_port()
+os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{OLLAMA_PORT}"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def fake_ollama():
+    """A FakeOllama at OLLAMA_HOST; module state tied to the test's event loop is reset afterwards"""
+    from app.utils.admission import chat_scheduler
+    from app.utils.http_client import upstream_clients
+    from app.utils.ollama import _model_misses, backend_pool, model_cache
+
+    fake = FakeOllama(tokens=20)
+    async with serve(fake, OLLAMA_PORT):
+        try:
+            yield fake
+        finally:
+            # Pooled clients and cached lists belong to this test's event loop and fake
+            await upstream_clients.aclose()
+            await model_cache.aclose()
+            model_cache.invalidate()
+            _model_misses.clear()
+            chat_scheduler._lanes.clear()
+            for backend in backend_pool.backends:
+                backend.failures = 0
+                backend.ejected_until = 0.0
@@ -0,0 +1,215 @@
+"""
+The admission slot of a chat is given back on every way a chat can end, and
+exactly once.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api import chat as chat_api
+from app.utils import ollama
+from app.utils.admission import AdmissionRejected, ChatScheduler, chat_scheduler
+from app.utils.auth import user_from_token
+from app.utils.response_cache import response_cache
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def chat_client(fake_ollama):
+    app = FastAPI()
+    app.include_router(chat_api.router)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def active(model: str = "llama2") -> int:
+    return chat_scheduler._lanes[model].active
+
+
+async def test_release_is_idempotent():
+    scheduler = ChatScheduler(True, 1, {}, 4, 1.0)
+    ticket = await scheduler.acquire("llama2", "a")
+    ticket.release()
+    ticket.release()
+    assert scheduler._lanes["llama2"].active == 0
+
+
+async def test_released_when_the_stream_completes(fake_ollama):
+    ticket = await chat_scheduler.acquire("llama2", "test")
+    response = await ollama.ollama_stream("llama2", "system", 0.7, "hello", release=ticket.release)
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    assert body.count(b"tok") == fake_ollama.tokens
+    assert active() == 0
+
+
+async def test_released_when_the_body_never_starts(fake_ollama):
+    ticket = await chat_scheduler.acquire("llama2", "test")
+    completions = []
+    response = await ollama.ollama_stream(
+        "llama2", "system", 0.7, "hello",
+        on_complete=lambda reply, aborted: completions.append((reply, aborted)), release=ticket.release
+    )
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        raise OSError("client gone")
+
+    with pytest.raises(OSError):
+        await response({"type": "http"}, receive, send)
+    assert active() == 0
+    assert fake_ollama.requests == 0
+    assert completions == [("", True)]
+
+
+async def test_completion_reported_once_for_a_sent_reply(fake_ollama):
+    completions = []
+    response = await ollama.ollama_stream(
+        "llama2", "system", 0.7, "hello", on_complete=lambda reply, aborted: completions.append((reply, aborted))
+    )
+    messages = []
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await response({"type": "http"}, receive, send)
+    assert len(completions) == 1
+    reply, aborted = completions[0]
+    assert not aborted
+    assert reply.count("tok") == fake_ollama.tokens
+
+
+async def test_released_after_an_upstream_error(fake_ollama):
+    fake_ollama.error_rate = 1.0
+    ticket = await chat_scheduler.acquire("llama2", "test")
+    response = await ollama.ollama_stream("llama2", "system", 0.7, "hello", release=ticket.release)
+    with pytest.raises(ollama.OllamaError):
+        async for _ in response.body_iterator:
+            pass
+    assert active() == 0
+
+
+async def test_released_at_once_for_a_cached_reply(fake_ollama, monkeypatch):
+    monkeypatch.setattr(response_cache, "enabled", True)
+    response = await ollama.ollama_stream("llama2", "system", 0.0, "cached")
+    async for _ in response.body_iterator:
+        pass
+
+    ticket = await chat_scheduler.acquire("llama2", "test")
+    requests = fake_ollama.requests
+    await ollama.ollama_stream("llama2", "system", 0.0, "cached", release=ticket.release)
+    assert active() == 0
+    assert fake_ollama.requests == requests
+
+
+async def test_released_when_the_chat_route_fails(chat_client, monkeypatch):
+    async def failing_stream(*args, **kwargs):
+        raise ollama.OllamaError("upstream down")
+
+    monkeypatch.setattr(chat_api, "ollama_stream", failing_stream)
+    async with chat_client:
+        response = await chat_client.post("/api/chat", json={"model": "llama2", "prompt": "hello"})
+    assert response.json()["error"] == "Ollama Error"
+    assert active() == 0
+
+
+async def test_clients_are_queued_by_verified_user(chat_client, fake_ollama, monkeypatch):
+    """Made-up tokens from one address share that address's lane; one user's tokens share the user's"""
+    async def fake_user_from_token(db, token):
+        # Made-up tokens go through the real check, which rejects them without a database
+        return SimpleNamespace(id=7) if token.startswith("valid") else await user_from_token(db, token)
+
+    monkeypatch.setattr(chat_api, "user_from_token", fake_user_from_token)
+    monkeypatch.setattr(chat_scheduler, "default_slots", 1)
+    fake_ollama.tokens = 1000
+    fake_ollama.token_delay = 0.005
+    tokens = ["valid-a", "spoofed-1", "spoofed-2", "spoofed-3", "valid-b", "valid-c"]
+
+    async with chat_client:
+        requests = []
+        for token in tokens:
+            requests.append(asyncio.create_task(chat_client.post(
+                "/api/chat", json={"model": "llama2", "prompt": "hello"}, headers={"Authorization": f"Bearer {token}"}
+            )))
+            # Keep the arrival order, the first request takes the only slot
+            await asyncio.sleep(0.05)
+        try:
+            waiting = chat_scheduler.stats()["models"]["llama2"]["waiting_by_client"]
+            assert waiting == {"ip:127.0.0.1": 3, "user:7": 2}
+        finally:
+            for request in requests:
+                request.cancel()
+            await asyncio.gather(*requests, return_exceptions=True)
+
+
+async def test_unknown_model_gets_no_lane(chat_client):
+    async with chat_client:
+        response = await chat_client.post("/api/chat", json={"model": "no-such-model", "prompt": "hello"})
+    assert response.status_code == 404
+    assert "no-such-model" not in chat_scheduler._lanes
+
+
+async def test_model_pulled_after_the_list_was_cached(chat_client, fake_ollama):
+    async with chat_client:
+        assert await ollama.is_known_model("llama2")
+        fake_ollama.models.append("phi")
+        response = await chat_client.post("/api/chat", json={"model": "phi", "prompt": "hello"})
+    assert response.status_code == 200
+    assert fake_ollama.paths["/api/tags"] == 2
+
+
+async def test_missing_model_refetches_the_list_once_per_ttl(chat_client, fake_ollama):
+    async with chat_client:
+        for _ in range(3):
+            response = await chat_client.post("/api/chat", json={"model": "no-such-model", "prompt": "hello"})
+            assert response.status_code == 404
+    assert fake_ollama.paths["/api/tags"] == 2
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = ChatScheduler(True, 1, {}, 4, 5.0)
+    holder = await scheduler.acquire("llama2", "a")
+    waiter = asyncio.create_task(scheduler.acquire("llama2", "b"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    lane = scheduler._lanes["llama2"]
+    assert (lane.active, lane.waiting, lane.cancelled) == (1, 0, 1)
+    holder.release()
+    assert lane.active == 0
+
+
+async def test_slot_handed_to_a_waiter_as_it_is_cancelled():
+    scheduler = ChatScheduler(True, 1, {}, 4, 5.0)
+    holder = await scheduler.acquire("llama2", "a")
+    waiter = asyncio.create_task(scheduler.acquire("llama2", "b"))
+    await asyncio.sleep(0)
+    holder.release()
+    waiter.cancel()
+    # Either the cancellation wins and the slot is passed on, or the waiter gets the slot
+    try:
+        (await waiter).release()
+    except asyncio.CancelledError:
+        pass
+    lane = scheduler._lanes["llama2"]
+    assert (lane.active, lane.waiting) == (0, 0)
+
+
+async def test_queue_timeout_leaves_no_waiter():
+    scheduler = ChatScheduler(True, 1, {}, 4, 0.05)
+    holder = await scheduler.acquire("llama2", "a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        await scheduler.acquire("llama2", "b")
+    assert rejected.value.status_code == 503
+    lane = scheduler._lanes["llama2"]
+    assert (lane.active, lane.waiting) == (1, 0)
+    holder.release()
+    assert lane.active == 0
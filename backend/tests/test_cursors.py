@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.messages import _decode_cursor, _decode_search_cursor, _encode_cursor, _encode_search_cursor
+
+
+def test_history_cursor_round_trip():
+    created_at = datetime(2024, 5, 17, 13, 45, 2, 123456)
+    cursor = _encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert _decode_cursor(cursor) == (created_at, 42)
+
+
+def test_search_cursor_keeps_the_exact_rank():
+    # ts_rank_cd returns float4 values; the cursor must compare equal to the row it came from
+    rank = 0.10000000149011612
+    assert _decode_search_cursor(_encode_search_cursor(rank, 7)) == (rank, 7)
+
+
+@pytest.mark.parametrize("decode", [_decode_cursor, _decode_search_cursor])
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "bm90aGluZw", "MjAyNC0wMS0wMXx4"])
+def test_invalid_cursors_are_rejected(decode, cursor):
+    with pytest.raises(HTTPException) as error:
+        decode(cursor)
+    assert error.value.status_code == 400
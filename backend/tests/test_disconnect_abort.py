@@ -0,0 +1,114 @@
+"""
+A chat stream must stop its upstream generation, and give back its
+admission slot, as soon as the client is gone (the scenarios of
+benchmarks/check_disconnect_abort.py).
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api.chat import router as chat_router
+from app.utils import ollama
+from app.utils.admission import chat_scheduler
+from app.utils.http_client import upstream_clients
+from benchmarks.fake_ollama import serve
+
+pytestmark = pytest.mark.anyio
+
+# Seconds allowed for the upstream request and the slot to be released
+BOUND = 1.0
+# Chunks the client reads before it goes away
+CHUNKS = 5
+
+
+async def wait_for(condition, timeout: float = BOUND) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.002)
+    return True
+
+
+@pytest.fixture
+def slow_ollama(fake_ollama):
+    # 5 s per generation, far longer than any of the tests waits
+    fake_ollama.tokens = 1000
+    fake_ollama.token_delay = 0.005
+    return fake_ollama
+
+
+async def assert_stopped(fake):
+    stats = upstream_clients.stats(ollama.OLLAMA_HOST)
+    assert await wait_for(lambda: stats.in_flight == 0), "upstream request still open"
+    assert await wait_for(lambda: fake.active == 0), "upstream still generating"
+    assert fake.aborted == 1
+    assert fake.generated < fake.tokens
+    lane = chat_scheduler._lanes.get("llama2")
+    assert await wait_for(lambda: lane is None or lane.active == 0), "admission slot not released"
+
+
+async def test_client_disconnect(slow_ollama):
+    app = FastAPI()
+    app.include_router(chat_router)
+    async with serve(app) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            async with client.stream("POST", "/api/chat", json={"model": "llama2", "prompt": "hello"}) as response:
+                assert response.status_code == 200
+                read = 0
+                async for _ in response.aiter_raw():
+                    read += 1
+                    if read >= CHUNKS:
+                        break
+            # Leaving the block without reading the body closes the connection
+            await assert_stopped(slow_ollama)
+
+
+async def test_cancelled_response(slow_ollama):
+    """The task running the response is cancelled while it waits in send()"""
+    ticket = await chat_scheduler.acquire("llama2", "test")
+    response = await ollama.ollama_stream("llama2", "system", 0.7, "hello", release=ticket.release)
+    sent = 0
+    read = asyncio.Event()
+
+    async def send(message):
+        nonlocal sent
+        sent += 1
+        if sent > CHUNKS:
+            read.set()
+            await asyncio.Event().wait()
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    task = asyncio.create_task(response({"type": "http"}, receive, send))
+    await asyncio.wait_for(read.wait(), 5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await assert_stopped(slow_ollama)
+
+
+async def test_stuck_send(slow_ollama):
+    """send() never returns and the server reports a disconnect, leaving the body suspended at a yield"""
+    ticket = await chat_scheduler.acquire("llama2", "test")
+    response = await ollama.ollama_stream("llama2", "system", 0.7, "hello", release=ticket.release)
+    sent = 0
+    disconnect = asyncio.Event()
+
+    async def send(message):
+        nonlocal sent
+        sent += 1
+        if sent > CHUNKS:
+            disconnect.set()
+            await asyncio.Event().wait()
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    await asyncio.wait_for(response({"type": "http"}, receive, send), 5)
+    await assert_stopped(slow_ollama)
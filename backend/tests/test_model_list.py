@@ -0,0 +1,34 @@
+import pytest
+
+from app.utils import ollama
+from app.utils.ollama import DEFAULT_MODEL, ModelListParseError, model_cache
+
+pytestmark = pytest.mark.anyio
+
+
+def make_tags_unreadable(fake, monkeypatch):
+    """Make /api/tags answer with entries that are not models"""
+    send_json = fake._json
+
+    async def _json(send, payload, status=200):
+        if "models" in payload:
+            payload = {"models": ["not a model"]}
+        await send_json(send, payload, status)
+
+    monkeypatch.setattr(fake, "_json", _json)
+
+
+async def test_unreadable_list_without_cache_gives_the_default(fake_ollama, monkeypatch):
+    make_tags_unreadable(fake_ollama, monkeypatch)
+    assert await ollama.get_ollama_models() == [DEFAULT_MODEL]
+    assert model_cache.peek("models") is None
+    await ollama.get_ollama_models()
+    assert fake_ollama.paths["/api/tags"] == 2
+
+
+async def test_unreadable_list_keeps_the_cached_one(fake_ollama, monkeypatch):
+    cached = await ollama.get_ollama_models()
+    make_tags_unreadable(fake_ollama, monkeypatch)
+    with pytest.raises(ModelListParseError):
+        await ollama.get_ollama_models(refresh=True)
+    assert model_cache.peek("models") == cached
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+class Upstream:
+    """A call that blocks until released and records how often it ran and whether it was cancelled"""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return "result"
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_concurrent_calls_share_one():
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    waiters = [asyncio.create_task(flight.do("key", upstream)) for _ in range(5)]
+    await settle()
+    upstream.release.set()
+    assert await asyncio.gather(*waiters) == ["result"] * 5
+    assert upstream.started == 1
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "deduplicated": 4, "errors": 0, "cancelled": 0}
+
+
+async def test_every_waiter_gets_the_error():
+    flight = SingleFlight("test")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.errors == 1
+
+
+async def test_cancelled_waiter_leaves_the_call_running():
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    first = asyncio.create_task(flight.do("key", upstream))
+    second = asyncio.create_task(flight.do("key", upstream))
+    await settle()
+    first.cancel()
+    await settle()
+    assert first.cancelled()
+    assert upstream.cancelled == 0
+    upstream.release.set()
+    assert await second == "result"
+    assert flight.cancelled == 0
+
+
+async def test_last_waiter_cancelled_cancels_the_call():
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    waiters = [asyncio.create_task(flight.do("key", upstream)) for _ in range(2)]
+    await settle()
+    for waiter in waiters:
+        waiter.cancel()
+    await settle()
+    assert upstream.cancelled == 1
+    assert flight.cancelled == 1
+    assert flight.stats()["in_flight"] == 0
+
+    # The key is free again: the next caller starts a new call instead of joining the cancelled one
+    upstream.release.set()
+    assert await flight.do("key", upstream) == "result"
+    assert upstream.started == 2
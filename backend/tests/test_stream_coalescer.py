@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from app.utils.stream_coalescer import StreamCoalescer, coalesce, sse_message
+
+pytestmark = pytest.mark.anyio
+
+
+async def tokens(count: int, delay: float = 0.0, fail_after: int = None, closed: list = None):
+    try:
+        for i in range(count):
+            if fail_after is not None and i == fail_after:
+                raise RuntimeError("upstream dropped")
+            if delay:
+                await asyncio.sleep(delay)
+            yield f"t{i} ".encode()
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def expected(count: int) -> bytes:
+    return b"".join(f"t{i} ".encode() for i in range(count))
+
+
+async def test_first_token_is_sent_alone_and_the_rest_coalesced():
+    chunks = await collect(StreamCoalescer(tokens(50, delay=0.001), window=0.05, max_bytes=4096).stream())
+    assert chunks[0] == b"t0 "
+    assert b"".join(chunks) == expected(50)
+    assert len(chunks) < 10
+
+
+async def test_max_bytes_sends_before_the_window_is_over():
+    chunks = await collect(StreamCoalescer(tokens(200), window=10.0, max_bytes=64).stream())
+    assert b"".join(chunks) == expected(200)
+    assert all(len(chunk) < 64 + 8 for chunk in chunks)
+    assert len(chunks) > 5
+
+
+async def test_sse_framing():
+    chunks = await collect(coalesce(tokens(3), sse=True, window_ms=1))
+    assert chunks[-1] == b"event: done\ndata: \n\n"
+    data = b"".join(chunk[len(b"data: "):-2] for chunk in chunks[:-1])
+    assert data == expected(3)
+
+
+def test_sse_message_splits_lines():
+    assert sse_message(b"a\r\nb\nc") == b"data: a\ndata: b\ndata: c\n\n"
+    assert sse_message(b"", "done") == b"event: done\ndata: \n\n"
+
+
+async def test_upstream_error_is_raised_after_what_came_before():
+    received = []
+    with pytest.raises(RuntimeError):
+        async for chunk in StreamCoalescer(tokens(10, fail_after=5), window=0.01, max_bytes=4096).stream():
+            received.append(chunk)
+    assert b"".join(received) == expected(5)
+
+
+async def test_closing_the_consumer_closes_the_source():
+    closed = []
+    stream = StreamCoalescer(tokens(1000, delay=0.001, closed=closed), window=0.01, max_bytes=4096).stream()
+    assert await stream.__anext__() == b"t0 "
+    await stream.aclose()
+    assert closed == [True]
+
+
+async def test_zero_window_passes_chunks_through():
+    source = tokens(3)
+    assert coalesce(source, window_ms=0) is source
@@ -0,0 +1,98 @@
+"""
+WriteBehindQueue against a fake session: a batch whose INSERT fails is
+retried row by row, so one bad row only fails its own writer.
+"""
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.models import Message
+from app.utils.write_behind import WriteBehindQueue
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeDatabase:
+    """Records the committed rows; an INSERT that contains a row with content "bad" fails as a whole"""
+
+    def __init__(self):
+        self.rows = []
+        self.statements = 0
+
+    def session(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.pending = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.pending.clear()
+
+    async def execute(self, statement, rows):
+        self.database.statements += 1
+        if any(row["content"] == "bad" for row in rows):
+            raise ValueError("value too long for type character varying")
+        start = len(self.database.rows) + len(self.pending)
+        self.pending.extend(rows)
+        returned = [SimpleNamespace(id=start + i + 1, created_at=datetime(2024, 1, 1)) for i in range(len(rows))]
+        return SimpleNamespace(all=lambda: returned)
+
+    async def commit(self):
+        self.database.rows.extend(self.pending)
+        self.pending.clear()
+
+
+def message(content: str):
+    return {"session_id": 1, "sender": "user", "content": content, "message_type": "text", "sources": None}
+
+
+@pytest.fixture
+async def queue_and_database():
+    database = FakeDatabase()
+    # A long flush interval so all rows below land in one batch
+    queue = WriteBehindQueue(max_batch=100, flush_interval=0.05, max_queue=100, session_factory=database.session)
+    yield queue, database
+    await queue.aclose()
+
+
+async def test_rows_are_flushed_in_one_statement(queue_and_database):
+    queue, database = queue_and_database
+    saved = await asyncio.gather(*(queue.enqueue(Message, message(f"row {i}"), durable=True) for i in range(5)))
+    assert [row["id"] for row in saved] == [1, 2, 3, 4, 5]
+    assert database.statements == 1
+    assert queue.stats()["flushes"] == 1
+
+
+async def test_failed_batch_is_retried_row_by_row(queue_and_database):
+    queue, database = queue_and_database
+    contents = ["first", "bad", "third", "fourth"]
+    results = await asyncio.gather(
+        *(queue.enqueue(Message, message(content), durable=True) for content in contents),
+        return_exceptions=True
+    )
+
+    assert isinstance(results[1], ValueError)
+    assert [result["id"] for i, result in enumerate(results) if i != 1] == [1, 2, 3]
+    assert [row["content"] for row in database.rows] == ["first", "third", "fourth"]
+    # One batch statement, then one per row
+    assert database.statements == 1 + len(contents)
+    stats = queue.stats()
+    assert (stats["flushed_rows"], stats["failed_rows"]) == (3, 1)
+
+
+async def test_fire_and_forget_rows_survive_a_bad_neighbour(queue_and_database):
+    queue, database = queue_and_database
+    queue.submit(Message, message("kept"))
+    queue.submit(Message, message("bad"))
+    queue.submit(Message, message("also kept"))
+    await queue.aclose()
+    assert [row["content"] for row in database.rows] == ["kept", "also kept"]
+    assert queue.failed_rows == 1